@@ -0,0 +1,228 @@
+import numpy as np
+import Recipes
+from Calculate import PlanBuilder, buildings_needed
+
+try:
+    from scipy.sparse import csc_matrix
+    from scipy.sparse.linalg import spsolve
+except ImportError:  # scipy не обязателен, без него решаем плотной матрицей
+    csc_matrix = None
+
+
+# Допуск для сравнения скоростей с нулем
+EPSILON = 1e-9
+
+
+class RecipeMatrix:
+    """
+    Разреженная матрица предмет × рецепт для части базы, нужной под цели.
+    Элемент (i, j) - чистый выход предмета i за один цикл рецепта j
+    (продукты со знаком плюс, ингредиенты со знаком минус).
+    Строки 0..R-1 соответствуют основным продуктам рецептов 0..R-1.
+    """
+
+    def __init__(self, recipes, targets):
+        self.recipe_names = reachable_recipes(recipes, targets)
+        self.items = list(self.recipe_names)
+        self.item_index = {name: i for i, name in enumerate(self.items)}
+
+        rows, cols, vals = [], [], []
+        for j, name in enumerate(self.recipe_names):
+            recipe_data = recipes[name]
+            for item, amount in Recipes.recipe_outputs(name, recipe_data).items():
+                rows.append(self._index(item))
+                cols.append(j)
+                vals.append(amount)
+            for item, amount in recipe_data['ingredients'].items():
+                rows.append(self._index(item))
+                cols.append(j)
+                vals.append(-amount)
+        for item in targets:
+            self._index(item)
+
+        self.rows = np.array(rows, dtype=np.int64)
+        self.cols = np.array(cols, dtype=np.int64)
+        self.vals = np.array(vals, dtype=np.float64)
+        self.shape = (len(self.items), len(self.recipe_names))
+
+    def _index(self, item):
+        index = self.item_index.get(item)
+        if index is None:
+            index = len(self.items)
+            self.item_index[item] = index
+            self.items.append(item)
+        return index
+
+    def dense(self):
+        """Матрица в плотном виде (одинаковые элементы складываются)"""
+        matrix = np.zeros(self.shape)
+        np.add.at(matrix, (self.rows, self.cols), self.vals)
+        return matrix
+
+    def multiply(self, rates):
+        """Чистый выход каждого предмета при скоростях рецептов rates"""
+        return np.bincount(self.rows, weights=self.vals * rates[self.cols],
+                           minlength=self.shape[0])
+
+
+def reachable_recipes(recipes, targets):
+    """Рецепты, нужные для целей (обход по ингредиентам без рекурсии)"""
+    seen = set()
+    order = []
+    stack = [item for item in targets if item in recipes]
+    while stack:
+        name = stack.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        order.append(name)
+        for ingredient in recipes[name]['ingredients']:
+            if ingredient in recipes and ingredient not in seen:
+                stack.append(ingredient)
+    return order
+
+
+def _solve_square(matrix, active, demand):
+    """Решает систему для активных рецептов (строки - их основные продукты)"""
+    if csc_matrix is not None:
+        selected = np.zeros(matrix.shape[0], dtype=bool)
+        selected[active] = True
+        position = np.full(matrix.shape[0], -1, dtype=np.int64)
+        position[active] = np.arange(len(active))
+        keep = selected[matrix.rows] & selected[matrix.cols]
+        square = csc_matrix((matrix.vals[keep],
+                             (position[matrix.rows[keep]], position[matrix.cols[keep]])),
+                            shape=(len(active), len(active)))
+        solution = np.atleast_1d(spsolve(square, demand[active]))
+        if not np.all(np.isfinite(solution)):
+            raise np.linalg.LinAlgError("singular matrix")
+        return solution
+    dense = matrix.dense()
+    return np.linalg.solve(dense[np.ix_(active, active)], demand[active])
+
+
+def solve(recipes, targets):
+    """
+    Находит скорости рецептов (циклов в минуту = дробное число зданий),
+    обеспечивающие выход targets. Поддерживает циклы и побочные продукты.
+    Возвращает словарь:
+      'rates'      - {рецепт: скорость}
+      'raw'        - {базовый ресурс: потребление в минуту}
+      'byproducts' - {предмет: выход побочным продуктом в минуту}
+      'surplus'    - {предмет: излишек сверх потребности в минуту}
+      'cycles'     - список циклов между рецептами
+    """
+    recipes = Recipes.as_dict(recipes)
+    matrix = RecipeMatrix(recipes, targets)
+    num_recipes = matrix.shape[1]
+
+    demand = np.zeros(matrix.shape[0])
+    for item, rate in targets.items():
+        demand[matrix.item_index[item]] += rate
+
+    # Рецепт с отрицательной скоростью не нужен: его продукт покрывается
+    # побочными продуктами других рецептов. Исключаем его и решаем заново;
+    # если без него продукта не хватает - возвращаем обратно.
+    is_active = np.ones(num_recipes, dtype=bool)
+    rates = np.zeros(num_recipes)
+    for _ in range(2 * num_recipes + 1):
+        active = np.flatnonzero(is_active)
+        rates = np.zeros(num_recipes)
+        if len(active):
+            try:
+                solution = _solve_square(matrix, active, demand)
+            except np.linalg.LinAlgError:
+                cycles = Recipes.find_cycles(recipes, matrix.recipe_names)
+                names = '; '.join(', '.join(cycle) for cycle in cycles) or 'нет'
+                raise ValueError(f"Система рецептов вырождена (циклы: {names})")
+            worst = np.argmin(solution)
+            if solution[worst] < -EPSILON:
+                is_active[active[worst]] = False
+                continue
+            rates[active] = np.maximum(solution, 0.0)
+        shortage = (matrix.multiply(rates) - demand)[:num_recipes]
+        shortage[is_active] = 0.0
+        missing = np.argmin(shortage) if num_recipes else 0
+        if num_recipes == 0 or shortage[missing] >= -EPSILON:
+            break
+        is_active[missing] = True
+    else:
+        raise ValueError("Не удалось сбалансировать побочные продукты")
+
+    net = matrix.multiply(rates) - demand
+
+    # Базовые ресурсы - предметы без собственного рецепта, которых не хватает
+    raw = {}
+    surplus = {}
+    for i in np.flatnonzero(net[num_recipes:] < -EPSILON) + num_recipes:
+        raw[matrix.items[i]] = float(-net[i])
+    for i in np.flatnonzero(net > EPSILON):
+        surplus[matrix.items[i]] = float(net[i])
+
+    byproducts = {}
+    for j in np.flatnonzero(rates > EPSILON):
+        name = matrix.recipe_names[j]
+        for item, amount in recipes[name].get('outputs', {}).items():
+            if item != name:
+                byproducts[item] = byproducts.get(item, 0.0) + amount * float(rates[j])
+
+    return {
+        'rates': {matrix.recipe_names[j]: float(rates[j])
+                  for j in np.flatnonzero(rates > EPSILON)},
+        'raw': raw,
+        'byproducts': byproducts,
+        'surplus': surplus,
+        'cycles': Recipes.find_cycles(recipes, matrix.recipe_names)
+    }
+
+
+def solve_plan(recipes, targets, builder=None):
+    """
+    Рассчитывает план в формате calculate() по скоростям матричного решателя.
+    Поток каждого ингредиента делится между производителями
+    пропорционально их выходу. Результат дополняется отчетом solve().
+    """
+    if builder is None:
+        builder = PlanBuilder()
+    recipes = Recipes.as_dict(recipes)
+    balance = solve(recipes, targets)
+    rates = balance['rates']
+
+    # Уровень - расстояние от цели по ингредиентам (обход в ширину)
+    level = {item: 0 for item in targets}
+    queue = list(targets)
+    for item in queue:
+        if item not in rates:
+            continue
+        for ingredient in recipes[item]['ingredients']:
+            if ingredient not in level:
+                level[ingredient] = level[item] + 1
+                queue.append(ingredient)
+
+    group_ids = {}
+    producers = {}
+    for name, rate in rates.items():
+        count = buildings_needed(rate)
+        outputs = Recipes.recipe_outputs(name, recipes[name])
+        group_ids[name] = builder.add_buildings(name, recipes[name]['building'],
+                                                level.get(name, 0),
+                                                outputs[name] * rate / count, count)
+        for item, amount in outputs.items():
+            producers.setdefault(item, []).append((group_ids[name], amount * rate))
+    for item, amount in balance['raw'].items():
+        ids = builder.add_buildings(item, 'Источник', level.get(item, 0), amount,
+                                    is_source=True)
+        producers.setdefault(item, []).append((ids, amount))
+
+    for name, rate in rates.items():
+        for ingredient, amount in recipes[name]['ingredients'].items():
+            needed = amount * rate
+            sources = producers.get(ingredient, [])
+            total = sum(produced for _, produced in sources)
+            for ids, produced in sources:
+                builder.add_link(ids, group_ids[name], ingredient, needed * produced / total)
+
+    result = builder.result(targets)
+    if isinstance(result, dict):
+        result['balance'] = balance
+    return result
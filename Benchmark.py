@@ -0,0 +1,276 @@
+# Замеры производительности: загрузка базы, расчет, раскладка и отрисовка.
+#
+#   python Benchmark.py                       # все размеры, запись в историю
+#   python Benchmark.py --sizes small medium  # только выбранные размеры
+#   python Benchmark.py --save-baseline       # сохранить результат как эталон
+#   python Benchmark.py --compare             # сравнить с эталоном (код 1 при регрессии)
+#   python Benchmark.py --sizes medium --cycles 4 --shared 0.6 --mode matrix
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import Calculate
+import Recipes
+
+
+HISTORY_PATH = 'bench_history.json'
+BASELINE_PATH = 'bench_baseline.json'
+
+# Размеры синтетических баз: глубина, ширина уровня, число ингредиентов,
+# при необходимости доля общих ингредиентов, число циклов и свой режим расчета
+SIZES = {
+    'small': {'depth': 4, 'width': 6, 'fan_out': 2},
+    'medium': {'depth': 6, 'width': 20, 'fan_out': 3},
+    'large': {'depth': 8, 'width': 60, 'fan_out': 3},
+    # Циклы режим 'dag' не принимает - только матричный решатель
+    'cyclic': {'depth': 6, 'width': 20, 'fan_out': 3, 'shared': 0.5, 'cycles': 4,
+               'mode': 'matrix'},
+}
+
+PHASES = ('load', 'solve', 'layout', 'render')
+
+BUILDINGS = ('Smelter', 'Constructor', 'Assembler')
+
+# Во сколько раз замедление считается регрессией
+REGRESSION_THRESHOLD = 1.25
+# Разница меньше этой (секунды) - шум, не регрессия
+MIN_DELTA = 0.001
+
+
+def generate_recipes(depth, width, fan_out, shared=0.3, cycles=0, seed=0):
+    """
+    Строит синтетическую базу рецептов.
+    depth   - число уровней рецептов (ниже последнего - базовые ресурсы)
+    width   - число предметов на уровне
+    fan_out - число ингредиентов у рецепта
+    shared  - доля ингредиентов из общего набора (общие подпродукты)
+    cycles  - число циклов: ингредиент предмета, нужного цели, получает
+              этот предмет в ингредиенты (цикл из двух рецептов)
+    Цель всегда называется 'p0_0'.
+    """
+    rng = random.Random(seed)
+    shared_count = max(1, width // 4)
+
+    def name(level, index):
+        return f'ore_{index}' if level == depth else f'p{level}_{index}'
+
+    recipes = {}
+    for level in range(depth):
+        for index in range(width):
+            ingredients = {}
+            for _ in range(fan_out):
+                if rng.random() < shared:
+                    child = rng.randrange(shared_count)
+                else:
+                    child = rng.randrange(width)
+                ingredients[name(level + 1, child)] = rng.randint(1, 5)
+            recipes[name(level, index)] = {
+                'ingredients': ingredients,
+                'output': rng.randint(5, 10),
+                'building': rng.choice(BUILDINGS)
+            }
+    # Замыкаем цикл только через рецепты, нужные цели: иначе расчет его не увидит
+    parents = [item for item in reachable(recipes, 'p0_0')
+               if any(child in recipes for child in recipes[item]['ingredients'])]
+    for _ in range(cycles if parents else 0):
+        parent = rng.choice(parents)
+        child = rng.choice([item for item in recipes[parent]['ingredients'] if item in recipes])
+        recipes[child]['ingredients'][parent] = 1
+    return recipes
+
+
+def reachable(recipes, target):
+    """Рецепты, нужные target (включая его), в порядке обхода"""
+    found = [target]
+    seen = {target}
+    for item in found:
+        for child in recipes[item]['ingredients']:
+            if child in recipes and child not in seen:
+                seen.add(child)
+                found.append(child)
+    return found
+
+
+def measure(func, repeat=3):
+    """
+    Время (лучшее из repeat) и пиковая память (отдельный прогон с tracemalloc).
+    Возвращает (результат, секунды, пиковые байты).
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def run_size(label, params, mode='dag', target_rate=60, render=True, repeat=3):
+    """Замеры всех этапов для одного размера базы (params['mode'] важнее mode)"""
+    params = dict(params)
+    mode = params.pop('mode', mode)
+    recipes = generate_recipes(**params)
+    if params.get('cycles') and not Recipes.find_cycles(recipes, reachable(recipes, 'p0_0')):
+        raise ValueError(f"{label}: в базе нет цикла, достижимого из цели")
+    rows = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'recipes.json')
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(recipes, file, ensure_ascii=False)
+
+        def load():
+            book = Recipes.RecipeBook(path)
+            return book.recipes
+
+        # Первая загрузка компилирует базу, дальше - чтение скомпилированной
+        Recipes.RecipeBook(path).reload()
+        book = Recipes.RecipeBook(path)
+        _, seconds, peak = measure(load, repeat)
+        rows.append(_row(label, 'load', seconds, peak, recipes=len(recipes)))
+        book.recipes  # Загрузка не входит в замер расчета
+
+        def solve():
+            return Calculate.calculate('p0_0', target_rate, book, mode=mode)
+
+        try:
+            result, seconds, peak = measure(solve, repeat)
+        except ValueError as e:
+            rows.append(_row(label, 'solve', None, None, error=str(e)))
+            return rows
+        rows.append(_row(label, 'solve', seconds, peak, mode=mode,
+                         buildings=len(result['buildings']),
+                         connections=len(result['connections'])))
+
+    import matplotlib
+    matplotlib.use('Agg')
+    import Draw
+    import Layout
+
+    def layout():
+        # Раскладка кешируется по структуре плана: каждый прогон - с нуля
+        Layout.clear_cache()
+        return Draw.layout_positions(result)
+
+    positions, seconds, peak = measure(layout, repeat)
+    rows.append(_row(label, 'layout', seconds, peak))
+
+    if render:
+        import matplotlib.pyplot as plt
+
+        def draw():
+            fig = Draw.draw(result, show=False, positions=positions)
+            fig.canvas.draw()
+            plt.close(fig)
+
+        _, seconds, peak = measure(draw, 1)
+        rows.append(_row(label, 'render', seconds, peak))
+    return rows
+
+
+def _row(size, phase, seconds, peak, **extra):
+    row = {'size': size, 'phase': phase, 'seconds': seconds,
+           'peak_kb': None if peak is None else round(peak / 1024, 1)}
+    row.update(extra)
+    return row
+
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def save_json(path, data):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2)
+
+
+def compare(rows, baseline, threshold=REGRESSION_THRESHOLD):
+    """Сравнивает замеры с эталоном, возвращает список регрессий (строки отчета)"""
+    reference = {(row['size'], row['phase']): row for row in baseline.get('results', [])}
+    regressions = []
+    for row in rows:
+        base = reference.get((row['size'], row['phase']))
+        if not base or not base.get('seconds') or row['seconds'] is None:
+            continue
+        ratio = row['seconds'] / base['seconds']
+        if ratio > threshold and row['seconds'] - base['seconds'] > MIN_DELTA:
+            regressions.append(f"{row['size']}/{row['phase']}: {base['seconds']:.4f}с -> "
+                               f"{row['seconds']:.4f}с (x{ratio:.2f})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Замеры производительности Sat2v')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES))
+    parser.add_argument('--mode', choices=Calculate.MODES, default=None,
+                        help="режим расчета для всех размеров (по умолчанию 'dag' или режим размера)")
+    parser.add_argument('--cycles', type=int, default=None, help='число циклов в базе')
+    parser.add_argument('--shared', type=float, default=None, help='доля общих ингредиентов')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-render', action='store_true', help='без отрисовки')
+    parser.add_argument('--history', default=HISTORY_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for label in args.sizes:
+        params = dict(SIZES[label])
+        if args.mode:
+            params['mode'] = args.mode
+        if args.cycles is not None:
+            params['cycles'] = args.cycles
+        if args.shared is not None:
+            params['shared'] = args.shared
+        size_rows = run_size(label, params, render=not args.no_render, repeat=args.repeat)
+        for row in size_rows:
+            if row['seconds'] is None:
+                print(f"{row['size']:>8} {row['phase']:>7}  ошибка: {row['error']}")
+            else:
+                print(f"{row['size']:>8} {row['phase']:>7} {row['seconds'] * 1000:10.2f} мс "
+                      f"{row['peak_kb']:10.1f} КБ")
+        rows.extend(size_rows)
+
+    run = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'mode': args.mode or 'dag',
+        'results': rows
+    }
+    history = load_json(args.history, [])
+    history.append(run)
+    save_json(args.history, history)
+
+    if args.save_baseline:
+        save_json(args.baseline, run)
+        print(f"Эталон сохранен: {args.baseline}")
+
+    if args.compare:
+        regressions = compare(rows, load_json(args.baseline, {}), args.threshold)
+        if regressions:
+            print("Регрессии:")
+            for line in regressions:
+                print("  " + line)
+            return 1
+        print("Регрессий нет")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import sys
+from collections import OrderedDict
+from types import MappingProxyType
+
+import Calculate
+import Plan
+import Profile
+import Recipes
+
+
+class PlanCache:
+    """
+    Ограниченный LRU-кеш результатов расчета.
+    Ключ: цели, выход, режим и хеш содержимого базы рецептов, поэтому при
+    изменении recipes.json старые записи перестают совпадать и удаляются.
+    Результаты хранятся неизменяемыми (MappingProxyType и кортежи),
+    так что вызывающий код не может испортить запись в кеше.
+    store - PlanStore.PlanStore (необязательно): при промахе план сначала
+    ищется на диске, а посчитанный сохраняется туда; id плана на диске
+    возвращает plan_id. Цели в ключах упорядочены (normal_targets).
+    """
+
+    def __init__(self, max_entries=32, max_bytes=64 * 1024 * 1024, store=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store = store
+        self._entries = OrderedDict()  # ключ -> (результат, размер, id в store)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- Расчеты через кеш ---
+
+    def calculate(self, recipe, output_per_minute, recipes=None, mode='tree', columnar=False):
+        """Calculate.calculate с кешем"""
+        book = _source(recipes)
+        key = ('calculate', ((recipe, output_per_minute),), mode, columnar)
+        return self.get_or_compute(key, book, lambda: Calculate.calculate(
+            recipe, output_per_minute, book, mode, columnar),
+            None if columnar else ({recipe: output_per_minute}, mode, None))
+
+    def calculate_many(self, targets, recipes=None, mode='dag', columnar=False):
+        """Calculate.calculate_many с кешем"""
+        book = _source(recipes)
+        targets = normal_targets(targets)
+        key = ('calculate_many', tuple(targets.items()), mode, columnar)
+        return self.get_or_compute(key, book, lambda: Calculate.calculate_many(
+            targets, book, mode, columnar), None if columnar else (targets, mode, None))
+
+    def optimize(self, targets, recipes=None, objective='raw', raw_weight=1.0, building_weight=1.0):
+        """Optimize.optimize с кешем"""
+        import Optimize
+        book = _source(recipes)
+        targets = normal_targets(targets)
+        key = ('optimize', tuple(targets.items()), objective, raw_weight, building_weight)
+        # Веса в ключе хранилища не участвуют: на диск идут планы с весами по умолчанию
+        stored = (targets, 'dag', objective) if (raw_weight, building_weight) == (1.0, 1.0) else None
+        return self.get_or_compute(key, book, lambda: Optimize.optimize(
+            targets, book, objective, raw_weight, building_weight), stored)
+
+    def get_or_compute(self, key, recipes, compute, stored=None):
+        """
+        Возвращает результат из кеша или вычисляет compute() и сохраняет.
+        recipes - RecipeBook или словарь рецептов (для хеша содержимого).
+        stored - (цели, режим, оптимизация) для поиска в store; None - без него.
+        """
+        content_hash = recipes_hash(recipes)
+        full_key = (content_hash,) + key
+        entry = self._entries.get(full_key)
+        if entry is not None:
+            self._entries.move_to_end(full_key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        if self.store is not None and stored is not None:
+            result, plan_id = self._from_store(content_hash, stored, compute)
+        else:
+            result, plan_id = compute(), None
+        if result is None:
+            return None
+        result = freeze(result)
+        self._invalidate_other(content_hash)
+        self._store(full_key, result, approx_size(result), plan_id)
+        return result
+
+    def plan_id(self, result):
+        """id в store плана, который вернул кеш, или None"""
+        for cached, _, plan_id in self._entries.values():
+            if cached is result:
+                return plan_id
+        return None
+
+    def _from_store(self, content_hash, stored, compute):
+        """(план, id) с диска; если плана там нет - compute() и сохранение"""
+        targets, mode, objective = stored
+        plan_id = self.store.find(targets, content_hash, mode, objective)
+        if plan_id is not None:
+            with Profile.span('чтение плана'):
+                result = self.store.load(plan_id)
+            if result is not None:
+                return result, plan_id
+        result = compute()
+        if result is None:
+            return None, None
+        with Profile.span('сохранение плана'):
+            plan_id = self.store.save(result, content_hash, mode, objective)
+        return result, plan_id
+
+    # --- Управление ---
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self):
+        """Статистика: попадания, промахи, вытеснения, записи, байты"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+            'bytes': self._bytes
+        }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, key, result, size, plan_id=None):
+        if size > self.max_bytes:
+            return  # Слишком большой результат не кешируем
+        self._entries[key] = (result, size, plan_id)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def _invalidate_other(self, content_hash):
+        """Удаляет записи, посчитанные по другой версии базы рецептов"""
+        stale = [key for key in self._entries if key[0] != content_hash]
+        for key in stale:
+            _, size, _ = self._entries.pop(key)
+            self._bytes -= size
+
+
+def normal_targets(targets):
+    """Цели по порядку названий: один ключ для любого порядка (и в PlanStore)"""
+    return dict(sorted(targets.items()))
+
+
+def _source(recipes):
+    """Словарь рецептов как есть, остальное (None, путь, RecipeBook) - RecipeBook"""
+    return recipes if isinstance(recipes, dict) else Recipes.resolve(recipes)
+
+
+def recipes_hash(recipes):
+    """Хеш содержимого базы рецептов"""
+    if isinstance(recipes, dict):
+        data = json.dumps(recipes, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        return hashlib.sha256(data).digest()
+    return Recipes.resolve(recipes).graph.source_hash
+
+
+def freeze(value):
+    """Неизменяемая копия результата: словари - MappingProxyType, списки - кортежи"""
+    if isinstance(value, Plan.ColumnarPlan):
+        return value.frozen()
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Изменяемая копия замороженного результата"""
+    if isinstance(value, Plan.ColumnarPlan):
+        return value.to_dict()
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def approx_size(value):
+    """Примерный объем памяти результата в байтах"""
+    if isinstance(value, Plan.ColumnarPlan):
+        return value.nbytes() + sys.getsizeof(value.strings) + \
+            sum(sys.getsizeof(text) for text in value.strings)
+    if isinstance(value, MappingProxyType):
+        value = dict(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approx_size(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(approx_size(item) for item in value)
+    # Строки и числа обычно общие (интернированные имена), считаем только ссылку
+    return 8
@@ -1,97 +1,427 @@
-import json
-import math
-
-def calculate(recipe, output_per_minute):
-    """
-    Рассчитывает производственную цепочку.
-    Возвращает список всех зданий с их связями.
-    """
-    with open('recipes.json', 'r', encoding='utf-8') as file:
-        recipes = json.load(file)
-    
-    if recipe not in recipes:
-        return None
-    
-    # Список всех зданий (каждое здание - отдельный элемент)
-    buildings = []
-    # Связи между зданиями (от какого к какому, сколько ресурсов)
-    connections = []
-    
-    # Счетчик для уникальных ID
-    building_id = [0]
-    
-    def process_recipe(recipe_name, required_output, level):
-        """Рекурсивно обрабатывает рецепт и создает здания"""
-        if recipe_name not in recipes:
-            # Базовый ресурс (руда) - создаем один "источник"
-            b_id = building_id[0]
-            building_id[0] += 1
-            buildings.append({
-                'id': b_id,
-                'name': recipe_name,
-                'building': 'Источник',
-                'level': level,
-                'output': required_output,
-                'is_source': True
-            })
-            return [b_id]  # Возвращаем список ID зданий
-        
-        recipe_data = recipes[recipe_name]
-        recipe_output = recipe_data['output']
-        building_type = recipe_data['building']
-        
-        # Сколько циклов нужно в минуту
-        cycles_needed = required_output / recipe_output
-        # Сколько зданий нужно (округляем вверх)
-        num_buildings = math.ceil(cycles_needed)
-        
-        # Создаем здания для этого рецепта
-        current_building_ids = []
-        for i in range(num_buildings):
-            b_id = building_id[0]
-            building_id[0] += 1
-            buildings.append({
-                'id': b_id,
-                'name': recipe_name,
-                'building': building_type,
-                'level': level,
-                'output': required_output / num_buildings,
-                'building_num': i + 1,
-                'total_buildings': num_buildings,
-                'is_source': False
-            })
-            current_building_ids.append(b_id)
-        
-        # Обрабатываем ингредиенты
-        for ingredient_name, amount_per_cycle in recipe_data['ingredients'].items():
-            # Сколько ингредиента нужно в минуту
-            ingredient_needed = cycles_needed * amount_per_cycle
-            
-            # Рекурсивно создаем здания для ингредиента
-            child_ids = process_recipe(ingredient_name, ingredient_needed, level + 1)
-            
-            # Создаем связи от зданий ингредиента к текущим зданиям
-            # Распределяем связи равномерно
-            for i, parent_id in enumerate(current_building_ids):
-                # Выбираем соответствующее здание-источник
-                child_idx = int((i / len(current_building_ids)) * len(child_ids))
-                child_id = child_ids[child_idx]
-                
-                connections.append({
-                    'from': child_id,
-                    'to': parent_id,
-                    'resource': ingredient_name,
-                    'amount': ingredient_needed / len(current_building_ids)
-                })
-        
-        return current_building_ids
-    
-    # Запускаем обработку с корневого рецепта
-    process_recipe(recipe, output_per_minute, 0)
-    
-    return {
-        'target_recipe': recipe,
-        'target_output': output_per_minute,
-        'buildings': buildings,
-        'connections': connections
-    }
+import math
+import Recipes
+import Plan
+import Profile
+
+
+# Режимы расчета:
+#   'tree' - каждая ветка дерева рецептов считается отдельно (как в игре по шагам)
+#   'dag'  - потребность в каждом предмете суммируется, здания строятся один раз
+#   'matrix' - линейная система по всем рецептам (циклы, побочные продукты), см. Balance
+MODES = ('tree', 'dag', 'matrix')
+
+# Допуск при округлении числа зданий вверх (погрешность сложения float)
+EPSILON = 1e-9
+
+
+def calculate(recipe, output_per_minute, recipes=None, mode='tree', columnar=False):
+    """
+    Рассчитывает производственную цепочку.
+    Возвращает список всех зданий с их связями.
+    recipes - RecipeBook или путь к файлу рецептов (по умолчанию recipes.json).
+    mode - режим расчета ('tree', 'dag' или 'matrix', см. MODES).
+    columnar - вернуть Plan.ColumnarPlan вместо словаря со списками.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Неизвестный режим расчета: {mode}")
+    
+    recipes = Recipes.as_dict(recipes)
+    
+    if recipe not in recipes:
+        return None
+    
+    with Profile.span('расчет'):
+        if mode == 'tree':
+            result = solve_tree(recipes, recipe, output_per_minute)
+            if columnar:
+                result = Plan.ColumnarPlan.from_result(result)
+        else:
+            result = _solve_shared(recipes, {recipe: output_per_minute}, mode, columnar)
+    _count_plan(result)
+    return result
+
+
+def solve_tree(recipes, recipe, output_per_minute):
+    """Рассчитывает цепочку по веткам дерева рецептов (режим 'tree')"""
+    # Список всех зданий (каждое здание - отдельный элемент)
+    buildings = []
+    # Связи между зданиями (от какого к какому, сколько ресурсов)
+    connections = []
+    
+    for kind, record in iter_tree(recipes, recipe, output_per_minute):
+        if kind == 'building':
+            buildings.append(record)
+        else:
+            connections.append(record)
+    
+    return {
+        'target_recipe': recipe,
+        'target_output': output_per_minute,
+        'buildings': buildings,
+        'connections': connections
+    }
+
+
+def iter_tree(recipes, recipe, output_per_minute):
+    """
+    Поток записей режима 'tree': пары ('building', здание) и ('connection', связь)
+    в порядке их создания. Связь выдается после зданий, на которые ссылается.
+    """
+    # Счетчик для уникальных ID
+    building_id = [0]
+    # Рецепты на текущем пути (для обнаружения циклов)
+    path = []
+    
+    def process_recipe(recipe_name, required_output, level):
+        """Рекурсивно обрабатывает рецепт и выдает здания и связи"""
+        if recipe_name in path:
+            cycle = path[path.index(recipe_name):] + [recipe_name]
+            raise ValueError(f"Цикл в рецептах: {' -> '.join(cycle)}")
+        if recipe_name not in recipes:
+            # Базовый ресурс (руда) - создаем один "источник"
+            b_id = building_id[0]
+            building_id[0] += 1
+            yield 'building', building_record(b_id, recipe_name, 'Источник', level,
+                                              required_output, is_source=True)
+            return [b_id]  # Возвращаем список ID зданий
+        
+        recipe_data = recipes[recipe_name]
+        recipe_output = recipe_data['output']
+        building_type = recipe_data['building']
+        
+        # Сколько циклов нужно в минуту
+        cycles_needed = required_output / recipe_output
+        # Сколько зданий нужно (округляем вверх)
+        num_buildings = math.ceil(cycles_needed)
+        
+        # Создаем здания для этого рецепта
+        current_building_ids = []
+        for i in range(num_buildings):
+            b_id = building_id[0]
+            building_id[0] += 1
+            yield 'building', building_record(b_id, recipe_name, building_type, level,
+                                              required_output / num_buildings, i, num_buildings)
+            current_building_ids.append(b_id)
+        
+        # Обрабатываем ингредиенты
+        path.append(recipe_name)
+        for ingredient_name, amount_per_cycle in recipe_data['ingredients'].items():
+            # Сколько ингредиента нужно в минуту
+            ingredient_needed = cycles_needed * amount_per_cycle
+            
+            # Рекурсивно создаем здания для ингредиента
+            child_ids = yield from process_recipe(ingredient_name, ingredient_needed, level + 1)
+            
+            # Создаем связи от зданий ингредиента к текущим зданиям
+            # Распределяем связи равномерно
+            for i, parent_id in enumerate(current_building_ids):
+                # Выбираем соответствующее здание-источник
+                child_idx = int((i / len(current_building_ids)) * len(child_ids))
+                child_id = child_ids[child_idx]
+                
+                yield 'connection', {
+                    'from': child_id,
+                    'to': parent_id,
+                    'resource': ingredient_name,
+                    'amount': ingredient_needed / len(current_building_ids)
+                }
+        path.pop()
+        
+        return current_building_ids
+    
+    # Запускаем обработку с корневого рецепта
+    yield from process_recipe(recipe, output_per_minute, 0)
+
+
+def iter_plan(recipe, output_per_minute, recipes=None, mode='tree'):
+    """
+    Выдает план по частям, не собирая его целиком в памяти:
+    пары ('building', здание) и ('connection', связь) в стабильном порядке.
+    Каждая связь выдается после обоих своих зданий.
+    mode - 'tree' или 'dag'. Для неизвестного рецепта ничего не выдает.
+    """
+    if mode not in ('tree', 'dag'):
+        raise ValueError(f"Потоковый режим не поддерживает расчет: {mode}")
+    recipes = Recipes.as_dict(recipes)
+    if recipe not in recipes:
+        return
+    if mode == 'tree':
+        yield from iter_tree(recipes, recipe, output_per_minute)
+    else:
+        yield from iter_dag(recipes, {recipe: output_per_minute})
+
+
+def iter_plan_many(targets, recipes=None):
+    """Поток общего плана для нескольких целей (режим 'dag'), см. iter_plan"""
+    recipes = Recipes.as_dict(recipes)
+    if any(target not in recipes for target in targets):
+        return
+    yield from iter_dag(recipes, targets)
+
+
+def iter_dag(recipes, targets):
+    """
+    Поток записей режима 'dag'. Потребность и число зданий считаются заранее
+    (это O(число рецептов)), а здания и связи создаются по мере выдачи.
+    Связи предмета выдаются сразу после его зданий: потребители к этому
+    моменту уже выданы, так как идут раньше в топологическом порядке.
+    """
+    order, demand, level, edges = aggregate_demand(recipes, targets)
+    
+    # id зданий назначаются заранее: у каждого предмета свой непрерывный диапазон
+    item_ids = {}
+    next_id = 0
+    for item in order:
+        if item in recipes:
+            count = buildings_needed(demand[item] / recipes[item]['output'])
+        else:
+            count = 1
+        item_ids[item] = range(next_id, next_id + count)
+        next_id += count
+    
+    consumers = {}
+    for consumer, ingredient, amount in edges:
+        consumers.setdefault(ingredient, []).append((consumer, amount))
+    
+    for item in order:
+        ids = item_ids[item]
+        if item in recipes:
+            building_type = recipes[item]['building']
+            for i, b_id in enumerate(ids):
+                yield 'building', building_record(b_id, item, building_type, level[item],
+                                                  demand[item] / len(ids), i, len(ids))
+        else:
+            yield 'building', building_record(ids[0], item, 'Источник', level[item],
+                                              demand[item], is_source=True)
+        for consumer, amount in consumers.get(item, ()):
+            for link in iter_links(ids, item_ids[consumer], item, amount):
+                yield 'connection', link
+
+
+def calculate_many(targets, recipes=None, mode='dag', columnar=False):
+    """
+    Рассчитывает одну общую цепочку сразу для нескольких продуктов.
+    targets - словарь {предмет: выход в минуту}.
+    Промежуточные предметы производятся общими зданиями для всех целей.
+    mode - 'dag' или 'matrix' (режим 'tree' не умеет объединять цели).
+    Возвращает None, если какой-то из рецептов не найден.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Неизвестный режим расчета: {mode}")
+    if mode == 'tree':
+        raise ValueError("Режим 'tree' не поддерживает несколько целей")
+    if not targets:
+        raise ValueError("Не заданы цели расчета")
+    
+    recipes = Recipes.as_dict(recipes)
+    
+    if any(target not in recipes for target in targets):
+        return None
+    
+    with Profile.span('расчет'):
+        result = _solve_shared(recipes, targets, mode, columnar)
+    _count_plan(result)
+    return result
+
+
+def _solve_shared(recipes, targets, mode, columnar):
+    """Расчет с общими зданиями для всех целей (режимы 'dag' и 'matrix')"""
+    builder = Plan.ColumnarPlan() if columnar else PlanBuilder()
+    if mode == 'matrix':
+        import Balance  # numpy нужен только этому режиму
+        return Balance.solve_plan(recipes, targets, builder)
+    return solve_dag(recipes, targets, builder)
+
+
+def _count_plan(result):
+    """Счетчики профилировщика для готового плана"""
+    if Profile.enabled():
+        Profile.count('зданий', len(result['buildings']))
+        Profile.count('связей', len(result['connections']))
+
+
+def buildings_needed(cycles):
+    """Число зданий для заданного числа циклов в минуту (вверх, с допуском)"""
+    return max(1, math.ceil(cycles - EPSILON))
+
+
+def topological_order(recipes, targets):
+    """
+    Возвращает все предметы, достижимые из targets, в топологическом порядке:
+    каждый предмет идет раньше своих ингредиентов.
+    Работает без рекурсии; при цикле в рецептах выбрасывает ValueError.
+    """
+    # Собираем достижимые предметы и число их потребителей
+    consumers_count = {}
+    stack = []
+    for target in targets:
+        if target not in consumers_count:
+            consumers_count[target] = 0
+            stack.append(target)
+    
+    while stack:
+        item = stack.pop()
+        if item not in recipes:
+            continue
+        for ingredient in recipes[item]['ingredients']:
+            if ingredient not in consumers_count:
+                consumers_count[ingredient] = 0
+                stack.append(ingredient)
+            consumers_count[ingredient] += 1
+    
+    # Алгоритм Кана: предмет готов, когда обработаны все его потребители
+    order = []
+    ready = [item for item, count in consumers_count.items() if count == 0]
+    while ready:
+        item = ready.pop()
+        order.append(item)
+        if item not in recipes:
+            continue
+        for ingredient in recipes[item]['ingredients']:
+            consumers_count[ingredient] -= 1
+            if consumers_count[ingredient] == 0:
+                ready.append(ingredient)
+    
+    if len(order) != len(consumers_count):
+        waiting = [item for item, count in consumers_count.items() if count > 0]
+        raise ValueError(cycle_message(recipes, waiting))
+    
+    return order
+
+
+def cycle_message(recipes, items):
+    """
+    Текст ошибки о цикле. items - предметы, не попавшие в топологический
+    порядок; кроме самих циклов среди них и все их ингредиенты,
+    поэтому называются только сильно связные компоненты (Recipes.find_cycles).
+    """
+    cycles = Recipes.find_cycles(recipes, [item for item in items if item in recipes])
+    return f"Цикл в рецептах: {'; '.join(', '.join(cycle) for cycle in sorted(cycles))}"
+
+
+def aggregate_demand(recipes, targets):
+    """
+    Суммирует потребность в каждом предмете за один проход по графу.
+    targets - словарь {предмет: выход в минуту}.
+    Возвращает (порядок, потребность, уровень, ребра), где ребра -
+    список (потребитель, ингредиент, количество в минуту).
+    Уровень предмета - длина самого длинного пути от цели.
+    """
+    order = topological_order(recipes, targets)
+    demand = dict.fromkeys(order, 0.0)
+    level = dict.fromkeys(order, 0)
+    for target, rate in targets.items():
+        demand[target] += rate
+    
+    edges = []
+    for item in order:
+        if item not in recipes:
+            continue
+        recipe_data = recipes[item]
+        cycles_needed = demand[item] / recipe_data['output']
+        for ingredient_name, amount_per_cycle in recipe_data['ingredients'].items():
+            ingredient_needed = cycles_needed * amount_per_cycle
+            demand[ingredient_name] += ingredient_needed
+            level[ingredient_name] = max(level[ingredient_name], level[item] + 1)
+            edges.append((item, ingredient_name, ingredient_needed))
+    
+    return order, demand, level, edges
+
+
+def solve_dag(recipes, targets, builder=None):
+    """
+    Рассчитывает цепочку с суммированием потребности по предметам.
+    Здания для каждого предмета создаются один раз, по общему выходу,
+    поэтому время работы линейно по числу рецептов и зданий.
+    builder - PlanBuilder (по умолчанию) или Plan.ColumnarPlan.
+    """
+    if builder is None:
+        builder = PlanBuilder()
+    
+    order, demand, level, edges = aggregate_demand(recipes, targets)
+    
+    item_ids = {}
+    for item in order:
+        if item not in recipes:
+            # Базовый ресурс (руда) - один "источник" на весь объем
+            item_ids[item] = builder.add_buildings(item, 'Источник', level[item],
+                                                   demand[item], is_source=True)
+            continue
+        
+        recipe_data = recipes[item]
+        num_buildings = buildings_needed(demand[item] / recipe_data['output'])
+        item_ids[item] = builder.add_buildings(item, recipe_data['building'], level[item],
+                                               demand[item] / num_buildings, num_buildings)
+    
+    for consumer, ingredient, amount in edges:
+        builder.add_link(item_ids[ingredient], item_ids[consumer], ingredient, amount)
+    
+    return builder.result(targets)
+
+
+class PlanBuilder:
+    """Собирает план в формате calculate(): списки словарей зданий и связей"""
+    
+    def __init__(self):
+        self.buildings = []
+        self.connections = []
+    
+    def add_buildings(self, name, building, level, output, count=1, is_source=False):
+        """Добавляет count одинаковых зданий, возвращает range их id"""
+        first_id = len(self.buildings)
+        for i in range(count):
+            self.buildings.append(building_record(first_id + i, name, building, level,
+                                                  output, i, count, is_source))
+        return range(first_id, first_id + count)
+    
+    def add_link(self, from_ids, to_ids, resource, amount):
+        """Распределяет поток между группами зданий"""
+        self.connections.extend(link_buildings(from_ids, to_ids, resource, amount))
+    
+    def result(self, targets):
+        """Возвращает план; targets - словарь {предмет: выход в минуту}"""
+        return {
+            'target_recipe': ', '.join(targets),
+            'target_output': sum(targets.values()),
+            'targets': dict(targets),
+            'buildings': self.buildings,
+            'connections': self.connections
+        }
+
+
+def building_record(b_id, name, building, level, output, index=0, count=1, is_source=False):
+    """Словарь здания в формате calculate(); index - номер здания в группе с нуля"""
+    record = {
+        'id': b_id,
+        'name': name,
+        'building': building,
+        'level': level,
+        'output': output,
+    }
+    if is_source:
+        record['is_source'] = True
+    else:
+        record['building_num'] = index + 1
+        record['total_buildings'] = count
+        record['is_source'] = False
+    return record
+
+
+def link_buildings(from_ids, to_ids, resource, amount):
+    """
+    Равномерно распределяет поток между группами зданий.
+    Каждое здание получает хотя бы одну связь, всего связей max(n, m).
+    """
+    return list(iter_links(from_ids, to_ids, resource, amount))
+
+
+def iter_links(from_ids, to_ids, resource, amount):
+    """Связи link_buildings по одной"""
+    count = max(len(from_ids), len(to_ids))
+    for k in range(count):
+        yield {
+            'from': from_ids[k * len(from_ids) // count],
+            'to': to_ids[k * len(to_ids) // count],
+            'resource': resource,
+            'amount': amount / count
+        }
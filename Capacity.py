@@ -0,0 +1,119 @@
+import math
+import Plan
+import Recipes
+from Calculate import PlanBuilder, solve_dag, topological_order
+
+
+class CapacityPlanner:
+    """
+    Обратный расчет: наибольший выход цели при ограничениях на базовые ресурсы.
+    Строится один раз на версию базы (RecipeBook.capacity): обратный индекс
+    ингредиент -> потребители и вектор базовых ресурсов на единицу каждого
+    предмета (основные рецепты, как в режиме 'dag'). После этого запрос -
+    это проход по ресурсам целей, без обхода графа, поэтому его можно
+    повторять при каждом изменении лимитов.
+    """
+
+    def __init__(self, recipes):
+        self.recipes = recipes
+        self.consumers = {}   # ингредиент -> [(потребитель, штук на единицу потребителя)]
+        for item, recipe_data in recipes.items():
+            for ingredient, amount in recipe_data['ingredients'].items():
+                self.consumers.setdefault(ingredient, []).append(
+                    (item, amount / recipe_data['output']))
+
+        # Векторы от базовых ресурсов вверх по потребителям (алгоритм Кана):
+        # предмет готов, когда посчитаны все его ингредиенты
+        self.raw = {}         # предмет -> {базовый ресурс: штук на единицу предмета}
+        waiting = {item: len(recipe_data['ingredients'])
+                   for item, recipe_data in recipes.items()}
+        ready = [item for item in self.consumers if item not in recipes]
+        for item in ready:
+            self.raw[item] = {item: 1.0}
+        ready.extend(item for item, count in waiting.items() if count == 0)
+        while ready:
+            ingredient = ready.pop()
+            vector = self.raw.setdefault(ingredient, {})
+            for consumer, share in self.consumers.get(ingredient, ()):
+                total = self.raw.setdefault(consumer, {})
+                for resource, amount in vector.items():
+                    total[resource] = total.get(resource, 0.0) + share * amount
+                waiting[consumer] -= 1
+                if waiting[consumer] == 0:
+                    ready.append(consumer)
+        # Предметы в циклах (и все, что из них делается) так и не дождались
+        # ингредиентов; частично набранные векторы у них неверны
+        self.cyclic = {item for item, count in waiting.items() if count > 0}
+        for item in self.cyclic:
+            self.raw.pop(item, None)
+
+    def requirements(self, targets):
+        """
+        Базовые ресурсы в минуту для targets ({предмет: выход в минуту}).
+        Для предметов в цикле выбрасывает ValueError.
+        """
+        totals = {}
+        for target, rate in targets.items():
+            vector = self.raw.get(target)
+            if vector is None:
+                if target in self.cyclic:
+                    topological_order(self.recipes, [target])  # Ошибка с составом цикла
+                raise ValueError(f"Рецепт не найден: {target}")
+            for resource, amount in vector.items():
+                totals[resource] = totals.get(resource, 0.0) + rate * amount
+        return totals
+
+    def max_scale(self, targets, limits):
+        """
+        Во сколько раз можно увеличить targets, не превысив limits
+        ({базовый ресурс: штук в минуту}). Возвращает (множитель, узкое место).
+        Лимиты ресурсов, не нужных целям, не влияют; если не ограничен
+        ни один нужный ресурс - ValueError.
+        """
+        for resource, limit in limits.items():
+            if resource in self.recipes:
+                raise ValueError(f"Лимит задается только для базовых ресурсов: {resource}")
+            if limit < 0:
+                raise ValueError(f"Лимит не может быть отрицательным: {resource}")
+        needed = self.requirements(targets)
+        scale = math.inf
+        bottleneck = None
+        for resource, amount in needed.items():
+            if resource in limits and amount > 0 and limits[resource] / amount < scale:
+                scale = limits[resource] / amount
+                bottleneck = resource
+        if bottleneck is None:
+            raise ValueError("Выход не ограничен: лимиты не заданы для нужных ресурсов")
+        return scale, bottleneck
+
+    def max_rate(self, target, limits):
+        """Наибольший выход target в минуту: (выход, узкое место), см. max_scale"""
+        return self.max_scale({target: 1.0}, limits)
+
+    def solve(self, targets, limits, columnar=False):
+        """
+        План (режим 'dag') на наибольший выход при лимитах. targets задает
+        соотношение выходов ({предмет: доля}, для одной цели - {предмет: 1}).
+        Результат в формате calculate() с дополнительным ключом 'capacity':
+        множитель, узкое место, лимиты и расход каждого ограниченного ресурса.
+        """
+        scale, bottleneck = self.max_scale(targets, limits)
+        scaled = {target: share * scale for target, share in targets.items()}
+        builder = Plan.ColumnarPlan() if columnar else PlanBuilder()
+        result = solve_dag(self.recipes, scaled, builder)
+        if isinstance(result, dict):
+            needed = self.requirements(scaled)
+            result['capacity'] = {
+                'scale': scale,
+                'bottleneck': bottleneck,
+                'limits': dict(limits),
+                'usage': {resource: needed.get(resource, 0.0) for resource in limits}
+            }
+        return result
+
+
+def planner(recipes=None):
+    """CapacityPlanner базы: у RecipeBook - общий (RecipeBook.capacity)"""
+    if isinstance(recipes, dict):
+        return CapacityPlanner(recipes)
+    return Recipes.resolve(recipes).capacity
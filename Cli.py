@@ -0,0 +1,267 @@
+# Расчет без графического интерфейса. tkinter и matplotlib не импортируются,
+# пока не запрошена картинка.
+#
+#   python Cli.py plan ротор=60                         # план в JSON (stdout)
+#   python Cli.py plan ротор=60 винт=120 -f csv -o plan.csv
+#   python Cli.py plan ротор=60 --optimize raw          # с альтернативными рецептами
+#   python Cli.py raw ротор=60                          # базовые ресурсы в минуту
+#   python Cli.py max ротор -l "железная руда=480"      # наибольший выход при лимитах
+#   python Cli.py plans --building Smelter --more-than 50   # сохраненные планы (PlanStore)
+#   python Cli.py plans --purge                         # удалить планы других версий базы
+#   python Cli.py image ротор=60 -o plan.png            # чертеж в файл (SVG/PNG без pyplot)
+#   python Cli.py image ротор=60 -o plan_{row}_{col}.png --tile 8000   # плитками
+import argparse
+import json
+import sys
+from contextlib import contextmanager
+
+import Calculate
+import Capacity
+import Export
+import Optimize
+import Recipes
+
+
+FORMATS = ('json', 'jsonl', 'csv')
+
+# Выход в минуту, если у цели он не указан
+DEFAULT_RATE = 60
+
+
+def parse_targets(values, rate=DEFAULT_RATE, what='Выход'):
+    """Цели вида 'предмет=выход' (или просто 'предмет') -> {предмет: выход}"""
+    targets = {}
+    for value in values:
+        name, sep, amount = value.rpartition('=')
+        if not sep:
+            name, amount = value, rate
+        try:
+            amount = float(amount)
+        except ValueError:
+            raise ValueError(f"{what} должен быть числом: {value}")
+        if amount <= 0:
+            raise ValueError(f"{what} должен быть больше нуля: {value}")
+        targets[name.strip()] = targets.get(name.strip(), 0) + amount
+    return targets
+
+
+def parse_limits(values):
+    """Лимиты вида 'ресурс=штук в минуту' -> {ресурс: лимит}"""
+    for value in values:
+        if '=' not in value:
+            raise ValueError(f"Лимит задается как 'ресурс=штук в минуту': {value}")
+    return parse_targets(values, what='Лимит')
+
+
+def solve(targets, book, mode='dag', objective=None):
+    """План целей в формате calculate(); при неизвестном рецепте - ValueError"""
+    missing = [name for name in targets if name not in book]
+    if missing:
+        raise ValueError(f"Рецепт не найден: {', '.join(missing)}")
+    if objective:
+        return Optimize.optimize(targets, book, objective)
+    if len(targets) == 1 and mode != 'dag':
+        (recipe, rate), = targets.items()
+        return Calculate.calculate(recipe, rate, book, mode)
+    return Calculate.calculate_many(targets, book, mode)
+
+
+def plan_records(targets, book, mode='dag', objective=None):
+    """
+    Записи плана по одной. Режимы 'tree' и 'dag' без оптимизации идут потоком
+    (Calculate.iter_plan), остальные сначала считаются целиком.
+    """
+    if not objective and mode in ('tree', 'dag'):
+        if len(targets) == 1:
+            (recipe, rate), = targets.items()
+            return Calculate.iter_plan(recipe, rate, book, mode)
+        if mode == 'dag':
+            return Calculate.iter_plan_many(targets, book)
+    result = solve(targets, book, mode, objective)
+    return _result_records(result)
+
+
+def _result_records(result):
+    for building in result['buildings']:
+        yield 'building', building
+    for connection in result['connections']:
+        yield 'connection', connection
+
+
+def raw_totals(records):
+    """Базовые ресурсы (источники) в минуту по названиям"""
+    totals = {}
+    for kind, record in records:
+        if kind == 'building' and record['is_source']:
+            totals[record['name']] = totals.get(record['name'], 0) + record['output']
+    return totals
+
+
+def max_output(targets, limits, book, plan=False):
+    """
+    Наибольший выход целей (в соотношении targets) при лимитах базовых ресурсов.
+    plan - весь план (Capacity.CapacityPlanner.solve), иначе только выходы,
+    узкое место и расход ограниченных ресурсов.
+    """
+    missing = [name for name in targets if name not in book]
+    if missing:
+        raise ValueError(f"Рецепт не найден: {', '.join(missing)}")
+    planner = Capacity.planner(book)
+    if plan:
+        return planner.solve(targets, limits)
+    scale, bottleneck = planner.max_scale(targets, limits)
+    scaled = {target: share * scale for target, share in targets.items()}
+    needed = planner.requirements(scaled)
+    return {
+        'targets': scaled,
+        'bottleneck': bottleneck,
+        'usage': {resource: needed.get(resource, 0.0) for resource in limits}
+    }
+
+
+def stored_plans(path=None, building=None, more_than=0, purge=None):
+    """
+    Сводки сохраненных планов; с building - только где таких зданий больше more_than.
+    purge - база рецептов: сначала удаляются планы, посчитанные не по ней.
+    """
+    import sqlite3
+    import Cache
+    import PlanStore
+    try:
+        store = PlanStore.PlanStore(path or PlanStore.STORE_PATH)
+    except sqlite3.Error as e:
+        raise ValueError(f"хранилище планов недоступно: {e}")
+    try:
+        if purge is not None:
+            store.purge(Cache.recipes_hash(purge))
+        if building:
+            return store.plans_using(building, more_than)
+        return store.plans()
+    finally:
+        store.close()
+
+
+def render_image(result, path, tile_size=None):
+    """
+    Сохраняет чертеж плана в файл. SVG и PNG пишет Export (без pyplot,
+    tile_size - плитками, path - шаблон с {row} и {col}); остальные
+    форматы - через Draw (matplotlib без окна).
+    """
+    extension = path.rpartition('.')[2].lower()
+    if extension in ('svg', 'png'):
+        if tile_size:
+            write = Export.write_svg_tiles if extension == 'svg' else Export.write_png_tiles
+            return write(result, path, tile_size)
+        write = Export.write_svg if extension == 'svg' else Export.write_png
+        write(result, path)
+        return [path]
+    if tile_size:
+        raise ValueError("Плитки поддерживаются только для SVG и PNG")
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import Draw
+    fig = Draw.draw(result, save_path=path, show=False)
+    plt.close(fig)
+    return [path]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Расчет производственных цепочек Sat2v')
+    parser.add_argument('--recipes', default=Recipes.RECIPES_PATH, help='путь к recipes.json')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name, help_text):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('targets', nargs='+', help="цели: 'предмет=выход в минуту'")
+        command.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                             help='выход для целей без явного значения')
+        command.add_argument('--mode', choices=Calculate.MODES, default='dag')
+        command.add_argument('--optimize', choices=Optimize.OBJECTIVES, default=None,
+                             help='подобрать альтернативные рецепты')
+        command.add_argument('-o', '--output', default='-', help="файл ('-' - stdout)")
+        return command
+
+    plan = add_command('plan', 'план: здания и связи')
+    plan.add_argument('-f', '--format', choices=FORMATS, default='json')
+    add_command('raw', 'базовые ресурсы в минуту')
+    image = add_command('image', 'чертеж плана (PNG, SVG, PDF - по расширению файла)')
+    image.add_argument('--tile', type=float, default=None,
+                       help="размер плитки в единицах раскладки (-o с {row} и {col})")
+    capacity = commands.add_parser('max', help='наибольший выход при лимитах базовых ресурсов')
+    capacity.add_argument('targets', nargs='+',
+                          help="цели: 'предмет' или 'предмет=доля' (соотношение выходов)")
+    capacity.add_argument('-l', '--limit', action='append', required=True,
+                          help="лимит: 'ресурс=штук в минуту' (можно несколько)")
+    capacity.add_argument('--plan', action='store_true', help='вывести весь план')
+    capacity.add_argument('-o', '--output', default='-', help="файл ('-' - stdout)")
+    stored = commands.add_parser('plans', help='сохраненные планы калькулятора')
+    stored.add_argument('--store', default=None, help='файл хранилища (по умолчанию plans.sqlite3)')
+    stored.add_argument('--building', default=None, help="только планы с этим типом зданий")
+    stored.add_argument('--more-than', type=int, default=0,
+                        help='и числом таких зданий больше указанного')
+    stored.add_argument('--purge', action='store_true',
+                        help='удалить планы, посчитанные не по текущей базе (--recipes)')
+    stored.add_argument('-o', '--output', default='-', help="файл ('-' - stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'plans':
+            purge = Recipes.RecipeBook(args.recipes) if args.purge else None
+            summaries = stored_plans(args.store, args.building, args.more_than, purge)
+            with _open_output(args.output) as file:
+                json.dump(summaries, file, ensure_ascii=False, indent=2)
+                file.write('\n')
+            return 0
+        book = Recipes.RecipeBook(args.recipes)
+        if args.command == 'max':
+            targets = parse_targets(args.targets, 1, 'Доля')
+            limits = parse_limits(args.limit)
+            result = max_output(targets, limits, book, args.plan)
+            with _open_output(args.output) as file:
+                json.dump(dict(result), file, ensure_ascii=False, indent=2)
+                file.write('\n')
+            return 0
+        targets = parse_targets(args.targets, args.rate)
+
+        if args.command == 'plan' and args.format != 'json':
+            records = plan_records(targets, book, args.mode, args.optimize)
+            with _open_output(args.output) as file:
+                if args.format == 'jsonl':
+                    Export.write_jsonl(records, file, targets)
+                else:
+                    Export.write_csv(records, file)
+        elif args.command == 'plan':
+            result = solve(targets, book, args.mode, args.optimize)
+            with _open_output(args.output) as file:
+                json.dump(dict(result), file, ensure_ascii=False, indent=2)
+                file.write('\n')
+        elif args.command == 'raw':
+            totals = raw_totals(plan_records(targets, book, args.mode, args.optimize))
+            with _open_output(args.output) as file:
+                json.dump(totals, file, ensure_ascii=False, indent=2)
+                file.write('\n')
+        else:
+            if args.output == '-':
+                raise ValueError("Для картинки укажите файл: -o plan.png")
+            if args.tile and '{row}' not in args.output:
+                raise ValueError("Для плиток укажите шаблон файла: -o plan_{row}_{col}.png")
+            render_image(solve(targets, book, args.mode, args.optimize), args.output, args.tile)
+    except (ValueError, FileNotFoundError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+@contextmanager
+def _open_output(path):
+    """Файл для записи или stdout для '-'"""
+    if path == '-':
+        yield sys.stdout
+        return
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        yield file
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,66 +1,81 @@
+import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
 from matplotlib.patches import Rectangle, FancyArrowPatch
 from matplotlib.widgets import Button
 import matplotlib.patheffects as path_effects
 import math
+import numpy as np
+import Layout
+import Profile
+from Style import BUILDING_COLORS, COLORS, plan_title, truncate_text, wrap_text
 
 
-# Цвета для разных типов зданий
-BUILDING_COLORS = {
-    'Assembler': '#3498DB',      # Синий
-    'Constructor': '#27AE60',    # Зеленый
-    'Smelter': '#E67E22',        # Оранжевый
-    'Источник': '#95A5A6',       # Серый
-    'Miner': '#95A5A6',          # Серый
-    'default': '#9B59B6'         # Фиолетовый
-}
-
-# Темная тема (более контрастная)
-COLORS = {
-    'bg': '#0f0f1a',
-    'text': '#ffffff',           # Чистый белый для лучшей читаемости
-    'text_dark': '#1a1a2e',      # Темный текст для обводки
-    'grid': '#16213e',
-    'accent': '#ff6b6b'          # Более яркий акцент
-}
-
 # Эффект обводки для текста
 TEXT_OUTLINE = [path_effects.withStroke(linewidth=3, foreground='black')]
 
+# Подсказка под чертежом
+HINT = 'Колесико мыши - масштаб | Зажать колесико/ПКМ - перемещение | Двойной клик - сброс'
+GROUPED_HINT = 'Клик по блоку - развернуть/свернуть | '
+
+# Раскладки: 'layered' - Layout.layered_positions (по связям, с уменьшением
+# пересечений), 'levels' - calculate_positions (ряды по уровням в порядке списка)
+LAYOUTS = ('layered', 'levels')
+
+# С какого числа зданий отрисовка идет коллекциями (draw_*_batched)
+BATCH_THRESHOLD = 200
 
-def draw(production_data, save_path=None, show=True):
+# С какого числа зданий калькулятор показывает план сгруппированным (GroupedPlan)
+GROUP_THRESHOLD = 1000
+
+# Через сколько мс после последнего шага колесика картинка перерисуется начисто
+SETTLE_MS = 250
+
+# Уровень детализации: подписи видны, когда блок здания на экране
+# не уже стольких пикселей; при меньшем масштабе - только блоки и пучки связей
+LOD_LABEL_PIXELS = 15
+
+
+def draw(production_data, save_path=None, show=True, positions=None, batched=None,
+         layout='layered', grouped=False):
     """
     Визуализирует производственную цепочку.
     Каждое здание - отдельный блок.
     Поддерживает перемещение и масштабирование (колесико мыши, перетаскивание).
+    positions - готовая раскладка layout_positions (например, из фонового потока);
+    при grouped - раскладка сгруппированного плана (GroupedPlan(...).plan()).
+    layout - способ раскладки из LAYOUTS, если positions не заданы.
+    batched - рисовать коллекциями с общими подписями групп зданий
+    (None - автоматически, если зданий больше BATCH_THRESHOLD).
+    grouped - один блок на рецепт и уровень (×N, общий выход, суммарные связи);
+    клик по блоку разворачивает группу в отдельные здания и сворачивает обратно.
     """
     if not production_data:
         print("Нет данных для визуализации")
         return None
     
-    buildings = production_data['buildings']
-    connections = production_data['connections']
-    
-    if not buildings:
+    if not production_data['buildings']:
         print("Нет зданий для отображения")
         return None
     
+    view = GroupedPlan(production_data) if grouped else None
+    plan = view.plan() if grouped else production_data
+    
     # Вычисляем позиции зданий
-    positions = calculate_positions(buildings)
+    if positions is None:
+        with Profile.span('раскладка'):
+            positions = layout_positions(plan, layout)
     
     # Создаем фигуру
     fig, ax = plt.subplots(figsize=(16, 10), facecolor=COLORS['bg'])
     ax.set_facecolor(COLORS['bg'])
     
     # Заголовок (крупный и заметный)
-    title = f"Производство: {production_data['target_recipe']} ({production_data['target_output']}/мин)"
-    fig.suptitle(title, fontsize=18, color=COLORS['text'], fontweight='bold')
-    
-    # Рисуем связи (сначала, чтобы были под блоками)
-    draw_connections(ax, connections, buildings, positions)
+    fig.suptitle(plan_title(production_data), fontsize=18, color=COLORS['text'], fontweight='bold')
     
-    # Рисуем здания
-    draw_buildings(ax, buildings, positions)
+    # Индекс художников для отсечения по видимой области и уровня детализации
+    scene = Scene(positions)
+    draw_plan(ax, plan, positions, batched, scene)
     
     # Настраиваем оси
     setup_axes(ax, positions)
@@ -69,17 +84,24 @@ def draw(production_data, save_path=None, show=True):
     add_legend(ax)
     
     # Добавляем подсказку
-    fig.text(0.5, 0.02, 
-             'Колесико мыши - масштаб | Зажать колесико/ПКМ - перемещение | Двойной клик - сброс',
+    hint = HINT
+    if grouped:
+        hint = GROUPED_HINT + hint
+    fig.text(0.5, 0.02, hint,
              ha='center', fontsize=11, color=COLORS['text'], alpha=0.9, fontweight='bold')
     
     # Включаем интерактивность
-    enable_interactivity(fig, ax, positions)
+    home = enable_interactivity(fig, ax, positions, scene)
+    if grouped:
+        enable_expansion(fig, ax, view, positions, scene, home, batched, layout)
     
-    plt.tight_layout(rect=[0, 0.04, 1, 0.96])
+    with Profile.span('компоновка'):
+        plt.tight_layout(rect=[0, 0.04, 1, 0.96])
+    scene.update(ax)
     
     if save_path:
-        plt.savefig(save_path, facecolor=COLORS['bg'], dpi=150, bbox_inches='tight')
+        with Profile.span('сохранение'):
+            plt.savefig(save_path, facecolor=COLORS['bg'], dpi=150, bbox_inches='tight')
         print(f"Сохранено: {save_path}")
     
     if show:
@@ -88,6 +110,39 @@ def draw(production_data, save_path=None, show=True):
     return fig
 
 
+def draw_plan(ax, plan, positions, batched, scene):
+    """Рисует здания и связи плана (batched=None - по числу зданий)"""
+    buildings = plan['buildings']
+    connections = plan['connections']
+    if batched is None:
+        batched = len(buildings) > BATCH_THRESHOLD
+    
+    if batched:
+        groups, group_of = building_groups(buildings, positions)
+        with Profile.span('связи'):
+            draw_connections_batched(ax, connections, positions, groups, group_of, scene)
+        with Profile.span('здания'):
+            draw_buildings_batched(ax, buildings, positions, groups, scene)
+    else:
+        # Рисуем связи (сначала, чтобы были под блоками)
+        with Profile.span('связи'):
+            draw_connections(ax, connections, buildings, positions, scene)
+        
+        # Рисуем здания
+        with Profile.span('здания'):
+            draw_buildings(ax, buildings, positions, scene)
+    Profile.count('артистов', len(ax.patches) + len(ax.texts) + len(ax.collections))
+
+
+def layout_positions(production_data, layout='layered'):
+    """Позиции зданий плана выбранным способом раскладки (см. LAYOUTS)"""
+    if layout == 'layered':
+        return Layout.layered_positions(production_data['buildings'], production_data['connections'])
+    if layout == 'levels':
+        return calculate_positions(production_data['buildings'])
+    raise ValueError(f"Неизвестная раскладка: {layout}")
+
+
 def calculate_positions(buildings):
     """Вычисляет позиции для каждого здания"""
     positions = {}
@@ -129,153 +184,372 @@ def calculate_positions(buildings):
     return positions
 
 
-def truncate_text(text, max_chars):
-    """Сокращает текст до максимальной длины"""
-    if len(text) <= max_chars:
-        return text
-    return text[:max_chars-2] + '..'
+def draw_buildings(ax, buildings, positions, scene=None):
+    """Рисует все здания (scene - Scene для отсечения и уровня детализации)"""
+    for building in buildings:
+        pos = positions[building['id']]
+        artists = draw_building(ax, building, pos)
+        if scene is not None:
+            register_building(scene, artists, pos)
+
+
+def register_building(scene, artists, pos):
+    """Добавляет художников draw_building в Scene"""
+    x, y = pos['x'], pos['y']
+    w, h = pos['width'], pos['height']
+    scene.add(artists['shadow'], x - w/2, y - h/2 - 3, x + w/2 + 3, y + h/2)
+    scene.add(artists['block'], x - w/2, y - h/2, x + w/2, y + h/2)
+    for text in artists['labels'].values():
+        scene.add(text, x - w/2, y - h/2 - 40, x + w/2, y + h/2, label=True)
+
 
+def building_labels(building, width):
+    """
+    Подписи блока здания: {вид: текст}. Виды - 'name', 'type', 'number'
+    (×N свернутой группы или номер здания) и 'output' (выход под блоком).
+    """
+    # Максимум символов в строке (зависит от ширины блока)
+    max_chars = int(width / 9)
+    labels = {
+        'name': wrap_text(building['name'], max_chars),
+        'type': truncate_text(building.get('building', 'default'), max_chars)
+    }
+    if building.get('count', 1) > 1:
+        labels['number'] = f"×{building['count']}"
+    elif building.get('total_buildings', 1) > 1:
+        labels['number'] = f"#{building.get('building_num', 1)}/{building.get('total_buildings', 1)}"
+    output = building.get('output', 0)
+    if output > 0:
+        labels['output'] = f"{output:.1f}/мин"
+    return labels
+
+
+def _label_xy(kind, text, pos):
+    """Точка привязки подписи вида kind"""
+    x, y = pos['x'], pos['y']
+    if kind == 'name':
+        # Название в две строки сдвигается выше
+        return x, y + (30 if '\n' not in text else 35)
+    if kind == 'number':
+        return x, y - 28
+    if kind == 'output':
+        return x, y - pos['height'] / 2 - 15
+    return x, y
+
+
+# Стиль подписей блока по виду
+LABEL_STYLES = {
+    'name': dict(va='center', fontsize=12, color=COLORS['text'], linespacing=0.9),
+    'type': dict(va='center', fontsize=10, color=COLORS['text']),
+    'number': dict(va='center', fontsize=11, color=COLORS['text']),
+    'output': dict(va='top', fontsize=11, color=COLORS['accent'])
+}
 
-def wrap_text(text, max_chars_per_line):
-    """Разбивает текст на строки"""
-    if len(text) <= max_chars_per_line:
-        return text
+
+def draw_building(ax, building, pos):
+    """
+    Рисует одно здание: тень, блок и подписи building_labels.
+    Возвращает {'shadow': ..., 'block': ..., 'labels': {вид: Text}}.
+    """
+    x, y = pos['x'], pos['y']
+    w, h = pos['width'], pos['height']
     
-    words = text.split()
-    lines = []
-    current_line = ""
+    # Цвет здания
+    building_type = building.get('building', 'default')
+    color = BUILDING_COLORS.get(building_type, BUILDING_COLORS['default'])
     
-    for word in words:
-        if len(current_line) + len(word) + 1 <= max_chars_per_line:
-            current_line += (" " + word) if current_line else word
-        else:
-            if current_line:
-                lines.append(current_line)
-            current_line = word
+    # Тень
+    shadow = Rectangle(
+        (x - w/2 + 3, y - h/2 - 3), w, h,
+        facecolor='black', alpha=0.3, zorder=1
+    )
+    ax.add_patch(shadow)
+    
+    # Основной блок
+    rect = Rectangle(
+        (x - w/2, y - h/2), w, h,
+        facecolor=color, edgecolor=COLORS['text'],
+        linewidth=2, zorder=2
+    )
+    ax.add_patch(rect)
     
-    if current_line:
-        lines.append(current_line)
+    labels = {}
+    for kind, text in building_labels(building, w).items():
+        lx, ly = _label_xy(kind, text, pos)
+        labels[kind] = ax.text(lx, ly, text, ha='center', fontweight='bold', zorder=3,
+                               path_effects=TEXT_OUTLINE, **LABEL_STYLES[kind])
+    return {'shadow': shadow, 'block': rect, 'labels': labels}
+
+
+def update_building(artists, building, pos):
+    """
+    Меняет нарисованное здание на месте: цвет, положение и текст подписей.
+    Возвращает False, если изменился набор подписей (здание нужно перерисовать).
+    """
+    labels = building_labels(building, pos['width'])
+    if labels.keys() != artists['labels'].keys():
+        return False
+    x, y = pos['x'], pos['y']
+    w, h = pos['width'], pos['height']
+    color = BUILDING_COLORS.get(building.get('building', 'default'), BUILDING_COLORS['default'])
+    artists['shadow'].set_bounds(x - w/2 + 3, y - h/2 - 3, w, h)
+    artists['block'].set_bounds(x - w/2, y - h/2, w, h)
+    artists['block'].set_facecolor(color)
+    for kind, text in labels.items():
+        label = artists['labels'][kind]
+        label.set_text(text)
+        label.set_position(_label_xy(kind, text, pos))
+    return True
+
+
+def draw_connections(ax, connections, buildings, positions, scene=None):
+    """Рисует связи между зданиями (scene - Scene для отсечения и уровня детализации)"""
+    for conn in connections:
+        from_pos = positions.get(conn['from'])
+        to_pos = positions.get(conn['to'])
+        if from_pos is None or to_pos is None:
+            continue
+        artists = draw_connection(ax, conn, from_pos, to_pos)
+        if scene is not None:
+            register_connection(scene, artists, from_pos, to_pos)
+
+
+def register_connection(scene, artists, from_pos, to_pos):
+    """Добавляет художников draw_connection в Scene"""
+    (x1, y1), (x2, y2) = connection_ends(from_pos, to_pos)
+    scene.add(artists['arrow'], min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+    if artists['label'] is not None:
+        mid_x, mid_y = artists['label'].get_position()
+        mid_x -= 8
+        scene.add(artists['label'], mid_x, mid_y - 15, mid_x + 60, mid_y + 15, label=True)
+
+
+def connection_ends(from_pos, to_pos):
+    """Координаты начала и конца стрелки (с отступом от блоков)"""
+    return ((from_pos['x'], from_pos['y'] + from_pos['height'] / 2 + 5),   # Верх блока + отступ
+            (to_pos['x'], to_pos['y'] - to_pos['height'] / 2 - 20))       # Низ блока - отступ для текста
+
+
+def draw_connection(ax, conn, from_pos, to_pos):
+    """Рисует одну связь: стрелку и метку количества. Возвращает {'arrow': ..., 'label': ...}"""
+    (x1, y1), (x2, y2) = connection_ends(from_pos, to_pos)
     
-    # Максимум 2 строки
-    if len(lines) > 2:
-        lines = [lines[0], truncate_text(' '.join(lines[1:]), max_chars_per_line)]
+    # Рисуем стрелку
+    arrow = FancyArrowPatch(
+        (x1, y1), (x2, y2),
+        arrowstyle='-|>',
+        mutation_scale=20,
+        color=COLORS['text'],
+        linewidth=2 + math.log2(conn.get('count', 1)),
+        alpha=0.8,
+        zorder=0
+    )
+    ax.add_patch(arrow)
     
-    return '\n'.join(lines)
+    # Метка с количеством ресурса
+    label = None
+    amount = conn.get('amount', 0)
+    if amount > 0:
+        label = ax.text((x1 + x2) / 2 + 8, (y1 + y2) / 2, f"{amount:.1f}", ha='left', va='center',
+                        fontsize=10, color=COLORS['text'], fontweight='bold',
+                        bbox=dict(boxstyle='round,pad=0.3', facecolor=COLORS['bg'], 
+                                 edgecolor=COLORS['text'], alpha=0.95, linewidth=1.5),
+                        zorder=1)
+    return {'arrow': arrow, 'label': label}
 
 
-def draw_buildings(ax, buildings, positions):
-    """Рисует все здания"""
-    for building in buildings:
-        pos = positions[building['id']]
-        x, y = pos['x'], pos['y']
-        w, h = pos['width'], pos['height']
-        
-        # Цвет здания
-        building_type = building.get('building', 'default')
-        color = BUILDING_COLORS.get(building_type, BUILDING_COLORS['default'])
-        
-        # Тень
-        shadow = Rectangle(
-            (x - w/2 + 3, y - h/2 - 3), w, h,
-            facecolor='black', alpha=0.3, zorder=1
-        )
-        ax.add_patch(shadow)
-        
-        # Основной блок
-        rect = Rectangle(
-            (x - w/2, y - h/2), w, h,
-            facecolor=color, edgecolor=COLORS['text'],
-            linewidth=2, zorder=2
-        )
-        ax.add_patch(rect)
-        
-        # Максимум символов в строке (зависит от ширины блока)
-        max_chars = int(w / 9)
-        
-        # Название (с переносом строки если нужно)
-        name = building['name']
-        display_name = wrap_text(name, max_chars)
-        
-        # Считаем количество строк в названии для смещения
-        name_lines = display_name.count('\n') + 1
-        name_offset = 30 if name_lines == 1 else 35
-        
-        ax.text(x, y + name_offset, display_name, ha='center', va='center',
-                fontsize=12, color=COLORS['text'], fontweight='bold', zorder=3,
-                linespacing=0.9, path_effects=TEXT_OUTLINE)
-        
-        # Тип здания (сокращаем если нужно)
-        building_text = truncate_text(building_type, max_chars)
-        ax.text(x, y, building_text, ha='center', va='center',
-                fontsize=10, color=COLORS['text'], fontweight='bold', zorder=3,
-                path_effects=TEXT_OUTLINE)
-        
-        # Номер здания (если несколько)
-        if building.get('total_buildings', 1) > 1:
-            num_text = f"#{building.get('building_num', 1)}/{building.get('total_buildings', 1)}"
-            ax.text(x, y - 28, num_text, ha='center', va='center',
-                    fontsize=11, color=COLORS['text'], fontweight='bold', zorder=3,
-                    path_effects=TEXT_OUTLINE)
-        
-        # Выход (под блоком)
-        output = building.get('output', 0)
-        if output > 0:
-            ax.text(x, y - h/2 - 15, f"{output:.1f}/мин", ha='center', va='top',
-                    fontsize=11, color=COLORS['accent'], fontweight='bold', zorder=3,
-                    path_effects=TEXT_OUTLINE)
+def update_connection(artists, conn, from_pos, to_pos):
+    """
+    Меняет нарисованную связь на месте: концы, толщину и метку.
+    Возвращает False, если метка появилась или пропала (связь нужно перерисовать).
+    """
+    amount = conn.get('amount', 0)
+    if (amount > 0) != (artists['label'] is not None):
+        return False
+    (x1, y1), (x2, y2) = connection_ends(from_pos, to_pos)
+    artists['arrow'].set_positions((x1, y1), (x2, y2))
+    artists['arrow'].set_linewidth(2 + math.log2(conn.get('count', 1)))
+    if artists['label'] is not None:
+        artists['label'].set_text(f"{amount:.1f}")
+        artists['label'].set_position(((x1 + x2) / 2 + 8, (y1 + y2) / 2))
+    return True
+
+
+def building_groups(buildings, positions):
+    """
+    Группы соседних зданий одного рецепта на одном уровне.
+    Возвращает (группы, {id здания: номер группы}); группа - словарь с полями
+    name, building, level, count, machines (зданий с учетом свернутых групп
+    GroupedPlan), output (всего), x_min, x_max, y (центр верхнего ряда),
+    y_bottom (центр нижнего ряда), height.
+    """
+    groups = []
+    group_of = {}
+    last = None
+    for b in buildings:
+        pos = positions[b['id']]
+        key = (b['level'], b['name'], b.get('total_buildings', 1))
+        if last is not None and last[0] == key and last[1]['count'] < key[2]:
+            group = last[1]
+            group['count'] += 1
+            group['machines'] += b.get('count', 1)
+            group['output'] += b.get('output', 0)
+            group['x_min'] = min(group['x_min'], pos['x'] - pos['width'] / 2)
+            group['x_max'] = max(group['x_max'], pos['x'] + pos['width'] / 2)
+            group['y'] = max(group['y'], pos['y'])
+            group['y_bottom'] = min(group['y_bottom'], pos['y'])
+        else:
+            group = {
+                'name': b['name'],
+                'building': b.get('building', 'default'),
+                'level': b['level'],
+                'count': 1,
+                'machines': b.get('count', 1),
+                'output': b.get('output', 0),
+                'x_min': pos['x'] - pos['width'] / 2,
+                'x_max': pos['x'] + pos['width'] / 2,
+                'y': pos['y'],
+                'y_bottom': pos['y'],
+                'height': pos['height']
+            }
+            groups.append(group)
+            last = (key, group)
+        group_of[b['id']] = len(groups) - 1
+    return groups, group_of
+
+
+def _rectangles(buildings, positions, dx=0, dy=0):
+    """Вершины прямоугольников зданий для PolyCollection (массив N x 4 x 2)"""
+    boxes = np.array([(positions[b['id']]['x'], positions[b['id']]['y'],
+                       positions[b['id']]['width'], positions[b['id']]['height'])
+                      for b in buildings], dtype=float).reshape(-1, 4)
+    x0 = boxes[:, 0] - boxes[:, 2] / 2 + dx
+    x1 = boxes[:, 0] + boxes[:, 2] / 2 + dx
+    y0 = boxes[:, 1] - boxes[:, 3] / 2 + dy
+    y1 = boxes[:, 1] + boxes[:, 3] / 2 + dy
+    return np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1),
+                     np.stack([x1, y1], 1), np.stack([x0, y1], 1)], 1)
 
 
-def draw_connections(ax, connections, buildings, positions):
-    """Рисует связи между зданиями"""
-    # Создаем словарь зданий по ID
-    buildings_dict = {b['id']: b for b in buildings}
+def draw_buildings_batched(ax, buildings, positions, groups, scene=None):
+    """
+    Рисует здания двумя коллекциями (тени и блоки) с цветами из BUILDING_COLORS.
+    Подписи общие для группы соседних одинаковых зданий: название, тип,
+    число зданий и общий выход - по одному тексту на строку подписи.
+    """
+    colors = [BUILDING_COLORS.get(b.get('building', 'default'), BUILDING_COLORS['default'])
+              for b in buildings]
+    shadows = _rectangles(buildings, positions, 3, -3)
+    blocks = _rectangles(buildings, positions)
+    shadow_collection = PolyCollection(shadows, facecolors='black', alpha=0.3, zorder=1)
+    block_collection = PolyCollection(blocks, facecolors=colors, edgecolors=COLORS['text'],
+                                      linewidths=2, zorder=2)
+    ax.add_collection(shadow_collection)
+    ax.add_collection(block_collection)
+    if scene is not None:
+        scene.add_collection(shadow_collection, shadows)
+        scene.add_collection(block_collection, blocks)
     
+    for group in groups:
+        x = (group['x_min'] + group['x_max']) / 2
+        y = group['y']
+        h = group['height']
+        max_chars = int((group['x_max'] - group['x_min']) / 9)
+        
+        title = truncate_text(group['name'], max_chars)
+        if group['machines'] > 1:
+            title += f" ×{group['machines']}"
+        label = f"{title}\n{truncate_text(group['building'], max_chars)}"
+        labels = [ax.text(x, y + 10, label, ha='center', va='center',
+                          fontsize=11, color=COLORS['text'], fontweight='bold', zorder=3,
+                          linespacing=1.6, path_effects=TEXT_OUTLINE)]
+        if group['output'] > 0:
+            labels.append(ax.text(x, group['y_bottom'] - h/2 - 15, f"{group['output']:.1f}/мин", ha='center', va='top',
+                                  fontsize=11, color=COLORS['accent'], fontweight='bold', zorder=3,
+                                  path_effects=TEXT_OUTLINE))
+        if scene is not None:
+            for text in labels:
+                scene.add(text, group['x_min'], group['y_bottom'] - h/2 - 40,
+                          group['x_max'], y + h/2, label=True)
+
+
+def draw_connections_batched(ax, connections, positions, groups, group_of, scene=None):
+    """
+    Рисует все связи одной LineCollection, наконечники - одной PolyCollection.
+    Количество ресурса подписывается один раз на пару групп (сумма по связям).
+    При мелком масштабе (scene) вместо связей показываются пучки: одна линия
+    между центрами пары групп, толщина растет с числом связей.
+    """
+    segments = []
+    totals = {}
     for conn in connections:
         from_id = conn['from']
         to_id = conn['to']
-        
         if from_id not in positions or to_id not in positions:
             continue
-        
         from_pos = positions[from_id]
         to_pos = positions[to_id]
-        
-        # Координаты начала и конца стрелки (с отступом от блоков)
-        x1 = from_pos['x']
-        y1 = from_pos['y'] + from_pos['height'] / 2 + 5  # Верх блока + отступ
-        x2 = to_pos['x']
-        y2 = to_pos['y'] - to_pos['height'] / 2 - 20  # Низ блока - отступ для текста
-        
-        # Рисуем стрелку
-        arrow = FancyArrowPatch(
-            (x1, y1), (x2, y2),
-            arrowstyle='-|>',
-            mutation_scale=20,
-            color=COLORS['text'],
-            linewidth=2,
-            alpha=0.8,
-            zorder=0
-        )
-        ax.add_patch(arrow)
-        
-        # Метка с количеством ресурса
+        segments.append(((from_pos['x'], from_pos['y'] + from_pos['height'] / 2 + 5),
+                         (to_pos['x'], to_pos['y'] - to_pos['height'] / 2 - 20)))
+        key = (group_of[from_id], group_of[to_id])
+        total, count = totals.get(key, (0, 0))
+        totals[key] = (total + conn.get('amount', 0), count + 1)
+    if not segments:
+        return
+    
+    segments = np.array(segments, dtype=float)
+    lines = LineCollection(segments, colors=COLORS['text'], linewidths=1.5, alpha=0.8, zorder=0)
+    ax.add_collection(lines)
+    
+    # Наконечники стрелок: треугольники у конца каждой связи
+    start, end = segments[:, 0], segments[:, 1]
+    direction = end - start
+    length = np.hypot(direction[:, 0], direction[:, 1])
+    direction /= np.where(length > 0, length, 1)[:, None]
+    normal = np.stack([-direction[:, 1], direction[:, 0]], 1)
+    base = end - direction * 18
+    heads = np.stack([end, base + normal * 7, base - normal * 7], 1)
+    arrowheads = PolyCollection(heads, facecolors=COLORS['text'], edgecolors='none',
+                                alpha=0.8, zorder=0)
+    ax.add_collection(arrowheads)
+    
+    bundles = []
+    widths = []
+    for (from_group, to_group), (amount, count) in totals.items():
+        source = groups[from_group]
+        target = groups[to_group]
+        x1 = (source['x_min'] + source['x_max']) / 2
+        y1 = source['y'] + source['height'] / 2 + 5
+        x2 = (target['x_min'] + target['x_max']) / 2
+        y2 = target['y_bottom'] - target['height'] / 2 - 20
+        bundles.append(((x1, y1), (x2, y2)))
+        widths.append(1.5 + math.log2(count))
+        if amount <= 0:
+            continue
         mid_x = (x1 + x2) / 2
         mid_y = (y1 + y2) / 2
-        amount = conn.get('amount', 0)
-        if amount > 0:
-            ax.text(mid_x + 8, mid_y, f"{amount:.1f}", ha='left', va='center',
-                    fontsize=10, color=COLORS['text'], fontweight='bold',
-                    bbox=dict(boxstyle='round,pad=0.3', facecolor=COLORS['bg'], 
-                             edgecolor=COLORS['text'], alpha=0.95, linewidth=1.5),
-                    zorder=1)
+        label = ax.text(mid_x + 8, mid_y, f"{amount:.1f}", ha='left', va='center',
+                        fontsize=10, color=COLORS['text'], fontweight='bold',
+                        bbox=dict(boxstyle='round,pad=0.3', facecolor=COLORS['bg'],
+                                  edgecolor=COLORS['text'], alpha=0.95, linewidth=1.5),
+                        zorder=1)
+        if scene is not None:
+            scene.add(label, mid_x, mid_y - 15, mid_x + 60, mid_y + 15, label=True)
+    
+    if scene is not None:
+        bundles = np.array(bundles, dtype=float)
+        bundled = LineCollection(bundles, colors=COLORS['text'], linewidths=widths,
+                                 alpha=0.8, zorder=0, visible=False)
+        ax.add_collection(bundled)
+        scene.add_collection(lines, segments, detail=True)
+        scene.add_collection(arrowheads, heads, detail=True)
+        scene.add_collection(bundled, bundles, detail=False)
 
 
-def setup_axes(ax, positions):
-    """Настраивает оси графика"""
+def plan_limits(positions):
+    """Границы осей (xlim, ylim) для всего чертежа с местом под подписи"""
     if not positions:
-        ax.set_xlim(-500, 500)
-        ax.set_ylim(-500, 500)
-        return
+        return (-500, 500), (-500, 500)
     
     # Находим границы (с учетом размеров блоков и текста)
     all_x = [p['x'] for p in positions.values()]
@@ -285,9 +559,16 @@ def setup_axes(ax, positions):
     max_x = max(all_x) + 200
     min_y = min(all_y) - 200  # Больше места снизу для текста под блоками
     max_y = max(all_y) + 180
-    
-    ax.set_xlim(min_x, max_x)
-    ax.set_ylim(min_y, max_y)
+    return (min_x, max_x), (min_y, max_y)
+
+
+def setup_axes(ax, positions):
+    """Настраивает оси графика"""
+    xlim, ylim = plan_limits(positions)
+    ax.set_xlim(xlim)
+    ax.set_ylim(ylim)
+    if not positions:
+        return
     
     # Убираем оси
     ax.set_xticks([])
@@ -319,8 +600,150 @@ def add_legend(ax):
         legend.get_frame().set_linewidth(2)
 
 
-def enable_interactivity(fig, ax, positions):
-    """Включает интерактивность: масштабирование и перемещение"""
+class SpatialGrid:
+    """Равномерная сетка по области чертежа: быстрый поиск элементов в прямоугольнике"""
+
+    def __init__(self, bounds, cells=32):
+        self.x0, self.y0, x1, y1 = bounds
+        self.cells = cells
+        self.cell_w = max(x1 - self.x0, 1) / cells
+        self.cell_h = max(y1 - self.y0, 1) / cells
+        self.grid = {}
+        self.count = 0
+
+    def _range(self, x0, y0, x1, y1):
+        last = self.cells - 1
+        i0 = min(max(int((x0 - self.x0) // self.cell_w), 0), last)
+        i1 = min(max(int((x1 - self.x0) // self.cell_w), 0), last)
+        j0 = min(max(int((y0 - self.y0) // self.cell_h), 0), last)
+        j1 = min(max(int((y1 - self.y0) // self.cell_h), 0), last)
+        return i0, i1, j0, j1
+
+    def insert(self, index, x0, y0, x1, y1):
+        i0, i1, j0, j1 = self._range(x0, y0, x1, y1)
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                self.grid.setdefault((i, j), []).append(index)
+        self.count = max(self.count, index + 1)
+
+    def query(self, x0, y0, x1, y1):
+        """Номера элементов, чьи ячейки пересекают прямоугольник (с запасом в ячейку)"""
+        i0, i1, j0, j1 = self._range(x0, y0, x1, y1)
+        if i0 == 0 and j0 == 0 and i1 == self.cells - 1 and j1 == self.cells - 1:
+            return range(self.count)
+        found = set()
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                found.update(self.grid.get((i, j), ()))
+        return found
+
+
+class Scene:
+    """
+    Художники чертежа с пространственным индексом для отсечения и уровня детализации.
+    Отдельные художники (блоки, стрелки, подписи) скрываются вне видимой области,
+    подписи - еще и при мелком масштабе. У коллекций остаются только видимые
+    элементы; коллекции с detail=True показываются только крупно, с detail=False -
+    только мелко (пучки связей).
+    """
+
+    def __init__(self, positions):
+        self.reset(positions)
+
+    def reset(self, positions):
+        """Убирает с осей всех добавленных художников и заводит индекс под новую раскладку"""
+        for artist, _ in getattr(self, 'artists', ()):
+            artist.remove()
+        for collection, *_ in getattr(self, 'collections', ()):
+            collection.remove()
+        self.artists = []
+        self.collections = []
+        self.forget(positions)
+
+    def forget(self, positions):
+        """
+        Заводит пустой индекс под новую раскладку, не убирая художников с осей
+        (ими владеет вызывающий код, например PlanView). Скрытые становятся видимыми.
+        """
+        for artist, _ in getattr(self, 'artists', ()):
+            artist.set_visible(True)
+        for collection, *_ in getattr(self, 'collections', ()):
+            collection.set_visible(True)
+        if positions:
+            xs = [p['x'] for p in positions.values()]
+            ys = [p['y'] for p in positions.values()]
+            self.bounds = (min(xs) - 200, min(ys) - 200, max(xs) + 200, max(ys) + 200)
+            self.block_width = max(p['width'] for p in positions.values())
+        else:
+            self.bounds = (-500, -500, 500, 500)
+            self.block_width = 0
+        self.artists = []   # (художник, подпись ли)
+        self.grid = SpatialGrid(self.bounds)
+        self.collections = []
+        self.shown = set()
+
+    def add(self, artist, x0, y0, x1, y1, label=False):
+        # Подписи у края видимой области не должны вылезать за оси
+        artist.set_clip_on(True)
+        self.grid.insert(len(self.artists), x0, y0, x1, y1)
+        self.artists.append((artist, label))
+        self.shown.add(len(self.artists) - 1)
+
+    def add_collection(self, collection, shapes, detail=None):
+        """shapes - вершины элементов коллекции (N x k x 2), в порядке коллекции"""
+        grid = SpatialGrid(self.bounds)
+        low = shapes.min(axis=1)
+        high = shapes.max(axis=1)
+        for index in range(len(shapes)):
+            grid.insert(index, low[index, 0], low[index, 1], high[index, 0], high[index, 1])
+        facecolors = collection.get_facecolor()
+        linewidths = collection.get_linewidth()
+        self.collections.append((collection, shapes, grid, detail, facecolors, linewidths))
+
+    def legible(self, ax):
+        """Достаточно ли крупно здание на экране для подписей"""
+        x0, x1 = ax.get_xlim()
+        pixels_per_unit = ax.bbox.width / abs(x1 - x0) if x1 != x0 else 0
+        return self.block_width * pixels_per_unit >= LOD_LABEL_PIXELS
+
+    def update(self, ax):
+        """Оставляет видимыми только художники в текущей области и нужной детализации"""
+        x0, x1 = sorted(ax.get_xlim())
+        y0, y1 = sorted(ax.get_ylim())
+        detail = self.legible(ax)
+        with Profile.span('отсечение'):
+            visible = self.grid.query(x0, y0, x1, y1)
+            wanted = {i for i in visible if detail or not self.artists[i][1]}
+            for i in self.shown - wanted:
+                self.artists[i][0].set_visible(False)
+            for i in wanted - self.shown:
+                self.artists[i][0].set_visible(True)
+            self.shown = wanted
+            
+            for collection, shapes, grid, only_detail, facecolors, linewidths in self.collections:
+                if only_detail is not None and only_detail != detail:
+                    collection.set_visible(False)
+                    continue
+                collection.set_visible(True)
+                index = np.fromiter(grid.query(x0, y0, x1, y1), dtype=np.intp)
+                index.sort()
+                if isinstance(collection, LineCollection):
+                    collection.set_segments(shapes[index])
+                else:
+                    collection.set_verts(shapes[index])
+                if len(facecolors) > 1:
+                    collection.set_facecolor(facecolors[index])
+                if len(linewidths) > 1:
+                    collection.set_linewidth(np.asarray(linewidths)[index])
+        Profile.count('видимых', len(wanted))
+
+
+def enable_interactivity(fig, ax, positions, scene=None):
+    """
+    Включает интерактивность: масштабирование и перемещение.
+    Возвращает функцию set_home(xlim, ylim): новые границы для сброса двойным
+    кликом (после перестройки чертежа сохраненные картинки сбрасываются).
+    """
     
     # Сохраняем начальные границы для сброса
     initial_xlim = ax.get_xlim()
@@ -333,6 +756,82 @@ def enable_interactivity(fig, ax, positions):
         'last_y': None
     }
     
+    # Быстрые кадры при перемещении: сохраненная картинка осей сдвигается
+    # и масштабируется блиттингом, начисто сцена рисуется в конце движения
+    canvas = fig.canvas
+    cache = {
+        'background': None,   # картинка осей после последней полной отрисовки
+        'limits': None,       # границы осей для этой картинки
+        'initial': None,      # (картинка, размер холста) начального вида
+        'timer': None
+    }
+    
+    def redraw():
+        """Перерисовка: сначала отсечение по новой видимой области"""
+        if scene is not None:
+            scene.update(ax)
+        fig.canvas.draw_idle()
+    
+    def on_draw(event):
+        """После полной отрисовки запоминаем картинку осей"""
+        if not canvas.supports_blit:
+            return
+        cache['background'] = canvas.copy_from_bbox(ax.bbox)
+        cache['limits'] = (ax.get_xlim(), ax.get_ylim())
+        if cache['limits'] == (initial_xlim, initial_ylim):
+            cache['initial'] = (cache['background'], canvas.get_width_height())
+    
+    def preview():
+        """
+        Быстрый кадр: сохраненная картинка осей, пересчитанная под новые границы
+        (ближайший пиксель), пишется прямо в буфер Agg и выводится блиттингом.
+        """
+        if cache['background'] is None or not hasattr(canvas, 'buffer_rgba'):
+            redraw()
+            return
+        (ox0, ox1), (oy0, oy1) = cache['limits']
+        (nx0, nx1), (ny0, ny1) = ax.get_xlim(), ax.get_ylim()
+        pixels = np.asarray(cache['background'])
+        x0, y0, x1, y1 = cache['background'].get_extents()
+        height, width = pixels.shape[:2]
+        
+        # Для каждого пикселя нового кадра - пиксель сохраненной картинки
+        xs = nx0 + (np.arange(width) + 0.5) / width * (nx1 - nx0)
+        ys = ny1 - (np.arange(height) + 0.5) / height * (ny1 - ny0)
+        cols = np.floor((xs - ox0) / (ox1 - ox0) * width).astype(np.intp)
+        rows = np.floor((oy1 - ys) / (oy1 - oy0) * height).astype(np.intp)
+        col_ok = (cols >= 0) & (cols < width)
+        row_ok = (rows >= 0) & (rows < height)
+        
+        # Пиксель RGBA как одно 32-битное число: копирование вчетверо быстрее
+        source = np.ascontiguousarray(pixels).view(np.uint32)[:, :, 0]
+        background = np.frombuffer(bytes(int(255 * c) for c in matplotlib.colors.to_rgba(
+            ax.get_facecolor())), dtype=np.uint32)[0]
+        frame = np.full((height, width), background, dtype=np.uint32)
+        visible = source.take(rows[row_ok], axis=0).take(cols[col_ok], axis=1)
+        frame[row_ok.argmax():row_ok.argmax() + visible.shape[0],
+              col_ok.argmax():col_ok.argmax() + visible.shape[1]] = visible
+        
+        np.asarray(canvas.buffer_rgba())[y0:y1, x0:x1] = frame.view(np.uint8).reshape(height, width, 4)
+        if ax.get_legend() is not None:
+            ax.draw_artist(ax.get_legend())
+        canvas.blit(ax.bbox)
+    
+    def settle():
+        """Конец движения: одна полная отрисовка в полном качестве"""
+        if cache['timer'] is not None:
+            cache['timer'].stop()
+        redraw()
+    
+    def settle_later():
+        """Полная отрисовка, когда колесико перестанет крутиться"""
+        if cache['timer'] is None:
+            cache['timer'] = canvas.new_timer(interval=SETTLE_MS)
+            cache['timer'].single_shot = True
+            cache['timer'].add_callback(settle)
+        cache['timer'].stop()
+        cache['timer'].start()
+    
     def on_scroll(event):
         """Масштабирование колесиком мыши"""
         if event.inaxes != ax:
@@ -367,7 +866,8 @@ def enable_interactivity(fig, ax, positions):
         ax.set_xlim(x_center - new_width * rel_x, x_center + new_width * (1 - rel_x))
         ax.set_ylim(y_center - new_height * rel_y, y_center + new_height * (1 - rel_y))
         
-        fig.canvas.draw_idle()
+        preview()
+        settle_later()
     
     def on_press(event):
         """Начало перетаскивания"""
@@ -382,6 +882,8 @@ def enable_interactivity(fig, ax, positions):
     
     def on_release(event):
         """Конец перетаскивания"""
+        if state['dragging']:
+            settle()
         state['dragging'] = False
         state['last_x'] = None
         state['last_y'] = None
@@ -406,14 +908,32 @@ def enable_interactivity(fig, ax, positions):
         ax.set_xlim(xlim[0] + dx, xlim[1] + dx)
         ax.set_ylim(ylim[0] + dy, ylim[1] + dy)
         
-        fig.canvas.draw_idle()
+        preview()
     
     def on_double_click(event):
         """Сброс масштаба при двойном клике"""
         if event.dblclick and event.inaxes == ax:
             ax.set_xlim(initial_xlim)
             ax.set_ylim(initial_ylim)
-            fig.canvas.draw_idle()
+            initial = cache['initial']
+            if initial is None or initial[1] != canvas.get_width_height():
+                settle()
+                return
+            # Начальный вид уже отрисован: просто возвращаем его картинку
+            if cache['timer'] is not None:
+                cache['timer'].stop()
+            if scene is not None:
+                scene.update(ax)
+            cache['background'] = initial[0]
+            cache['limits'] = (initial_xlim, initial_ylim)
+            canvas.restore_region(initial[0])
+            canvas.blit(ax.bbox)
+    
+    def set_home(xlim, ylim):
+        nonlocal initial_xlim, initial_ylim
+        initial_xlim, initial_ylim = tuple(xlim), tuple(ylim)
+        cache['background'] = None
+        cache['initial'] = None
     
     # Подключаем обработчики событий
     fig.canvas.mpl_connect('scroll_event', on_scroll)
@@ -421,3 +941,179 @@ def enable_interactivity(fig, ax, positions):
     fig.canvas.mpl_connect('button_release_event', on_release)
     fig.canvas.mpl_connect('motion_notify_event', on_motion)
     fig.canvas.mpl_connect('button_press_event', on_double_click)
+    fig.canvas.mpl_connect('draw_event', on_draw)
+    
+    return set_home
+
+
+class GroupedPlan:
+    """
+    Сгруппированный вид плана: один узел на (рецепт, уровень) с числом зданий,
+    общим выходом и суммарными связями. Развернутые группы (toggle) показываются
+    отдельными зданиями. Узел свернутой группы k имеет id -1 - k (id зданий
+    неотрицательны). Построение - один проход по зданиям и связям; plan()
+    зависит только от числа групп и зданий развернутых групп.
+    """
+
+    def __init__(self, production_data):
+        self.data = production_data
+        self.groups = []     # name, building, level, is_source, output, members (здания)
+        self.group_of = {}   # id здания -> номер группы
+        index = {}
+        for b in production_data['buildings']:
+            key = (b['name'], b['level'])
+            k = index.get(key)
+            if k is None:
+                k = index[key] = len(self.groups)
+                self.groups.append({
+                    'name': b['name'],
+                    'building': b.get('building', 'default'),
+                    'level': b['level'],
+                    'is_source': b.get('is_source', False),
+                    'output': 0,
+                    'members': []
+                })
+            group = self.groups[k]
+            group['output'] += b.get('output', 0)
+            group['members'].append(b)
+            self.group_of[b['id']] = k
+        
+        # Связи между группами: (откуда, куда) -> [ресурс, количество, число связей];
+        # для каждой группы - номера ее связей (нужны при развороте)
+        self.edges = {}
+        self.touching = [[] for _ in self.groups]
+        for i, conn in enumerate(production_data['connections']):
+            source = self.group_of.get(conn['from'])
+            target = self.group_of.get(conn['to'])
+            if source is None or target is None:
+                continue
+            edge = self.edges.get((source, target))
+            if edge is None:
+                edge = self.edges[(source, target)] = [conn.get('resource'), 0, 0]
+            edge[1] += conn.get('amount', 0)
+            edge[2] += 1
+            self.touching[source].append(i)
+            if target != source:
+                self.touching[target].append(i)
+        self.expanded = set()
+
+    @staticmethod
+    def node_id(group):
+        return -1 - group
+
+    def group_at(self, node_id):
+        """Номер группы по id узла или здания"""
+        return -1 - node_id if node_id < 0 else self.group_of[node_id]
+
+    def anchor(self, group, positions):
+        """Центр узла группы или верх ее развернутых зданий"""
+        node_id = self.node_id(group)
+        if node_id in positions:
+            return positions[node_id]['x'], positions[node_id]['y']
+        members = [positions[b['id']] for b in self.groups[group]['members']]
+        return (sum(p['x'] for p in members) / len(members),
+                max(p['y'] for p in members))
+
+    def toggle(self, group):
+        """Разворачивает группу или сворачивает развернутую"""
+        if group in self.expanded:
+            self.expanded.discard(group)
+        else:
+            self.expanded.add(group)
+
+    def plan(self):
+        """План для раскладки и отрисовки в формате calculate()"""
+        buildings = []
+        for k, group in enumerate(self.groups):
+            if k in self.expanded:
+                buildings.extend(group['members'])
+            else:
+                buildings.append({
+                    'id': self.node_id(k),
+                    'name': group['name'],
+                    'building': group['building'],
+                    'level': group['level'],
+                    'output': group['output'],
+                    'building_num': 1,
+                    'total_buildings': 1,
+                    'is_source': group['is_source'],
+                    'count': len(group['members'])
+                })
+        
+        connections = []
+        for (source, target), (resource, amount, count) in self.edges.items():
+            if source not in self.expanded and target not in self.expanded:
+                connections.append({'from': self.node_id(source), 'to': self.node_id(target),
+                                    'resource': resource, 'amount': amount, 'count': count})
+        
+        # Связи развернутых групп: конец в свернутой группе сводится к ее узлу
+        linked = {}
+        seen = set()
+        all_connections = self.data['connections']
+        for k in self.expanded:
+            for i in self.touching[k]:
+                if i in seen:
+                    continue
+                seen.add(i)
+                conn = all_connections[i]
+                source = self.group_of[conn['from']]
+                target = self.group_of[conn['to']]
+                ends = (conn['from'] if source in self.expanded else self.node_id(source),
+                        conn['to'] if target in self.expanded else self.node_id(target))
+                link = linked.get(ends)
+                if link is None:
+                    link = linked[ends] = {'from': ends[0], 'to': ends[1],
+                                           'resource': conn.get('resource'), 'amount': 0, 'count': 0}
+                link['amount'] += conn.get('amount', 0)
+                link['count'] += 1
+        connections.extend(linked.values())
+        return dict(self.data, buildings=buildings, connections=connections)
+
+
+def node_at(positions, x, y):
+    """id здания (узла), в блок которого попадает точка, или None"""
+    for node_id, pos in positions.items():
+        if abs(x - pos['x']) <= pos['width'] / 2 and abs(y - pos['y']) <= pos['height'] / 2:
+            return node_id
+    return None
+
+
+def enable_expansion(fig, ax, view, positions, scene, set_home, batched=None, layout='layered'):
+    """
+    Клик левой кнопкой по блоку GroupedPlan разворачивает или сворачивает группу.
+    Раскладывается и рисуется заново только сгруппированный план (узлы групп
+    и здания развернутых групп); вид сдвигается так, чтобы группа осталась
+    под курсором.
+    """
+    current = {'positions': positions}
+    
+    def on_click(event):
+        if event.button != 1 or event.dblclick or event.inaxes != ax or event.xdata is None:
+            return
+        node_id = node_at(current['positions'], event.xdata, event.ydata)
+        if node_id is None:
+            return
+        group = view.group_at(node_id)
+        old_x, old_y = view.anchor(group, current['positions'])
+        view.toggle(group)
+        
+        plan = view.plan()
+        with Profile.span('раскладка'):
+            positions = layout_positions(plan, layout)
+        scene.reset(positions)
+        draw_plan(ax, plan, positions, batched, scene)
+        current['positions'] = positions
+        
+        new_x, new_y = view.anchor(group, positions)
+        shift_view(ax, new_x - old_x, new_y - old_y)
+        set_home(*plan_limits(positions))
+        scene.update(ax)
+        fig.canvas.draw_idle()
+    
+    fig.canvas.mpl_connect('button_press_event', on_click)
+
+
+def shift_view(ax, dx, dy):
+    xlim, ylim = ax.get_xlim(), ax.get_ylim()
+    ax.set_xlim(xlim[0] + dx, xlim[1] + dx)
+    ax.set_ylim(ylim[0] + dy, ylim[1] + dy)
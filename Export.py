@@ -0,0 +1,411 @@
+import csv
+import json
+import math
+from contextlib import contextmanager
+from xml.sax.saxutils import escape
+
+import Layout
+from Style import BUILDING_COLORS, COLORS, plan_title, truncate_text, wrap_text
+
+
+# Колонки CSV: общие для зданий и связей, лишние поля остаются пустыми
+CSV_COLUMNS = ('type', 'id', 'name', 'building', 'level', 'output',
+               'building_num', 'total_buildings', 'is_source',
+               'from', 'to', 'resource', 'amount')
+
+# Поля вокруг чертежа (как в Draw.setup_axes) и высота полосы заголовка
+MARGIN = 200
+TITLE_HEIGHT = 80
+
+# Размер плитки (в единицах раскладки) для write_svg_tiles / write_png_tiles
+TILE_SIZE = 8000
+
+# Наибольшая сторона PNG в пикселях: больше - уменьшается масштаб (или плитки)
+MAX_PNG_SIDE = 16384
+
+# Сжатие PNG (zlib 0-9): 1 - быстро, файл немного больше
+PNG_COMPRESS_LEVEL = 1
+
+# Подписи на PNG, когда блок здания не уже стольких пикселей
+PNG_LABEL_PIXELS = 40
+
+# Классы CSS для цветов зданий: k0, k1, ... в порядке BUILDING_COLORS
+_COLOR_CLASS = {name: f'k{i}' for i, name in enumerate(BUILDING_COLORS)}
+
+
+def write_jsonl(records, path, targets=None):
+    """
+    Пишет поток записей Calculate.iter_plan в JSON Lines: одна запись на строку,
+    вид записи в поле 'type'. Первая строка - заголовок с целями (если заданы).
+    Весь план в памяти не хранится. path - путь или открытый текстовый файл.
+    Возвращает {'building': n, 'connection': m}.
+    """
+    counts = {'building': 0, 'connection': 0}
+    with _text_output(path) as file:
+        if targets is not None:
+            file.write(json.dumps({'type': 'plan', 'targets': targets}, ensure_ascii=False) + '\n')
+        for kind, record in records:
+            line = dict(record, type=kind)
+            file.write(json.dumps(line, ensure_ascii=False) + '\n')
+            counts[kind] += 1
+    return counts
+
+
+def write_csv(records, path):
+    """Пишет поток записей Calculate.iter_plan в CSV (колонки CSV_COLUMNS)"""
+    counts = {'building': 0, 'connection': 0}
+    with _text_output(path) as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        for kind, record in records:
+            writer.writerow(dict(record, type=kind))
+            counts[kind] += 1
+    return counts
+
+
+@contextmanager
+def _text_output(path):
+    """Открывает path для записи; уже открытый файл отдается как есть"""
+    if hasattr(path, 'write'):
+        yield path
+        return
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        yield file
+
+
+def read_jsonl(path):
+    """Читает файл write_jsonl по одной записи: пары (вид, запись) без заголовка"""
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            record = json.loads(line)
+            kind = record.pop('type')
+            if kind != 'plan':
+                yield kind, record
+
+
+# --- Чертеж без pyplot ---
+
+def write_svg(result, path, positions=None, labels=True):
+    """
+    Пишет чертеж плана в SVG напрямую, без matplotlib: элементы выводятся
+    по одному (связи, затем здания), строка SVG целиком в памяти не собирается.
+    positions - готовая раскладка (по умолчанию Layout.layered_positions).
+    labels=False - только блоки и стрелки (меньше файл).
+    path - путь или открытый текстовый файл. Возвращает {'building': n, 'connection': m}.
+    """
+    positions = _positions(result, positions)
+    bounds = plan_bounds(positions)
+    with _text_output(path) as file:
+        return _write_svg(file, result, positions, bounds, range(len(result['buildings'])),
+                          range(len(result['connections'])), labels)
+
+
+def write_svg_tiles(result, pattern, tile_size=TILE_SIZE, positions=None, labels=True):
+    """
+    Пишет чертеж плитками SVG по tile_size единиц раскладки. pattern - шаблон
+    пути с {row} и {col}, например 'plan_{row}_{col}.svg'. В плитку попадают
+    только пересекающие ее здания и связи. Пустые плитки не пишутся.
+    Возвращает список путей.
+    """
+    positions = _positions(result, positions)
+    bounds = plan_bounds(positions)
+    tiles = _tiles(bounds, tile_size)
+    building_tiles, connection_tiles = _bucket(result, positions, bounds, tile_size)
+    paths = []
+    for row, col, tile_bounds in tiles:
+        building_indices = building_tiles.get((row, col), ())
+        connection_indices = connection_tiles.get((row, col), ())
+        if not building_indices and not connection_indices:
+            continue
+        tile_path = pattern.format(row=row, col=col)
+        with _text_output(tile_path) as file:
+            _write_svg(file, result, positions, tile_bounds, building_indices,
+                       connection_indices, labels, title=row == 0)
+        paths.append(tile_path)
+    return paths
+
+
+def write_png(result, path, positions=None, scale=1.0, labels=True):
+    """
+    Растровый чертеж через Agg (matplotlib.figure без pyplot и без окна):
+    блоки и стрелки - по одной коллекции, подписи - на группу одинаковых зданий.
+    scale - пикселей на единицу раскладки; если картинка выходит больше
+    MAX_PNG_SIDE, масштаб уменьшается. Возвращает итоговый масштаб.
+    """
+    positions = _positions(result, positions)
+    bounds = plan_bounds(positions)
+    width = bounds[2] - bounds[0]
+    height = bounds[3] - bounds[1]
+    scale = min(scale, MAX_PNG_SIDE / max(width, height))
+    figure, ax = _raster_figure(result, positions, bounds, scale, labels)
+    _save_png(figure, ax, bounds, scale, path)
+    return scale
+
+
+def write_png_tiles(result, pattern, tile_size=TILE_SIZE, positions=None, scale=1.0, labels=True):
+    """
+    Растровый чертеж плитками по tile_size единиц раскладки (шаблон pattern
+    как в write_svg_tiles). Каждая плитка рисует только пересекающие ее здания
+    и связи. Пустые плитки не пишутся. Возвращает список путей.
+    """
+    positions = _positions(result, positions)
+    bounds = plan_bounds(positions)
+    building_tiles, connection_tiles = _bucket(result, positions, bounds, tile_size)
+    scale = min(scale, MAX_PNG_SIDE / tile_size)
+    paths = []
+    for row, col, tile_bounds in _tiles(bounds, tile_size):
+        building_indices = building_tiles.get((row, col), [])
+        connection_indices = connection_tiles.get((row, col), [])
+        if not building_indices and not connection_indices:
+            continue
+        tile_path = pattern.format(row=row, col=col)
+        figure, ax = _raster_figure(result, positions, bounds, scale, labels,
+                                    building_indices, connection_indices)
+        _save_png(figure, ax, tile_bounds, scale, tile_path)
+        paths.append(tile_path)
+    return paths
+
+
+def plan_bounds(positions):
+    """Границы чертежа (x0, y0, x1, y1) в координатах раскладки, с полями и заголовком"""
+    if not positions:
+        return (-500.0, -500.0, 500.0, 500.0)
+    x0 = y0 = math.inf
+    x1 = y1 = -math.inf
+    for pos in positions.values():
+        x0 = min(x0, pos['x'] - pos['width'] / 2)
+        x1 = max(x1, pos['x'] + pos['width'] / 2)
+        y0 = min(y0, pos['y'] - pos['height'] / 2)
+        y1 = max(y1, pos['y'] + pos['height'] / 2)
+    return (x0 - MARGIN, y0 - MARGIN, x1 + MARGIN, y1 + MARGIN + TITLE_HEIGHT)
+
+
+def _positions(result, positions):
+    if positions is None:
+        positions = Layout.layered_positions(result['buildings'], result['connections'])
+    return positions
+
+
+def _connection_ends(conn, positions):
+    """Концы стрелки связи (как в Draw.draw_connections) или None"""
+    from_pos = positions.get(conn['from'])
+    to_pos = positions.get(conn['to'])
+    if from_pos is None or to_pos is None:
+        return None
+    return (from_pos['x'], from_pos['y'] + from_pos['height'] / 2 + 5,
+            to_pos['x'], to_pos['y'] - to_pos['height'] / 2 - 20)
+
+
+def _tiles(bounds, tile_size):
+    """Плитки (ряд, колонка, границы) сверху вниз, слева направо"""
+    x0, y0, x1, y1 = bounds
+    columns = max(1, math.ceil((x1 - x0) / tile_size))
+    rows = max(1, math.ceil((y1 - y0) / tile_size))
+    for row in range(rows):
+        top = y1 - row * tile_size
+        for col in range(columns):
+            left = x0 + col * tile_size
+            yield row, col, (left, max(y0, top - tile_size), min(x1, left + tile_size), top)
+
+
+def _bucket(result, positions, bounds, tile_size):
+    """Индексы зданий и связей по плиткам: {(ряд, колонка): [индексы]}"""
+    x0, _, _, y1 = bounds
+
+    def cells(left, bottom, right, top):
+        for row in range(int((y1 - top) // tile_size), int((y1 - bottom) // tile_size) + 1):
+            for col in range(int((left - x0) // tile_size), int((right - x0) // tile_size) + 1):
+                yield row, col
+
+    building_tiles = {}
+    for index, b in enumerate(result['buildings']):
+        pos = positions[b['id']]
+        # Подпись выхода - под блоком
+        for cell in cells(pos['x'] - pos['width'] / 2, pos['y'] - pos['height'] / 2 - 40,
+                          pos['x'] + pos['width'] / 2, pos['y'] + pos['height'] / 2):
+            building_tiles.setdefault(cell, []).append(index)
+    connection_tiles = {}
+    for index, conn in enumerate(result['connections']):
+        ends = _connection_ends(conn, positions)
+        if ends is None:
+            continue
+        xa, ya, xb, yb = ends
+        for cell in cells(min(xa, xb), min(ya, yb), max(xa, xb), max(ya, yb)):
+            connection_tiles.setdefault(cell, []).append(index)
+    return building_tiles, connection_tiles
+
+
+def _write_svg(file, result, positions, bounds, building_indices, connection_indices,
+               labels, title=True):
+    """Пишет документ SVG для области bounds: заголовок, связи, здания"""
+    x0, y0, x1, y1 = bounds
+    width = x1 - x0
+    height = y1 - y0
+    # В SVG ось y направлена вниз: y раскладки переворачивается (-y)
+    file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+               f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" '
+               f'viewBox="{x0:.1f} {-y1:.1f} {width:.1f} {height:.1f}">\n')
+    file.write('<style>\n'
+               f'.l{{stroke:{COLORS["text"]};stroke-width:1.5;stroke-opacity:.8;marker-end:url(#a)}}\n'
+               '.s{fill:#000;fill-opacity:.3}\n'
+               f'.b{{stroke:{COLORS["text"]};stroke-width:2}}\n')
+    for name, color in BUILDING_COLORS.items():
+        file.write(f'.{_COLOR_CLASS[name]}{{fill:{color}}}\n')
+    file.write(f'text{{font-family:"DejaVu Sans",sans-serif;font-weight:bold;fill:{COLORS["text"]};'
+               'text-anchor:middle;dominant-baseline:central;paint-order:stroke;stroke:#000;stroke-width:3px}\n'
+               '.n{font-size:15px}.t{font-size:13px}.o{font-size:14px;fill:' + COLORS['accent'] + '}'
+               '.a{font-size:13px;text-anchor:start;stroke:none}.h{font-size:32px;stroke:none}\n'
+               '</style>\n'
+               '<defs><marker id="a" viewBox="0 0 10 8" refX="10" refY="4" markerWidth="12" '
+               'markerHeight="10" orient="auto" markerUnits="userSpaceOnUse">'
+               f'<path d="M0,0L10,4L0,8z" fill="{COLORS["text"]}" fill-opacity=".8"/></marker></defs>\n'
+               f'<rect x="{x0:.1f}" y="{-y1:.1f}" width="{width:.1f}" height="{height:.1f}" '
+               f'fill="{COLORS["bg"]}"/>\n')
+    if title:
+        file.write(f'<text class="h" x="{(x0 + x1) / 2:.1f}" y="{-y1 + TITLE_HEIGHT / 2:.1f}">'
+                   f'{escape(plan_title(result))}</text>\n')
+
+    counts = {'building': 0, 'connection': 0}
+    connections = result['connections']
+    file.write('<g>\n')
+    for index in connection_indices:
+        conn = connections[index]
+        ends = _connection_ends(conn, positions)
+        if ends is None:
+            continue
+        xa, ya, xb, yb = ends
+        file.write(f'<line class="l" x1="{xa:.1f}" y1="{-ya:.1f}" x2="{xb:.1f}" y2="{-yb:.1f}"/>\n')
+        amount = conn.get('amount', 0)
+        if labels and amount > 0:
+            file.write(f'<text class="a" x="{(xa + xb) / 2 + 8:.1f}" y="{-(ya + yb) / 2:.1f}">'
+                       f'{amount:.1f}</text>\n')
+        counts['connection'] += 1
+    file.write('</g>\n<g>\n')
+
+    buildings = result['buildings']
+    for index in building_indices:
+        building = buildings[index]
+        file.write(_svg_building(building, positions[building['id']], labels))
+        counts['building'] += 1
+    file.write('</g>\n</svg>\n')
+    return counts
+
+
+def _svg_building(building, pos, labels):
+    """Блок здания с тенью и подписями (как в Draw.draw_buildings)"""
+    x, y = pos['x'], pos['y']
+    w, h = pos['width'], pos['height']
+    building_type = building.get('building', 'default')
+    color_class = _COLOR_CLASS.get(building_type, _COLOR_CLASS['default'])
+    parts = [f'<rect class="s" x="{x - w / 2 + 3:.1f}" y="{-y - h / 2 + 3:.1f}" width="{w:.1f}" height="{h:.1f}"/>'
+             f'<rect class="b {color_class}" x="{x - w / 2:.1f}" y="{-y - h / 2:.1f}" width="{w:.1f}" height="{h:.1f}"/>']
+    if labels:
+        max_chars = int(w / 9)
+        lines = wrap_text(building['name'], max_chars).split('\n')
+        name_y = -y - (30 if len(lines) == 1 else 35)
+        spans = ''.join(f'<tspan x="{x:.1f}" dy="{0 if i == 0 else 17}">{escape(line)}</tspan>'
+                        for i, line in enumerate(lines))
+        parts.append(f'<text class="n" x="{x:.1f}" y="{name_y:.1f}">{spans}</text>')
+        parts.append(f'<text class="t" x="{x:.1f}" y="{-y:.1f}">'
+                     f'{escape(truncate_text(building_type, max_chars))}</text>')
+        total = building.get('total_buildings', 1)
+        if total > 1:
+            parts.append(f'<text class="t" x="{x:.1f}" y="{-y + 28:.1f}">'
+                         f'#{building.get("building_num", 1)}/{total}</text>')
+        output = building.get('output', 0)
+        if output > 0:
+            parts.append(f'<text class="o" x="{x:.1f}" y="{-y + h / 2 + 22:.1f}">{output:.1f}/мин</text>')
+    return ''.join(parts) + '\n'
+
+
+def _raster_figure(result, positions, bounds, scale, labels,
+                   building_indices=None, connection_indices=None):
+    """
+    Сцена для Agg: фигура с осями на весь холст, блоки и связи коллекциями.
+    Подписи - одна на группу соседних одинаковых зданий (Layout.group_runs),
+    если блок на картинке не уже PNG_LABEL_PIXELS.
+    building_indices / connection_indices - рисовать только эти элементы (плитка).
+    """
+    import numpy as np
+    import matplotlib.patheffects as path_effects
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection, PolyCollection
+    from matplotlib.figure import Figure
+
+    figure = Figure(dpi=72, facecolor=COLORS['bg'])
+    FigureCanvasAgg(figure)
+    ax = figure.add_axes((0, 0, 1, 1))
+    ax.set_axis_off()
+    ax.set_facecolor(COLORS['bg'])
+    ax.text((bounds[0] + bounds[2]) / 2, bounds[3] - TITLE_HEIGHT / 2, plan_title(result),
+            ha='center', va='center', fontsize=32 * scale, color=COLORS['text'], fontweight='bold')
+
+    buildings = result['buildings']
+    connections = result['connections']
+    if building_indices is not None:
+        buildings = [buildings[i] for i in building_indices]
+    if connection_indices is not None:
+        connections = [connections[i] for i in connection_indices]
+    segments = [ends for ends in (_connection_ends(conn, positions) for conn in connections)
+                if ends is not None]
+    if segments:
+        segments = np.array(segments, dtype=float).reshape(-1, 2, 2)
+        start, end = segments[:, 0], segments[:, 1]
+        direction = end - start
+        length = np.hypot(direction[:, 0], direction[:, 1])
+        direction /= np.where(length > 0, length, 1)[:, None]
+        normal = np.stack([-direction[:, 1], direction[:, 0]], 1)
+        base = end - direction * 18
+        heads = np.stack([end, base + normal * 7, base - normal * 7], 1)
+        ax.add_collection(LineCollection(segments, colors=COLORS['text'],
+                                         linewidths=max(0.5, 1.5 * scale), alpha=0.8))
+        ax.add_collection(PolyCollection(heads, facecolors=COLORS['text'], edgecolors='none', alpha=0.8))
+
+    if buildings:
+        boxes = np.array([(positions[b['id']]['x'], positions[b['id']]['y'],
+                           positions[b['id']]['width'], positions[b['id']]['height'])
+                          for b in buildings], dtype=float)
+        x0 = boxes[:, 0] - boxes[:, 2] / 2
+        x1 = boxes[:, 0] + boxes[:, 2] / 2
+        y0 = boxes[:, 1] - boxes[:, 3] / 2
+        y1 = boxes[:, 1] + boxes[:, 3] / 2
+        blocks = np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1),
+                           np.stack([x1, y1], 1), np.stack([x0, y1], 1)], 1)
+        colors = [BUILDING_COLORS.get(b.get('building', 'default'), BUILDING_COLORS['default'])
+                  for b in buildings]
+        ax.add_collection(PolyCollection(blocks, facecolors=colors, edgecolors=COLORS['text'],
+                                         linewidths=max(0.5, 2 * scale)))
+
+    if labels and buildings and Layout.BLOCK_WIDTH * scale >= PNG_LABEL_PIXELS:
+        outline = [path_effects.withStroke(linewidth=3, foreground='black')]
+        for members in Layout.group_runs(buildings):
+            group = [positions[buildings[i]['id']] for i in members]
+            first = buildings[members[0]]
+            left = min(p['x'] - p['width'] / 2 for p in group)
+            right = max(p['x'] + p['width'] / 2 for p in group)
+            top = max(p['y'] for p in group)
+            bottom = min(p['y'] - p['height'] / 2 for p in group)
+            max_chars = int((right - left) / 9)
+            title = truncate_text(first['name'], max_chars)
+            if len(members) > 1:
+                title += f" ×{len(members)}"
+            ax.text((left + right) / 2, top + 10,
+                    f"{title}\n{truncate_text(first.get('building', 'default'), max_chars)}",
+                    ha='center', va='center', fontsize=14 * scale, color=COLORS['text'],
+                    fontweight='bold', linespacing=1.6, path_effects=outline)
+            output = sum(buildings[i].get('output', 0) for i in members)
+            if output > 0:
+                ax.text((left + right) / 2, bottom - 15, f"{output:.1f}/мин", ha='center', va='top',
+                        fontsize=14 * scale, color=COLORS['accent'], fontweight='bold',
+                        path_effects=outline)
+    return figure, ax
+
+
+def _save_png(figure, ax, bounds, scale, path):
+    """Сохраняет область bounds сцены _raster_figure в PNG с масштабом scale"""
+    x0, y0, x1, y1 = bounds
+    figure.set_size_inches(max(1.0, (x1 - x0) * scale) / figure.dpi,
+                           max(1.0, (y1 - y0) * scale) / figure.dpi)
+    ax.set_xlim(x0, x1)
+    ax.set_ylim(y0, y1)
+    figure.savefig(path, facecolor=COLORS['bg'], pil_kwargs={'compress_level': PNG_COMPRESS_LEVEL})
@@ -0,0 +1,283 @@
+import Recipes
+from Calculate import (aggregate_demand, building_record, buildings_needed, cycle_message,
+                       link_buildings)
+
+
+class SolvedPlan:
+    """
+    Рассчитанный план (режим 'dag'), который можно обновлять по частям.
+    update_rate и update_recipe пересчитывают только затронутую часть графа:
+    измененный предмет и его ингредиенты. Остальные здания и связи
+    не трогаются, а каждое обновление возвращает разницу (delta).
+    """
+
+    def __init__(self, targets, recipes=None):
+        # Собственная копия базы: правки рецептов не меняют общий RecipeBook
+        self.recipes = dict(Recipes.as_dict(recipes))
+        self.targets = dict(targets)
+
+        self.demand = {}      # предмет -> выход в минуту
+        self.level = {}       # предмет -> уровень
+        self.edges = {}       # потребитель -> {ингредиент: количество в минуту}
+        self.consumers = {}   # ингредиент -> множество потребителей
+        self.groups = {}      # предмет -> список id его зданий
+        self.buildings = {}   # id -> словарь здания
+        self.links = {}       # (потребитель, ингредиент) -> список связей
+        self._next_id = 0
+
+        order, demand, level, edges = aggregate_demand(self.recipes, self.targets)
+        self.demand = demand
+        self.level = level
+        for consumer, ingredient, amount in edges:
+            self.edges.setdefault(consumer, {})[ingredient] = amount
+            self.consumers.setdefault(ingredient, set()).add(consumer)
+
+        delta = _new_delta()
+        for item in order:
+            self._sync_group(item, delta)
+        for consumer, ingredients in self.edges.items():
+            for ingredient in ingredients:
+                self._sync_link(consumer, ingredient, delta, relink=True)
+
+    # --- Обновления ---
+
+    def update_rate(self, new_rate, target=None):
+        """
+        Меняет выход цели (единственной, если target не указан).
+        Возвращает разницу зданий и связей.
+        """
+        if target is None:
+            if len(self.targets) != 1:
+                raise ValueError("Укажите цель: в плане несколько целей")
+            target = next(iter(self.targets))
+        if target not in self.recipes:
+            raise ValueError(f"Рецепт не найден: {target}")
+        if new_rate > 0:
+            self.targets[target] = new_rate
+        else:
+            self.targets.pop(target, None)
+        return self._recompute([target])
+
+    def update_recipe(self, name, data=None):
+        """
+        Заменяет рецепт предмета name (None - предмет становится базовым ресурсом).
+        Пересчитываются только сам предмет и его ингредиенты.
+        Возвращает разницу зданий и связей.
+        """
+        old_data = self.recipes.get(name)
+        if data is None:
+            self.recipes.pop(name, None)
+        else:
+            self.recipes[name] = data
+        roots = [name]
+        if old_data is not None:
+            roots.extend(old_data['ingredients'])
+        try:
+            return self._recompute(roots)
+        except ValueError:
+            # Правка создала цикл - возвращаем рецепт как был
+            if old_data is None:
+                self.recipes.pop(name, None)
+            else:
+                self.recipes[name] = old_data
+            raise
+
+    # --- Результат ---
+
+    def result(self):
+        """План в формате calculate()"""
+        connections = []
+        for records in self.links.values():
+            connections.extend(records)
+        return {
+            'target_recipe': ', '.join(self.targets),
+            'target_output': sum(self.targets.values()),
+            'targets': dict(self.targets),
+            'buildings': [self.buildings[b_id] for b_id in sorted(self.buildings)],
+            'connections': connections
+        }
+
+    # --- Внутреннее ---
+
+    def _affected(self, roots):
+        """
+        Затронутые предметы: roots и все их ингредиенты (по новой базе),
+        в топологическом порядке. При цикле выбрасывает ValueError.
+        """
+        affected = set()
+        stack = [item for item in roots if item in self.demand or item in self.targets]
+        while stack:
+            item = stack.pop()
+            if item in affected:
+                continue
+            affected.add(item)
+            if item in self.recipes:
+                stack.extend(self.recipes[item]['ingredients'])
+
+        # Алгоритм Кана только по затронутой части. Учитываем и старые ребра:
+        # ингредиент, из рецепта которого убрали потребителя, ждет его пересчета.
+        def dependencies(item):
+            deps = set(self.edges.get(item, ()))
+            if item in self.recipes:
+                deps.update(self.recipes[item]['ingredients'])
+            return deps
+
+        waiting = dict.fromkeys(affected, 0)
+        for item in affected:
+            for ingredient in dependencies(item):
+                if ingredient in waiting:
+                    waiting[ingredient] += 1
+        ready = [item for item, count in waiting.items() if count == 0]
+        order = []
+        while ready:
+            item = ready.pop()
+            order.append(item)
+            for ingredient in dependencies(item):
+                if ingredient in waiting:
+                    waiting[ingredient] -= 1
+                    if waiting[ingredient] == 0:
+                        ready.append(ingredient)
+        if len(order) != len(affected):
+            cyclic = [item for item, count in waiting.items() if count > 0]
+            raise ValueError(cycle_message(self.recipes, cyclic))
+        return order
+
+    def _recompute(self, roots):
+        """Пересчитывает потребность, уровни, здания и связи затронутой части"""
+        order = self._affected(roots)
+        delta = _new_delta()
+        relinked = set()
+        dropped = []
+
+        for item in order:
+            consumers = self.consumers.get(item, set())
+            demand = self.targets.get(item, 0) + sum(self.edges[c][item] for c in consumers)
+            if demand <= 0 and item not in self.targets:
+                dropped.append(item)
+                demand = 0
+            self.demand[item] = demand
+            self.level[item] = max((self.level[c] + 1 for c in consumers), default=0)
+
+            # Новые ребра от предмета к его ингредиентам
+            old_edges = self.edges.pop(item, {})
+            new_edges = {}
+            if demand > 0 and item in self.recipes:
+                recipe_data = self.recipes[item]
+                cycles_needed = demand / recipe_data['output']
+                for ingredient, amount in recipe_data['ingredients'].items():
+                    new_edges[ingredient] = cycles_needed * amount
+            for ingredient in old_edges:
+                if ingredient not in new_edges:
+                    self.consumers[ingredient].discard(item)
+                    self._remove_link(item, ingredient, delta)
+            for ingredient in new_edges:
+                self.consumers.setdefault(ingredient, set()).add(item)
+            if new_edges:
+                self.edges[item] = new_edges
+
+            if demand > 0 and self._sync_group(item, delta):
+                relinked.add(item)
+
+        for item in dropped:
+            self._remove_group(item, delta)
+
+        # Связи затронутых потребителей и связи к перестроенным группам
+        for item in order:
+            for ingredient in self.edges.get(item, {}):
+                self._sync_link(item, ingredient, delta,
+                                relink=item in relinked or ingredient in relinked)
+        for item in relinked:
+            for consumer in self.consumers.get(item, ()):
+                if consumer not in self.demand or consumer in order:
+                    continue
+                self._sync_link(consumer, item, delta, relink=True)
+        return delta
+
+    def _sync_group(self, item, delta):
+        """
+        Приводит здания предмета к текущей потребности.
+        Возвращает True, если изменился набор id зданий.
+        """
+        demand = self.demand[item]
+        ids = self.groups.setdefault(item, [])
+        if item in self.recipes:
+            recipe_data = self.recipes[item]
+            count = buildings_needed(demand / recipe_data['output'])
+            building_type = recipe_data['building']
+            is_source = False
+        else:
+            count = 1
+            building_type = 'Источник'
+            is_source = True
+
+        if ids and self.buildings[ids[0]]['is_source'] != is_source:
+            # Предмет стал (или перестал быть) базовым ресурсом
+            while ids:
+                delta['buildings']['removed'].append(ids[-1])
+                del self.buildings[ids.pop()]
+        changed_ids = len(ids) != count
+
+        while len(ids) > count:
+            b_id = ids.pop()
+            del self.buildings[b_id]
+            delta['buildings']['removed'].append(b_id)
+        for i, b_id in enumerate(ids):
+            record = self.buildings[b_id]
+            new_record = building_record(b_id, item, building_type, self.level[item],
+                                          demand / count, i, count, is_source)
+            if record != new_record:
+                self.buildings[b_id] = new_record
+                delta['buildings']['changed'].append(new_record)
+        while len(ids) < count:
+            b_id = self._next_id
+            self._next_id += 1
+            record = building_record(b_id, item, building_type, self.level[item],
+                                      demand / count, len(ids), count, is_source)
+            ids.append(b_id)
+            self.buildings[b_id] = record
+            delta['buildings']['added'].append(record)
+        return changed_ids
+
+    def _remove_group(self, item, delta):
+        """Удаляет предмет, который больше никому не нужен"""
+        for b_id in self.groups.pop(item, []):
+            del self.buildings[b_id]
+            delta['buildings']['removed'].append(b_id)
+        for ingredient in self.edges.pop(item, {}):
+            self.consumers[ingredient].discard(item)
+            self._remove_link(item, ingredient, delta)
+        self.demand.pop(item, None)
+        self.level.pop(item, None)
+        if not self.consumers.get(item):
+            self.consumers.pop(item, None)
+
+    def _sync_link(self, consumer, ingredient, delta, relink=False):
+        """Обновляет связи ребра; relink - перестроить заново (изменились группы)"""
+        key = (consumer, ingredient)
+        amount = self.edges[consumer][ingredient]
+        old = self.links.get(key)
+        if relink or old is None:
+            self._remove_link(consumer, ingredient, delta)
+            new = link_buildings(self.groups[ingredient], self.groups[consumer],
+                                 ingredient, amount)
+            self.links[key] = new
+            delta['connections']['added'].extend(new)
+            return
+        per_link = amount / len(old)
+        for conn in old:
+            if conn['amount'] != per_link:
+                conn['amount'] = per_link
+                delta['connections']['changed'].append(conn)
+
+    def _remove_link(self, consumer, ingredient, delta):
+        old = self.links.pop((consumer, ingredient), None)
+        if old:
+            delta['connections']['removed'].extend(old)
+
+
+def _new_delta():
+    """Пустая разница: добавленные, удаленные и измененные здания и связи"""
+    return {
+        'buildings': {'added': [], 'removed': [], 'changed': []},
+        'connections': {'added': [], 'removed': [], 'changed': []}
+    }
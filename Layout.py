@@ -0,0 +1,251 @@
+import hashlib
+import math
+from array import array
+from collections import OrderedDict
+
+
+# Размеры блока и отступы (как в Draw.calculate_positions)
+BLOCK_WIDTH = 130
+BLOCK_HEIGHT = 100
+H_SPACING = 50       # Между зданиями одной группы
+GROUP_SPACING = 100  # Между группами на уровне
+V_SPACING = 80       # Между уровнями (от низа блока до верха следующего)
+ROW_SPACING = 60     # Между рядами одной группы (место для подписи выхода)
+
+# Больше зданий в ряд группа не ставит: остальные переносятся в следующие ряды
+MAX_COLUMNS = 12
+
+# Проходы упорядочивания по барицентрам (вниз и вверх по очереди)
+SWEEPS = 4
+
+# Сколько раскладок хранить в кеше
+CACHE_SIZE = 16
+
+_cache = OrderedDict()
+
+
+def layered_positions(buildings, connections):
+    """
+    Послойная раскладка (в духе Сугиямы) с уменьшением пересечений связей.
+    Слои - уровни зданий; длинные связи проходят через фиктивные узлы.
+    Упорядочиваются группы соседних одинаковых зданий (барицентры соседей),
+    затем здания внутри групп; большие группы переносятся на несколько рядов.
+    Время почти линейно по числу зданий и связей.
+    Возвращает словарь позиций в формате Draw.calculate_positions.
+    Результат кешируется по структуре графа; словарь общий - не изменять.
+    """
+    key = structure_key(buildings, connections)
+    positions = _cache.get(key)
+    if positions is not None:
+        _cache.move_to_end(key)
+        return positions
+    positions = _layout(buildings, connections)
+    _cache[key] = positions
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return positions
+
+
+def structure_key(buildings, connections):
+    """Хеш структуры плана: здания (id, название, уровень) и связи (откуда, куда)"""
+    digest = hashlib.sha256()
+    digest.update('\x1e'.join(f"{b['id']}\x1f{b['name']}\x1f{b['level']}"
+                              for b in buildings).encode('utf-8'))
+    digest.update(b'\x1d')
+    ends = array('q')
+    for conn in connections:
+        ends.append(conn['from'])
+        ends.append(conn['to'])
+    digest.update(ends.tobytes())
+    return digest.digest()
+
+
+def clear_cache():
+    _cache.clear()
+
+
+def group_runs(buildings):
+    """
+    Группы соседних зданий одного рецепта на одном уровне (как их выдает расчет).
+    Возвращает список групп - списков индексов зданий.
+    """
+    groups = []
+    last_key = None
+    for index, b in enumerate(buildings):
+        key = (b['level'], b['name'])
+        if key == last_key and len(groups[-1]) < b.get('total_buildings', 1):
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+            last_key = key
+    return groups
+
+
+def _layout(buildings, connections):
+    if not buildings:
+        return {}
+    groups = group_runs(buildings)
+    index_of = {b['id']: i for i, b in enumerate(buildings)}
+    group_of = [0] * len(buildings)
+    for g, members in enumerate(groups):
+        for i in members:
+            group_of[i] = g
+    group_level = [buildings[members[0]]['level'] for members in groups]
+
+    # Связи между зданиями (индексы) и между группами (с числом связей)
+    consumers_of = [[] for _ in buildings]
+    group_edges = {}
+    for conn in connections:
+        source = index_of.get(conn['from'])
+        target = index_of.get(conn['to'])
+        if source is None or target is None:
+            continue
+        consumers_of[source].append(target)
+        edge = (group_of[source], group_of[target])
+        group_edges[edge] = group_edges.get(edge, 0) + 1
+
+    order = _order_groups(groups, group_level, group_edges)
+    return _assign_coordinates(buildings, groups, group_level, group_edges, order, consumers_of)
+
+
+def _order_groups(groups, group_level, group_edges):
+    """
+    Порядок групп на каждом уровне: барицентрический метод с фиктивными узлами
+    для связей через несколько уровней. Возвращает {уровень: [группы]}.
+    """
+    node_level = list(group_level)
+    up = [[] for _ in groups]     # Соседи уровнем выше (потребители): (узел, вес)
+    down = [[] for _ in groups]   # Соседи уровнем ниже (ингредиенты)
+
+    def add_node(level):
+        node_level.append(level)
+        up.append([])
+        down.append([])
+        return len(node_level) - 1
+
+    for (source, target), weight in group_edges.items():
+        if group_level[source] <= group_level[target]:
+            continue  # Связь не вниз по уровням - в порядке не участвует
+        lower = source
+        for level in range(group_level[source] - 1, group_level[target], -1):
+            dummy = add_node(level)
+            up[lower].append((dummy, weight))
+            down[dummy].append((lower, weight))
+            lower = dummy
+        up[lower].append((target, weight))
+        down[target].append((lower, weight))
+
+    layers = {}
+    for node, level in enumerate(node_level):
+        layers.setdefault(level, []).append(node)
+    levels = sorted(layers)
+    position = [0.0] * len(node_level)
+    for nodes in layers.values():
+        for i, node in enumerate(nodes):
+            position[node] = i
+
+    def sweep(level_order, neighbours):
+        for level in level_order:
+            nodes = layers[level]
+            keys = {}
+            for node in nodes:
+                total = 0.0
+                weight = 0
+                for other, w in neighbours[node]:
+                    total += position[other] * w
+                    weight += w
+                keys[node] = total / weight if weight else position[node]
+            nodes.sort(key=keys.__getitem__)
+            for i, node in enumerate(nodes):
+                position[node] = i
+
+    for i in range(SWEEPS):
+        if i % 2 == 0:
+            sweep(levels[1:], up)
+        else:
+            sweep(levels[-2::-1], down)
+
+    real = len(groups)
+    return {level: [node for node in nodes if node < real] for level, nodes in layers.items()}
+
+
+def _assign_coordinates(buildings, groups, group_level, group_edges, order, consumers_of):
+    """
+    Координаты: уровни сверху вниз, группа стремится встать под своими
+    потребителями (средневзвешенный x), затем наложения убираются одним
+    проходом слева направо и уровень сдвигается к желаемым позициям.
+    """
+    consumers = [[] for _ in groups]
+    for (source, target), weight in group_edges.items():
+        if group_level[source] > group_level[target]:
+            consumers[source].append((target, weight))
+
+    columns = [min(len(members), MAX_COLUMNS) for members in groups]
+    rows = [math.ceil(len(members) / MAX_COLUMNS) for members in groups]
+    width = [c * BLOCK_WIDTH + (c - 1) * H_SPACING for c in columns]
+    height = [r * BLOCK_HEIGHT + (r - 1) * ROW_SPACING for r in rows]
+
+    # Верх каждого уровня: уровень 0 сверху, высота уровня - самая высокая группа
+    levels = sorted(order)
+    top = {}
+    y = 0.0
+    for level in levels:
+        top[level] = y
+        y -= max(height[g] for g in order[level]) + V_SPACING
+
+    center = [0.0] * len(groups)
+    building_x = [0.0] * len(buildings)
+    positions = {}
+    for level in levels:
+        nodes = order[level]
+        desired = []
+        for g in nodes:
+            total = 0.0
+            weight = 0
+            for other, w in consumers[g]:
+                total += center[other] * w
+                weight += w
+            desired.append(total / weight if weight else None)
+
+        # Слева направо без наложений
+        placed = []
+        right = -math.inf
+        for g, want in zip(nodes, desired):
+            half = width[g] / 2
+            if want is None:
+                want = right + GROUP_SPACING + half if right > -math.inf else 0.0
+            x = max(want, right + GROUP_SPACING + half)
+            placed.append(x)
+            right = x + half
+
+        # Общий сдвиг к желаемым позициям (наложений не создает)
+        offsets = [want - x for want, x in zip(desired, placed) if want is not None]
+        if offsets:
+            shift = sum(offsets) / len(offsets)
+        else:
+            shift = -(placed[0] - width[nodes[0]] / 2 + right) / 2
+        for g, x in zip(nodes, placed):
+            center[g] = x + shift
+
+        # Здания группы: по среднему x их потребителей, по рядам
+        for g in nodes:
+            members = groups[g]
+            keys = {}
+            for i in members:
+                targets = consumers_of[i]
+                keys[i] = (sum(building_x[t] for t in targets) / len(targets)
+                           if targets else 0.0)
+            members = sorted(members, key=keys.__getitem__)
+            left = center[g] - width[g] / 2
+            for k, i in enumerate(members):
+                column = k % columns[g]
+                row = k // columns[g]
+                x = left + column * (BLOCK_WIDTH + H_SPACING) + BLOCK_WIDTH / 2
+                building_x[i] = x
+                positions[buildings[i]['id']] = {
+                    'x': x,
+                    'y': top[level] - row * (BLOCK_HEIGHT + ROW_SPACING) - BLOCK_HEIGHT / 2,
+                    'width': BLOCK_WIDTH,
+                    'height': BLOCK_HEIGHT
+                }
+    return positions
@@ -1,451 +1,730 @@
-import math
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-import tkinter as tk
-from tkinter import ttk
-import json
-import Calculate
-import Draw
-
-
-class WindowManager:
-    """Класс для управления окнами и навигацией"""
-    
-    def __init__(self):
-        # Цветовая схема
-        self.colors = {
-            'bg_main': '#2C3E50',      # Темно-синий фон
-            'bg_secondary': '#34495E',  # Светлее для элементов
-            'bg_button': '#3498DB',     # Синий для кнопок
-            'bg_button_hover': '#2980B9', # Темнее при наведении
-            'text_primary': '#ECF0F1',   # Светлый текст
-            'text_secondary': '#BDC3C7', # Серый текст
-            'accent': '#E74C3C',        # Красный акцент
-            'success': '#27AE60'        # Зеленый для успеха
-        }
-        
-        # Шрифты
-        self.fonts = {
-            'title': ('Arial', 18, 'bold'),
-            'heading': ('Arial', 14, 'bold'),
-            'normal': ('Arial', 11),
-            'small': ('Arial', 9)
-        }
-        
-        self.root = None
-        self.current_window = None
-        
-    def create_main_window(self):
-        """Создает главное окно приложения"""
-        self.root = tk.Tk()
-        self.root.geometry('350x250+1000+400')
-        self.root['bg'] = self.colors['bg_main']
-        self.root.title('Sat2v - Калькулятор Satisfactory')
-        self.root.resizable(False, False)
-        
-        # Заголовок
-        title_label = tk.Label(
-            self.root, 
-            text='Sat2v Calculator', 
-            font=self.fonts['title'],
-            bg=self.colors['bg_main'],
-            fg=self.colors['text_primary']
-        )
-        title_label.pack(pady=(20, 15))
-        
-        # Кнопки меню
-        button_frame = tk.Frame(self.root, bg=self.colors['bg_main'])
-        button_frame.pack(pady=15)
-        
-        self.create_styled_button(
-            button_frame, 
-            'Старт', 
-            self.show_calculator_window,
-            width=22
-        ).pack(pady=6)
-        
-        self.create_styled_button(
-            button_frame, 
-            'Рецепты', 
-            self.show_recipes_window,
-            width=22
-        ).pack(pady=6)
-        
-        self.create_styled_button(
-            button_frame, 
-            'Настройки', 
-            self.show_settings_window,
-            width=22
-        ).pack(pady=6)
-        
-        self.current_window = self.root
-        return self.root
-    
-    def create_styled_button(self, parent, text, command, width=15, height=1):
-        """Создает стилизованную кнопку"""
-        btn = tk.Button(
-            parent,
-            text=text,
-            command=command,
-            font=self.fonts['normal'],
-            bg=self.colors['bg_button'],
-            fg=self.colors['text_primary'],
-            activebackground=self.colors['bg_button_hover'],
-            activeforeground=self.colors['text_primary'],
-            relief=tk.RAISED,
-            bd=2,
-            width=width,
-            height=height,
-            cursor='hand2'
-        )
-        return btn
-    
-    def create_back_button(self, window, callback):
-        """Создает кнопку Назад"""
-        back_btn = tk.Button(
-            window,
-            text='← Назад',
-            command=callback,
-            font=self.fonts['small'],
-            bg=self.colors['bg_secondary'],
-            fg=self.colors['text_primary'],
-            activebackground=self.colors['bg_button'],
-            activeforeground=self.colors['text_primary'],
-            relief=tk.FLAT,
-            bd=1,
-            cursor='hand2',
-            padx=10,
-            pady=5
-        )
-        return back_btn
-    
-    def show_calculator_window(self):
-        """Показывает окно калькулятора"""
-        if self.current_window and self.current_window != self.root:
-            self.current_window.destroy()
-        
-        calc_window = tk.Toplevel(self.root)
-        calc_window.geometry('350x380+100+100')
-        calc_window['bg'] = self.colors['bg_main']
-        calc_window.title('Калькулятор')
-        calc_window.resizable(False, False)
-        
-        # Кнопка Назад
-        back_btn = self.create_back_button(calc_window, lambda: self.close_window(calc_window))
-        back_btn.pack(anchor='nw', padx=10, pady=10)
-        
-        # Заголовок
-        title = tk.Label(
-            calc_window,
-            text='Расчет производства',
-            font=self.fonts['heading'],
-            bg=self.colors['bg_main'],
-            fg=self.colors['text_primary']
-        )
-        title.pack(pady=(0, 20))
-        
-        # Форма
-        form_frame = tk.Frame(calc_window, bg=self.colors['bg_main'])
-        form_frame.pack(pady=10)
-        
-        # Выбор рецепта
-        recipe_label = tk.Label(
-            form_frame,
-            text='Рецепт:',
-            font=self.fonts['normal'],
-            bg=self.colors['bg_main'],
-            fg=self.colors['text_primary']
-        )
-        recipe_label.pack(pady=5)
-        
-        recipes_list = ['ротор', 'винт', 'железный прут', 'железный слиток']
-        recipe_combo = ttk.Combobox(
-            form_frame,
-            values=recipes_list,
-            font=self.fonts['normal'],
-            state='readonly',
-            width=20
-        )
-        recipe_combo.pack(pady=5)
-        recipe_combo.current(0)
-        
-        # Выход в минуту
-        output_label = tk.Label(
-            form_frame,
-            text='Выход в минуту:',
-            font=self.fonts['normal'],
-            bg=self.colors['bg_main'],
-            fg=self.colors['text_primary']
-        )
-        output_label.pack(pady=(15, 5))
-        
-        output_entry = tk.Entry(
-            form_frame,
-            justify=tk.CENTER,
-            font=self.fonts['normal'],
-            width=15,
-            bg=self.colors['bg_secondary'],
-            fg=self.colors['text_primary'],
-            insertbackground=self.colors['text_primary'],
-            relief=tk.SUNKEN,
-            bd=2
-        )
-        output_entry.pack(pady=5)
-        output_entry.insert(0, '60')
-        
-        # Кнопка расчета
-        def calculate():
-            try:
-                recipe = recipe_combo.get()
-                output = int(output_entry.get())
-                if output <= 0:
-                    raise ValueError("Выход должен быть положительным числом")
-                
-                # Выполняем расчет
-                result = Calculate.calculate(recipe, output)
-                
-                if result:
-                    error_label.config(text="Расчет выполнен! Открывается чертеж...", fg=self.colors['success'])
-                    calc_window.update()
-                    
-                    # Визуализируем результат
-                    Draw.draw(result, show=True)
-                else:
-                    error_label.config(text="Ошибка: рецепт не найден", fg=self.colors['accent'])
-                    
-            except ValueError as e:
-                error_label.config(text=f"Ошибка: введите число", fg=self.colors['accent'])
-            except Exception as e:
-                error_label.config(text=f"Ошибка: {str(e)}", fg=self.colors['accent'])
-        
-        calc_btn = self.create_styled_button(
-            form_frame,
-            'Рассчитать',
-            calculate,
-            width=18
-        )
-        calc_btn.pack(pady=15)
-        
-        # Метка для ошибок
-        error_label = tk.Label(
-            form_frame,
-            text='',
-            font=self.fonts['small'],
-            bg=self.colors['bg_main'],
-            fg=self.colors['accent']
-        )
-        error_label.pack(pady=5)
-        
-        self.current_window = calc_window
-        calc_window.transient(self.root)
-        calc_window.grab_set()
-    
-    def show_recipes_window(self):
-        """Показывает окно рецептов"""
-        if self.current_window and self.current_window != self.root:
-            self.current_window.destroy()
-        
-        recipes_window = tk.Toplevel(self.root)
-        recipes_window.geometry('600x500+100+100')
-        recipes_window['bg'] = self.colors['bg_main']
-        recipes_window.title('Рецепты')
-        recipes_window.resizable(False, False)
-        
-        # Кнопка Назад
-        back_btn = self.create_back_button(recipes_window, lambda: self.close_window(recipes_window))
-        back_btn.pack(anchor='nw', padx=10, pady=10)
-        
-        # Заголовок
-        title = tk.Label(
-            recipes_window,
-            text='База рецептов',
-            font=self.fonts['heading'],
-            bg=self.colors['bg_main'],
-            fg=self.colors['text_primary']
-        )
-        title.pack(pady=(0, 15))
-        
-        # Загрузка рецептов
-        try:
-            with open('recipes.json', 'r', encoding='utf-8') as file:
-                recipes = json.load(file)
-            
-            # Создание текстового виджета с прокруткой
-            text_frame = tk.Frame(recipes_window, bg=self.colors['bg_secondary'])
-            text_frame.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
-            
-            scrollbar = tk.Scrollbar(text_frame)
-            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-            
-            text_widget = tk.Text(
-                text_frame,
-                font=self.fonts['normal'],
-                bg=self.colors['bg_secondary'],
-                fg=self.colors['text_primary'],
-                yscrollcommand=scrollbar.set,
-                wrap=tk.WORD,
-                padx=10,
-                pady=10,
-                relief=tk.FLAT
-            )
-            text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-            scrollbar.config(command=text_widget.yview)
-            
-            # Вывод рецептов
-            for recipe_name, recipe_data in recipes.items():
-                text_widget.insert(tk.END, f"📦 {recipe_name.upper()}\n", 'title')
-                text_widget.insert(tk.END, f"   Здание: {recipe_data['building']}\n", 'normal')
-                text_widget.insert(tk.END, f"   Выход: {recipe_data['output']} шт.\n", 'normal')
-                text_widget.insert(tk.END, "   Ингредиенты:\n", 'normal')
-                for ing, amount in recipe_data['ingredients'].items():
-                    text_widget.insert(tk.END, f"      • {ing}: {amount}\n", 'normal')
-                text_widget.insert(tk.END, "\n", 'normal')
-            
-            text_widget.tag_config('title', font=self.fonts['heading'], foreground=self.colors['text_primary'])
-            text_widget.tag_config('normal', font=self.fonts['normal'], foreground=self.colors['text_secondary'])
-            text_widget.config(state=tk.DISABLED)
-            
-        except FileNotFoundError:
-            error_label = tk.Label(
-                recipes_window,
-                text='Файл recipes.json не найден!',
-                font=self.fonts['normal'],
-                bg=self.colors['bg_main'],
-                fg=self.colors['accent']
-            )
-            error_label.pack(pady=50)
-        
-        self.current_window = recipes_window
-        recipes_window.transient(self.root)
-        recipes_window.grab_set()
-    
-    def show_settings_window(self):
-        """Показывает окно настроек"""
-        if self.current_window and self.current_window != self.root:
-            self.current_window.destroy()
-        
-        settings_window = tk.Toplevel(self.root)
-        settings_window.geometry('420x450+100+100')
-        settings_window['bg'] = self.colors['bg_main']
-        settings_window.title('Настройки')
-        settings_window.resizable(False, False)
-        
-        # Кнопка Назад
-        back_btn = self.create_back_button(settings_window, lambda: self.close_window(settings_window))
-        back_btn.pack(anchor='nw', padx=10, pady=10)
-        
-        # Заголовок
-        title = tk.Label(
-            settings_window,
-            text='Настройки',
-            font=self.fonts['heading'],
-            bg=self.colors['bg_main'],
-            fg=self.colors['text_primary']
-        )
-        title.pack(pady=(0, 20))
-        
-        # Форма настроек
-        form_frame = tk.Frame(settings_window, bg=self.colors['bg_main'])
-        form_frame.pack(pady=10)
-        
-        # Разрешение экрана
-        resolution_label = tk.Label(
-            form_frame,
-            text='Разрешение экрана:',
-            font=self.fonts['normal'],
-            bg=self.colors['bg_main'],
-            fg=self.colors['text_primary']
-        )
-        resolution_label.pack(pady=10)
-        
-        resolution_frame = tk.Frame(form_frame, bg=self.colors['bg_main'])
-        resolution_frame.pack()
-        
-        width_entry = tk.Entry(
-            resolution_frame,
-            justify=tk.CENTER,
-            font=self.fonts['normal'],
-            width=8,
-            bg=self.colors['bg_secondary'],
-            fg=self.colors['text_primary'],
-            insertbackground=self.colors['text_primary']
-        )
-        width_entry.pack(side=tk.LEFT, padx=5)
-        width_entry.insert(0, '1920')
-        
-        tk.Label(
-            resolution_frame,
-            text='x',
-            font=self.fonts['normal'],
-            bg=self.colors['bg_main'],
-            fg=self.colors['text_primary']
-        ).pack(side=tk.LEFT, padx=5)
-        
-        height_entry = tk.Entry(
-            resolution_frame,
-            justify=tk.CENTER,
-            font=self.fonts['normal'],
-            width=8,
-            bg=self.colors['bg_secondary'],
-            fg=self.colors['text_primary'],
-            insertbackground=self.colors['text_primary']
-        )
-        height_entry.pack(side=tk.LEFT, padx=5)
-        height_entry.insert(0, '1080')
-        
-        def auto_resolution():
-            """Автоматическое определение разрешения"""
-            settings_window.update_idletasks()
-            width = settings_window.winfo_screenwidth()
-            height = settings_window.winfo_screenheight()
-            width_entry.delete(0, tk.END)
-            width_entry.insert(0, str(width))
-            height_entry.delete(0, tk.END)
-            height_entry.insert(0, str(height))
-        
-        auto_btn = tk.Button(
-            resolution_frame,
-            text='Авто',
-            command=auto_resolution,
-            font=self.fonts['small'],
-            bg=self.colors['bg_button'],
-            fg=self.colors['text_primary'],
-            activebackground=self.colors['bg_button_hover'],
-            cursor='hand2',
-            padx=10
-        )
-        auto_btn.pack(side=tk.LEFT, padx=5)
-        
-        # Информация
-        info_label = tk.Label(
-            form_frame,
-            text='Другие настройки в разработке...',
-            font=self.fonts['small'],
-            bg=self.colors['bg_main'],
-            fg=self.colors['text_secondary']
-        )
-        info_label.pack(pady=30)
-        
-        self.current_window = settings_window
-        settings_window.transient(self.root)
-        settings_window.grab_set()
-    
-    def close_window(self, window):
-        """Закрывает дочернее окно и возвращает фокус на главное"""
-        window.destroy()
-        self.current_window = self.root
-        if self.root:
-            self.root.deiconify()
-            self.root.lift()
-    
-    def run(self):
-        """Запускает приложение"""
-        if self.root:
-            self.root.mainloop()
-
-
-# Инициализация и запуск
-if __name__ == '__main__':
-    app = WindowManager()
-    app.create_main_window()
+import time
+
+# Момент запуска (до импорта остальных модулей): от него считается время старта
+STARTED = time.perf_counter()
+
+import threading
+import tkinter as tk
+from tkinter import ttk
+import Cache
+import Profile
+import Recipes
+import Worker
+
+
+class WindowManager:
+    """Класс для управления окнами и навигацией"""
+    
+    def __init__(self):
+        # Цветовая схема
+        self.colors = {
+            'bg_main': '#2C3E50',      # Темно-синий фон
+            'bg_secondary': '#34495E',  # Светлее для элементов
+            'bg_button': '#3498DB',     # Синий для кнопок
+            'bg_button_hover': '#2980B9', # Темнее при наведении
+            'text_primary': '#ECF0F1',   # Светлый текст
+            'text_secondary': '#BDC3C7', # Серый текст
+            'accent': '#E74C3C',        # Красный акцент
+            'success': '#27AE60'        # Зеленый для успеха
+        }
+        
+        # Шрифты
+        self.fonts = {
+            'title': ('Arial', 18, 'bold'),
+            'heading': ('Arial', 14, 'bold'),
+            'normal': ('Arial', 11),
+            'small': ('Arial', 9)
+        }
+        
+        self.root = None
+        self.current_window = None
+        
+        # Время запуска и фонового прогрева (Profile.Profiler)
+        self.startup = Profile.Profiler()
+        self.startup.origin = STARTED
+        
+        # Общая база рецептов (перечитывается только при изменении файла).
+        # Загружается при первом обращении или фоновым прогревом
+        self.recipe_book = Recipes.get_recipe_book()
+        # Кеш результатов расчета (сбрасывается при изменении базы рецептов)
+        self.plan_cache = Cache.PlanCache()
+        self.plan_view = None   # PlanView.PlanView, создается при первом чертеже
+        # Сохраненные планы и раскладки (PlanStore.PlanStore), открывается при расчете
+        self.plan_store = None
+        # Фоновый поток расчетов (кеш используется только из него)
+        self.worker = Worker.Worker()
+        
+    def create_main_window(self):
+        """Создает главное окно приложения"""
+        self.root = tk.Tk()
+        self.root.geometry('350x270+1000+400')
+        self.root['bg'] = self.colors['bg_main']
+        self.root.title('Sat2v - Калькулятор Satisfactory')
+        self.root.resizable(False, False)
+        
+        # Заголовок
+        title_label = tk.Label(
+            self.root, 
+            text='Sat2v Calculator', 
+            font=self.fonts['title'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_primary']
+        )
+        title_label.pack(pady=(20, 15))
+        
+        # Кнопки меню
+        button_frame = tk.Frame(self.root, bg=self.colors['bg_main'])
+        button_frame.pack(pady=15)
+        
+        self.create_styled_button(
+            button_frame, 
+            'Старт', 
+            self.show_calculator_window,
+            width=22
+        ).pack(pady=6)
+        
+        self.create_styled_button(
+            button_frame, 
+            'Рецепты', 
+            self.show_recipes_window,
+            width=22
+        ).pack(pady=6)
+        
+        self.create_styled_button(
+            button_frame, 
+            'Настройки', 
+            self.show_settings_window,
+            width=22
+        ).pack(pady=6)
+        
+        # Время запуска
+        self.startup_label = tk.Label(
+            self.root,
+            text='',
+            font=self.fonts['small'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_secondary']
+        )
+        self.startup_label.pack()
+        
+        # Меню показывается сразу, тяжелое грузится в фоне
+        self.root.after_idle(self.on_menu_shown)
+        threading.Thread(target=self.prewarm, daemon=True).start()
+        
+        self.current_window = self.root
+        return self.root
+    
+    def on_menu_shown(self):
+        """Записывает время от запуска до появления меню"""
+        self.startup.record('запуск', STARTED)
+        seconds = self.startup.totals()['запуск']
+        self.startup_label.config(text=f"Запуск: {seconds * 1000:.0f} мс")
+    
+    def prewarm(self):
+        """
+        Фоновый прогрев, пока пользователь в меню: база рецептов и модули отрисовки.
+        Ошибки не показываются здесь - они появятся в окне, где база нужна.
+        """
+        with self.startup.span('прогрев'):
+            with self.startup.span('рецепты'):
+                try:
+                    self.recipe_book.recipes
+                    self.recipe_book.capacity
+                except (OSError, ValueError):
+                    pass
+            with self.startup.span('графика'):
+                import PlanView
+    
+    def prepare_plan(self, job, targets, objective, many=False):
+        """
+        Расчет и раскладка плана (выполняется в фоновом потоке Worker).
+        Возвращает (план, позиции, сгруппирован ли, Profiler) или None, если рецепт
+        не найден. План берется из кеша в памяти, затем из PlanStore; раскладка
+        сохраняется в PlanStore, и повторно открытый план не раскладывается.
+        Большие планы (больше Draw.GROUP_THRESHOLD зданий) показываются
+        сгруппированными, и раскладывается только сгруппированный план.
+        """
+        import Draw
+        profiler = Profile.Profiler()
+        with Profile.profiling(profiler):
+            job.set_stage('расчет')
+            # Сначала кеш в памяти; при промахе PlanCache читает план из хранилища
+            store = self.open_plan_store()
+            self.plan_cache.store = store
+            if objective:
+                result = self.plan_cache.optimize(targets, self.recipe_book, objective)
+            elif many:
+                result = self.plan_cache.calculate_many(targets, self.recipe_book)
+            else:
+                (recipe, output), = targets.items()
+                result = self.plan_cache.calculate(recipe, output, self.recipe_book)
+            if not result:
+                return None
+            plan_id = self.plan_cache.plan_id(result) if store else None
+            
+            job.set_stage('раскладка')
+            grouped = len(result['buildings']) > Draw.GROUP_THRESHOLD
+            positions = None
+            if plan_id is not None:
+                positions = store.load_layout(plan_id, grouped=grouped)
+            if positions is None:
+                with Profile.span('раскладка'):
+                    plan = Draw.GroupedPlan(result).plan() if grouped else result
+                    positions = Draw.layout_positions(plan)
+                if plan_id is not None:
+                    store.save_layout(plan_id, positions, grouped=grouped)
+        return result, positions, grouped, profiler
+    
+    def open_plan_store(self):
+        """
+        Хранилище планов (открывается один раз). Если файл недоступен,
+        расчеты идут без него: возвращается None.
+        """
+        if self.plan_store is None:
+            import sqlite3
+            import PlanStore
+            try:
+                self.plan_store = PlanStore.PlanStore()
+            except sqlite3.Error:
+                self.plan_store = False
+        return self.plan_store or None
+    
+    def create_styled_button(self, parent, text, command, width=15, height=1):
+        """Создает стилизованную кнопку"""
+        btn = tk.Button(
+            parent,
+            text=text,
+            command=command,
+            font=self.fonts['normal'],
+            bg=self.colors['bg_button'],
+            fg=self.colors['text_primary'],
+            activebackground=self.colors['bg_button_hover'],
+            activeforeground=self.colors['text_primary'],
+            relief=tk.RAISED,
+            bd=2,
+            width=width,
+            height=height,
+            cursor='hand2'
+        )
+        return btn
+    
+    def create_back_button(self, window, callback):
+        """Создает кнопку Назад"""
+        back_btn = tk.Button(
+            window,
+            text='← Назад',
+            command=callback,
+            font=self.fonts['small'],
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary'],
+            activebackground=self.colors['bg_button'],
+            activeforeground=self.colors['text_primary'],
+            relief=tk.FLAT,
+            bd=1,
+            cursor='hand2',
+            padx=10,
+            pady=5
+        )
+        return back_btn
+    
+    def show_calculator_window(self):
+        """Показывает окно калькулятора"""
+        if self.current_window and self.current_window != self.root:
+            self.current_window.destroy()
+        
+        calc_window = tk.Toplevel(self.root)
+        calc_window.geometry('350x720+100+100')
+        calc_window['bg'] = self.colors['bg_main']
+        calc_window.title('Калькулятор')
+        calc_window.resizable(False, False)
+        
+        # Кнопка Назад
+        back_btn = self.create_back_button(calc_window, lambda: self.close_window(calc_window))
+        back_btn.pack(anchor='nw', padx=10, pady=10)
+        
+        # Заголовок
+        title = tk.Label(
+            calc_window,
+            text='Расчет производства',
+            font=self.fonts['heading'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_primary']
+        )
+        title.pack(pady=(0, 20))
+        
+        # Форма
+        form_frame = tk.Frame(calc_window, bg=self.colors['bg_main'])
+        form_frame.pack(pady=10)
+        
+        # Выбор рецепта
+        recipe_label = tk.Label(
+            form_frame,
+            text='Рецепт:',
+            font=self.fonts['normal'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_primary']
+        )
+        recipe_label.pack(pady=5)
+        
+        # Список рецептов из базы (ошибка загрузки покажется при расчете)
+        import RecipeBrowser
+        try:
+            recipes_list = self.recipe_book.names()
+        except (OSError, ValueError):
+            recipes_list = []
+        recipe_combo = ttk.Combobox(
+            form_frame,
+            values=recipes_list[:RecipeBrowser.COMBO_LIMIT],
+            font=self.fonts['normal'],
+            width=20
+        )
+        recipe_combo.pack(pady=5)
+        if recipes_list:
+            recipe_combo.current(0)
+        # Ввод фильтрует список по поисковому индексу базы
+        RecipeBrowser.attach_type_ahead(recipe_combo, lambda: self.recipe_book.index)
+        
+        # Выход в минуту
+        output_label = tk.Label(
+            form_frame,
+            text='Выход в минуту:',
+            font=self.fonts['normal'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_primary']
+        )
+        output_label.pack(pady=(15, 5))
+        
+        output_entry = tk.Entry(
+            form_frame,
+            justify=tk.CENTER,
+            font=self.fonts['normal'],
+            width=15,
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary'],
+            insertbackground=self.colors['text_primary'],
+            relief=tk.SUNKEN,
+            bd=2
+        )
+        output_entry.pack(pady=5)
+        output_entry.insert(0, '60')
+        
+        # Лимиты базовых ресурсов: выход подбирается по ним при каждом изменении
+        limits_label = tk.Label(
+            form_frame,
+            text='Лимиты руды (ресурс=в минуту; ...):',
+            font=self.fonts['small'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_primary']
+        )
+        limits_label.pack(pady=(10, 0))
+        
+        limits_entry = tk.Entry(
+            form_frame,
+            font=self.fonts['small'],
+            width=30,
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary'],
+            insertbackground=self.colors['text_primary'],
+            relief=tk.SUNKEN,
+            bd=2
+        )
+        limits_entry.pack(pady=5)
+        
+        def read_limits():
+            """Лимиты из поля вида 'железная руда=480; медная руда=240'"""
+            limits = {}
+            for part in limits_entry.get().split(';'):
+                if not part.strip():
+                    continue
+                name, sep, amount = part.rpartition('=')
+                try:
+                    if not sep:
+                        raise ValueError
+                    limits[name.strip()] = float(amount)
+                except ValueError:
+                    raise ValueError(f"лимит - ресурс=число: {part.strip()}")
+            return limits
+        
+        def apply_limits(event=None):
+            """Подставляет наибольший целый выход рецепта при лимитах"""
+            try:
+                limits = read_limits()
+                if not limits:
+                    return
+                rate, bottleneck = self.recipe_book.capacity.max_rate(
+                    recipe_combo.get().strip(), limits)
+            except (OSError, ValueError) as e:
+                error_label.config(text=f"Ошибка: {e}", fg=self.colors['accent'])
+                return
+            output_entry.delete(0, tk.END)
+            output_entry.insert(0, str(int(rate)))
+            error_label.config(
+                text=f"Максимум: {rate:.2f}/мин, узкое место: {bottleneck}",
+                fg=self.colors['text_secondary'])
+        
+        limits_entry.bind('<KeyRelease>', apply_limits)
+        recipe_combo.bind('<<ComboboxSelected>>', apply_limits)
+        
+        # Список целей (несколько продуктов рассчитываются одной цепочкой)
+        targets = {}
+        
+        def read_target():
+            """Читает рецепт и выход из формы"""
+            try:
+                output = int(output_entry.get())
+            except ValueError:
+                raise ValueError("введите число")
+            if output <= 0:
+                raise ValueError("выход должен быть положительным числом")
+            recipe = recipe_combo.get().strip()
+            try:
+                known = recipe in self.recipe_book
+            except OSError as e:
+                raise ValueError(f"база рецептов недоступна: {e}")
+            if not known:
+                raise ValueError(f"рецепт не найден: {recipe}")
+            return recipe, output
+        
+        def refresh_targets():
+            targets_list.delete(0, tk.END)
+            for name, rate in targets.items():
+                targets_list.insert(tk.END, f"{name}: {rate}/мин")
+        
+        def add_target():
+            try:
+                recipe, output = read_target()
+            except ValueError as e:
+                error_label.config(text=f"Ошибка: {e}", fg=self.colors['accent'])
+                return
+            targets[recipe] = targets.get(recipe, 0) + output
+            refresh_targets()
+            error_label.config(text='')
+        
+        def clear_targets():
+            targets.clear()
+            refresh_targets()
+        
+        targets_buttons = tk.Frame(form_frame, bg=self.colors['bg_main'])
+        targets_buttons.pack(pady=(10, 5))
+        self.create_styled_button(targets_buttons, '+ В список', add_target, width=10).pack(side=tk.LEFT, padx=5)
+        self.create_styled_button(targets_buttons, 'Очистить', clear_targets, width=10).pack(side=tk.LEFT, padx=5)
+        
+        targets_list = tk.Listbox(
+            form_frame,
+            font=self.fonts['small'],
+            height=4,
+            width=30,
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary'],
+            relief=tk.FLAT
+        )
+        targets_list.pack(pady=5)
+        
+        # Выбор альтернативных рецептов
+        objectives = {
+            'нет': None,
+            'меньше руды': 'raw',
+            'меньше зданий': 'buildings',
+            'руда + здания': 'weighted'
+        }
+        objective_frame = tk.Frame(form_frame, bg=self.colors['bg_main'])
+        objective_frame.pack(pady=5)
+        tk.Label(
+            objective_frame,
+            text='Оптимизация:',
+            font=self.fonts['small'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_primary']
+        ).pack(side=tk.LEFT, padx=5)
+        objective_combo = ttk.Combobox(
+            objective_frame,
+            values=list(objectives),
+            font=self.fonts['small'],
+            state='readonly',
+            width=14
+        )
+        objective_combo.pack(side=tk.LEFT)
+        objective_combo.current(0)
+        
+        # Расчет идет в фоновом потоке, окно опрашивает задачу через after()
+        job = [None]
+        
+        def calculate():
+            try:
+                objective = objectives[objective_combo.get()]
+                plan_targets = dict(targets) if targets else dict([read_target()])
+            except ValueError as e:
+                error_label.config(text=f"Ошибка: {e}", fg=self.colors['accent'])
+                return
+            
+            # Повторный клик с теми же данными не запускает расчет заново
+            key = (tuple(plan_targets.items()), objective)
+            job[0] = self.worker.submit(key, lambda task: self.prepare_plan(
+                task, plan_targets, objective, many=bool(targets)))
+            calc_btn.config(state=tk.DISABLED)
+            cancel_btn.config(state=tk.NORMAL)
+            progress.start(15)
+            error_label.config(text='Расчет...', fg=self.colors['text_secondary'])
+            poll(job[0])
+        
+        def poll(task):
+            if task is not job[0] or not calc_window.winfo_exists():
+                return  # Задачу заменили или окно закрыто
+            if not task.done:
+                error_label.config(text=f"{task.stage.capitalize()}...")
+                calc_window.after(50, poll, task)
+                return
+            finish()
+            if task.cancelled:
+                error_label.config(text='Отменено', fg=self.colors['text_secondary'])
+            elif task.error is not None:
+                error_label.config(text=f"Ошибка: {task.error}", fg=self.colors['accent'])
+            elif task.result is None:
+                error_label.config(text="Ошибка: рецепт не найден", fg=self.colors['accent'])
+            else:
+                show_plan(*task.result)
+        
+        def show_plan(result, positions, grouped, profiler):
+            # Чертеж обновляется в главном потоке: Tk нельзя трогать из фонового.
+            # Окно чертежа одно на приложение и переиспользуется между расчетами
+            import PlanView
+            
+            try:
+                error_label.config(text='Отрисовка...')
+                calc_window.update_idletasks()
+                if self.plan_view is None:
+                    self.plan_view = PlanView.PlanView(self.root)
+                with Profile.profiling(profiler):
+                    self.plan_view.show(result, positions, grouped)
+                error_label.config(text=f"Готово: {profiler.summary()}", fg=self.colors['success'])
+            except Exception as e:
+                error_label.config(text=f"Ошибка: {str(e)}", fg=self.colors['accent'])
+        
+        def cancel():
+            self.worker.cancel()
+            job[0] = None
+            finish()
+            error_label.config(text='Отменено', fg=self.colors['text_secondary'])
+        
+        def finish():
+            progress.stop()
+            calc_btn.config(state=tk.NORMAL)
+            cancel_btn.config(state=tk.DISABLED)
+        
+        calc_buttons = tk.Frame(form_frame, bg=self.colors['bg_main'])
+        calc_buttons.pack(pady=(15, 5))
+        calc_btn = self.create_styled_button(
+            calc_buttons,
+            'Рассчитать',
+            calculate,
+            width=12
+        )
+        calc_btn.pack(side=tk.LEFT, padx=5)
+        cancel_btn = self.create_styled_button(calc_buttons, 'Отмена', cancel, width=8)
+        cancel_btn.config(state=tk.DISABLED)
+        cancel_btn.pack(side=tk.LEFT, padx=5)
+        
+        # Индикатор выполнения
+        progress = ttk.Progressbar(form_frame, mode='indeterminate', length=260)
+        progress.pack(pady=5)
+        
+        # Метка для ошибок и времени этапов расчета
+        error_label = tk.Label(
+            form_frame,
+            text='',
+            font=self.fonts['small'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['accent'],
+            wraplength=320
+        )
+        error_label.pack(pady=5)
+        
+        self.current_window = calc_window
+        calc_window.transient(self.root)
+        calc_window.grab_set()
+    
+    def show_recipes_window(self):
+        """Показывает окно рецептов"""
+        if self.current_window and self.current_window != self.root:
+            self.current_window.destroy()
+        
+        recipes_window = tk.Toplevel(self.root)
+        recipes_window.geometry('600x500+100+100')
+        recipes_window['bg'] = self.colors['bg_main']
+        recipes_window.title('Рецепты')
+        recipes_window.resizable(False, False)
+        
+        # Кнопка Назад
+        back_btn = self.create_back_button(recipes_window, lambda: self.close_window(recipes_window))
+        back_btn.pack(anchor='nw', padx=10, pady=10)
+        
+        # Заголовок
+        title = tk.Label(
+            recipes_window,
+            text='База рецептов',
+            font=self.fonts['heading'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_primary']
+        )
+        title.pack(pady=(0, 15))
+        
+        # Загрузка рецептов: список с поиском рисует только видимые строки
+        try:
+            import RecipeBrowser
+            browser = RecipeBrowser.RecipeBrowser(recipes_window, self.recipe_book,
+                                                  self.colors, self.fonts)
+            browser.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        except FileNotFoundError:
+            error_label = tk.Label(
+                recipes_window,
+                text='Файл recipes.json не найден!',
+                font=self.fonts['normal'],
+                bg=self.colors['bg_main'],
+                fg=self.colors['accent']
+            )
+            error_label.pack(pady=50)
+        except ValueError as e:
+            error_label = tk.Label(
+                recipes_window,
+                text=str(e),
+                font=self.fonts['small'],
+                bg=self.colors['bg_main'],
+                fg=self.colors['accent'],
+                justify=tk.LEFT
+            )
+            error_label.pack(pady=50)
+        
+        self.current_window = recipes_window
+        recipes_window.transient(self.root)
+        recipes_window.grab_set()
+    
+    def show_settings_window(self):
+        """Показывает окно настроек"""
+        if self.current_window and self.current_window != self.root:
+            self.current_window.destroy()
+        
+        settings_window = tk.Toplevel(self.root)
+        settings_window.geometry('420x450+100+100')
+        settings_window['bg'] = self.colors['bg_main']
+        settings_window.title('Настройки')
+        settings_window.resizable(False, False)
+        
+        # Кнопка Назад
+        back_btn = self.create_back_button(settings_window, lambda: self.close_window(settings_window))
+        back_btn.pack(anchor='nw', padx=10, pady=10)
+        
+        # Заголовок
+        title = tk.Label(
+            settings_window,
+            text='Настройки',
+            font=self.fonts['heading'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_primary']
+        )
+        title.pack(pady=(0, 20))
+        
+        # Форма настроек
+        form_frame = tk.Frame(settings_window, bg=self.colors['bg_main'])
+        form_frame.pack(pady=10)
+        
+        # Разрешение экрана
+        resolution_label = tk.Label(
+            form_frame,
+            text='Разрешение экрана:',
+            font=self.fonts['normal'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_primary']
+        )
+        resolution_label.pack(pady=10)
+        
+        resolution_frame = tk.Frame(form_frame, bg=self.colors['bg_main'])
+        resolution_frame.pack()
+        
+        width_entry = tk.Entry(
+            resolution_frame,
+            justify=tk.CENTER,
+            font=self.fonts['normal'],
+            width=8,
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary'],
+            insertbackground=self.colors['text_primary']
+        )
+        width_entry.pack(side=tk.LEFT, padx=5)
+        width_entry.insert(0, '1920')
+        
+        tk.Label(
+            resolution_frame,
+            text='x',
+            font=self.fonts['normal'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_primary']
+        ).pack(side=tk.LEFT, padx=5)
+        
+        height_entry = tk.Entry(
+            resolution_frame,
+            justify=tk.CENTER,
+            font=self.fonts['normal'],
+            width=8,
+            bg=self.colors['bg_secondary'],
+            fg=self.colors['text_primary'],
+            insertbackground=self.colors['text_primary']
+        )
+        height_entry.pack(side=tk.LEFT, padx=5)
+        height_entry.insert(0, '1080')
+        
+        def auto_resolution():
+            """Автоматическое определение разрешения"""
+            settings_window.update_idletasks()
+            width = settings_window.winfo_screenwidth()
+            height = settings_window.winfo_screenheight()
+            width_entry.delete(0, tk.END)
+            width_entry.insert(0, str(width))
+            height_entry.delete(0, tk.END)
+            height_entry.insert(0, str(height))
+        
+        auto_btn = tk.Button(
+            resolution_frame,
+            text='Авто',
+            command=auto_resolution,
+            font=self.fonts['small'],
+            bg=self.colors['bg_button'],
+            fg=self.colors['text_primary'],
+            activebackground=self.colors['bg_button_hover'],
+            cursor='hand2',
+            padx=10
+        )
+        auto_btn.pack(side=tk.LEFT, padx=5)
+        
+        # Информация
+        info_label = tk.Label(
+            form_frame,
+            text='Другие настройки в разработке...',
+            font=self.fonts['small'],
+            bg=self.colors['bg_main'],
+            fg=self.colors['text_secondary']
+        )
+        info_label.pack(pady=30)
+        
+        self.current_window = settings_window
+        settings_window.transient(self.root)
+        settings_window.grab_set()
+    
+    def close_window(self, window):
+        """Закрывает дочернее окно и возвращает фокус на главное"""
+        window.destroy()
+        self.current_window = self.root
+        if self.root:
+            self.root.deiconify()
+            self.root.lift()
+    
+    def run(self):
+        """Запускает приложение"""
+        if self.root:
+            self.root.mainloop()
+
+
+# Инициализация и запуск
+if __name__ == '__main__':
+    app = WindowManager()
+    app.create_main_window()
     app.run()
\ No newline at end of file
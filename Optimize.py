@@ -0,0 +1,281 @@
+import math
+import Plan
+import Recipes
+from Calculate import PlanBuilder, aggregate_demand, buildings_needed, solve_dag
+
+
+# Цели оптимизации:
+#   'raw'       - минимум базовых ресурсов (руды) в минуту
+#   'buildings' - минимум зданий
+#   'weighted'  - raw_weight * руда + building_weight * здания
+OBJECTIVES = ('raw', 'buildings', 'weighted')
+
+# Предел проходов локального улучшения
+MAX_PASSES = 10
+
+
+def candidates(recipes, item):
+    """
+    Варианты рецепта предмета: основной и альтернативные.
+    Возвращает список (название варианта, данные рецепта).
+    """
+    recipe_data = recipes[item]
+    options = [(item, recipe_data)]
+    for alternate in recipe_data.get('alternates', ()):
+        options.append((alternate['name'], alternate))
+    return options
+
+
+def apply_choices(recipes, choices):
+    """
+    База, в которой у каждого предмета один выбранный рецепт.
+    choices - {предмет: название варианта}; остальные предметы - основной рецепт.
+    """
+    chosen = dict(recipes)
+    for item, name in choices.items():
+        for option_name, option in candidates(recipes, item):
+            if option_name == name:
+                chosen[item] = option
+                break
+        else:
+            raise ValueError(f"Нет варианта '{name}' для {item}")
+    return chosen
+
+
+def objective_weights(objective, raw_weight=1.0, building_weight=1.0):
+    """Веса (руда, здания) для цели оптимизации"""
+    if objective == 'raw':
+        return 1.0, 0.0
+    if objective == 'buildings':
+        return 0.0, 1.0
+    if objective == 'weighted':
+        return raw_weight, building_weight
+    raise ValueError(f"Неизвестная цель оптимизации: {objective}")
+
+
+def unit_costs(recipes, raw_weight, building_weight):
+    """
+    Стоимость одной единицы каждого предмета в минуту при лучшем выборе рецептов
+    (здания считаются дробными). Цена предмета не зависит от того, где он
+    используется, поэтому выбор для каждого предмета делается независимо:
+    обход от базовых ресурсов к продуктам, с повторными проходами при циклах.
+    Возвращает (стоимость, выбор) - два словаря по предметам.
+    """
+    # Обратный топологический порядок по всем вариантам (ингредиенты раньше)
+    consumers = {item: 0 for item in recipes}
+    for item in recipes:
+        for _, option in candidates(recipes, item):
+            for ingredient in option['ingredients']:
+                if ingredient in consumers:
+                    consumers[ingredient] += 1
+    ready = [item for item, count in consumers.items() if count == 0]
+    order = []
+    while ready:
+        item = ready.pop()
+        order.append(item)
+        for _, option in candidates(recipes, item):
+            for ingredient in option['ingredients']:
+                if ingredient in consumers:
+                    consumers[ingredient] -= 1
+                    if consumers[ingredient] == 0:
+                        ready.append(ingredient)
+    order.extend(item for item, count in consumers.items() if count > 0)
+    order.reverse()
+
+    cost = {}
+    choice = {}
+
+    def item_cost(item):
+        if item not in recipes:
+            return raw_weight
+        return cost.get(item, math.inf)
+
+    for _ in range(len(order) + 1):
+        changed = False
+        for item in order:
+            best = item_cost(item)
+            for name, option in candidates(recipes, item):
+                value = building_weight / option['output']
+                for ingredient, amount in option['ingredients'].items():
+                    value += amount / option['output'] * item_cost(ingredient)
+                if value < best - 1e-12:
+                    best = value
+                    choice[item] = name
+                    changed = True
+            cost[item] = best
+        if not changed:
+            break
+    return cost, choice
+
+
+def evaluate(recipes, targets, raw_weight, building_weight):
+    """
+    Точная стоимость плана с целым числом зданий.
+    recipes - база с уже выбранными рецептами. При цикле - бесконечность.
+    """
+    try:
+        order, demand, level, edges = aggregate_demand(recipes, targets)
+    except ValueError:
+        return math.inf
+    raw = 0.0
+    buildings = 0
+    for item in order:
+        if item in recipes:
+            buildings += buildings_needed(demand[item] / recipes[item]['output'])
+        else:
+            raw += demand[item]
+    return raw_weight * raw + building_weight * buildings
+
+
+def optimize_choices(targets, recipes=None, objective='raw', raw_weight=1.0, building_weight=1.0):
+    """
+    Подбирает альтернативные рецепты под цель оптимизации.
+    Сначала точный выбор для дробного числа зданий (unit_costs), затем
+    локальное улучшение с учетом округления зданий вверх.
+    Возвращает {предмет: название варианта} для предметов с альтернативами.
+    """
+    recipes = Recipes.as_dict(recipes)
+    raw_weight, building_weight = objective_weights(objective, raw_weight, building_weight)
+
+    # Предметы, которые могут понадобиться целям при любом выборе
+    reachable = set()
+    stack = [item for item in targets if item in recipes]
+    while stack:
+        item = stack.pop()
+        if item in reachable:
+            continue
+        reachable.add(item)
+        for _, option in candidates(recipes, item):
+            stack.extend(i for i in option['ingredients'] if i in recipes)
+
+    _, unit_choice = unit_costs(recipes, raw_weight, building_weight)
+    choices = {item: unit_choice.get(item, item)
+               for item in reachable if recipes[item].get('alternates')}
+    chosen = apply_choices(recipes, choices)
+    if building_weight == 0:
+        return choices  # Без зданий округлять нечего: дробный выбор точен
+    best = evaluate(chosen, targets, raw_weight, building_weight)
+
+    # Замена рецепта у предмета, который сейчас не нужен, ничего не меняет,
+    # поэтому перебираем только предметы текущего плана. Замена оценивается
+    # по затронутой части (swap_value), полный пересчет - только для улучшений
+    for _ in range(MAX_PASSES):
+        improved = False
+        try:
+            active, demand, _, _ = aggregate_demand(chosen, targets)
+        except ValueError:
+            active, demand = list(choices), None
+        for item in active:
+            if item not in choices:
+                continue
+            for name, option in candidates(recipes, item):
+                if name == choices[item]:
+                    continue
+                if demand is not None and swap_value(
+                        chosen, demand, best, item, option,
+                        raw_weight, building_weight) >= best - 1e-9:
+                    continue
+                previous = chosen[item]
+                chosen[item] = option
+                value = evaluate(chosen, targets, raw_weight, building_weight)
+                if value < best - 1e-9:
+                    best = value
+                    choices[item] = name
+                    improved = True
+                    try:
+                        _, demand, _, _ = aggregate_demand(chosen, targets)
+                    except ValueError:
+                        demand = None
+                else:
+                    chosen[item] = previous
+        if not improved:
+            break
+    return choices
+
+
+def swap_value(recipes, demand, current, item, option, raw_weight, building_weight):
+    """
+    Стоимость плана (как evaluate) после замены рецепта item на option.
+    Пересчитываются только item и предметы под ним (по старому и новому
+    рецепту): потребность остальных не меняется. demand - потребность
+    текущего плана, current - его стоимость. При цикле - бесконечность.
+    """
+    # Затронутые предметы: все ингредиенты item по старому и новому рецепту
+    affected = {item}
+    stack = list(recipes[item]['ingredients']) + list(option['ingredients'])
+    while stack:
+        ingredient = stack.pop()
+        if ingredient == item:
+            return math.inf
+        if ingredient in affected or ingredient not in recipes:
+            continue
+        affected.add(ingredient)
+        stack.extend(recipes[ingredient]['ingredients'])
+
+    def recipe_of(name):
+        return option if name == item else recipes[name]
+
+    # Вклад затронутых предметов: старый вычитается, новый считается заново
+    value = current
+    external = {}   # потребность от незатронутых потребителей и целей
+    for name in affected:
+        if demand.get(name, 0) > 0:
+            external[name] = external.get(name, 0.0) + demand[name]
+            cycles = demand[name] / recipes[name]['output']
+            value -= building_weight * buildings_needed(cycles)
+            for ingredient, amount in recipes[name]['ingredients'].items():
+                if ingredient in recipes:
+                    external[ingredient] = external.get(ingredient, 0.0) - cycles * amount
+                else:
+                    value -= raw_weight * cycles * amount
+
+    # Алгоритм Кана по затронутой части с новым рецептом item
+    waiting = dict.fromkeys(affected, 0)
+    for name in affected:
+        for ingredient in recipe_of(name)['ingredients']:
+            if ingredient in waiting:
+                waiting[ingredient] += 1
+    new_demand = {name: external.get(name, 0.0) for name in affected}
+    new_demand[item] = demand.get(item, 0.0)
+    ready = [name for name, count in waiting.items() if count == 0]
+    done = 0
+    while ready:
+        name = ready.pop()
+        done += 1
+        recipe_data = recipe_of(name)
+        if new_demand[name] > 1e-12:
+            cycles = new_demand[name] / recipe_data['output']
+            value += building_weight * buildings_needed(cycles)
+        else:
+            cycles = 0.0
+        for ingredient, amount in recipe_data['ingredients'].items():
+            if ingredient in waiting:
+                new_demand[ingredient] += cycles * amount
+                waiting[ingredient] -= 1
+                if waiting[ingredient] == 0:
+                    ready.append(ingredient)
+            else:
+                value += raw_weight * cycles * amount
+    if done != len(affected):
+        return math.inf
+    return value
+
+
+def optimize(targets, recipes=None, objective='raw', raw_weight=1.0, building_weight=1.0,
+             columnar=False):
+    """
+    Рассчитывает план (режим 'dag') с оптимальным выбором альтернативных рецептов.
+    targets - словарь {предмет: выход в минуту}.
+    Результат в формате calculate() с дополнительным ключом 'choices'.
+    Возвращает None, если какой-то из рецептов не найден.
+    """
+    recipes = Recipes.as_dict(recipes)
+    if any(target not in recipes for target in targets):
+        return None
+
+    choices = optimize_choices(targets, recipes, objective, raw_weight, building_weight)
+    builder = Plan.ColumnarPlan() if columnar else PlanBuilder()
+    result = solve_dag(apply_choices(recipes, choices), targets, builder)
+    if isinstance(result, dict):
+        result['choices'] = choices
+    return result
@@ -0,0 +1,334 @@
+import copy
+from array import array
+from bisect import bisect_right
+from collections.abc import Mapping, Sequence
+from types import MappingProxyType
+
+
+class ColumnarPlan(Mapping):
+    """
+    Компактное представление плана для очень больших фабрик.
+    Здания хранятся по столбцам (array), названия - целочисленными кодами.
+    Одна строка описывает N одинаковых зданий подряд (id, id+1, ...),
+    одна связь-строка - равномерное распределение потока между двумя группами.
+    Снаружи ведет себя как словарь результата calculate():
+    plan['buildings'] и plan['connections'] отдают обычные словари по запросу.
+    """
+
+    KEYS = ('target_recipe', 'target_output', 'targets', 'buildings', 'connections')
+
+    def __init__(self, targets=None):
+        self.targets = dict(targets or {})
+
+        # Таблица строк: код -> строка
+        self.strings = []
+        self._codes = {}
+
+        # Здания: одна строка = count одинаковых зданий
+        self.row_id = array('q')
+        self.row_count = array('q')
+        self.row_level = array('l')
+        self.row_output = array('d')        # выход одного здания
+        self.row_building_num = array('q')  # номер первого здания строки
+        self.row_total = array('q')
+        self.row_name = array('l')
+        self.row_building = array('l')
+        self.row_source = array('b')
+
+        # Связи: from/to - первые id групп, *_count - размеры групп
+        self.link_from = array('q')
+        self.link_from_count = array('q')
+        self.link_to = array('q')
+        self.link_to_count = array('q')
+        self.link_resource = array('l')
+        self.link_amount = array('d')       # суммарный поток по строке
+
+        # Префиксные суммы для поиска строки по номеру здания/связи
+        self._row_offsets = array('q', [0])
+        self._link_offsets = array('q', [0])
+
+        self._buildings_view = BuildingsView(self)
+        self._connections_view = ConnectionsView(self)
+
+    # --- Таблица строк ---
+
+    def intern(self, text):
+        """Возвращает целочисленный код строки"""
+        code = self._codes.get(text)
+        if code is None:
+            code = len(self.strings)
+            self._codes[text] = code
+            self.strings.append(text)
+        return code
+
+    # --- Построение ---
+
+    @property
+    def num_buildings(self):
+        return self._row_offsets[-1]
+
+    @property
+    def num_connections(self):
+        return self._link_offsets[-1]
+
+    def add_buildings(self, name, building, level, output, count=1,
+                      is_source=False, building_num=1, total_buildings=None):
+        """
+        Добавляет count одинаковых зданий одной строкой.
+        Возвращает range их id.
+        """
+        first_id = self.num_buildings
+        self.row_id.append(first_id)
+        self.row_count.append(count)
+        self.row_level.append(level)
+        self.row_output.append(output)
+        self.row_building_num.append(building_num)
+        self.row_total.append(count if total_buildings is None else total_buildings)
+        self.row_name.append(self.intern(name))
+        self.row_building.append(self.intern(building))
+        self.row_source.append(1 if is_source else 0)
+        self._row_offsets.append(first_id + count)
+        return range(first_id, first_id + count)
+
+    def add_link(self, from_ids, to_ids, resource, amount):
+        """
+        Распределяет поток amount между группами зданий (как link_buildings).
+        Непрерывные группы хранятся одной строкой.
+        """
+        if _is_contiguous(from_ids) and _is_contiguous(to_ids):
+            self._append_link(from_ids[0], len(from_ids), to_ids[0], len(to_ids),
+                              resource, amount)
+            return
+        count = max(len(from_ids), len(to_ids))
+        for k in range(count):
+            self._append_link(from_ids[k * len(from_ids) // count], 1,
+                              to_ids[k * len(to_ids) // count], 1,
+                              resource, amount / count)
+
+    def _append_link(self, from_id, from_count, to_id, to_count, resource, amount):
+        self.link_from.append(from_id)
+        self.link_from_count.append(from_count)
+        self.link_to.append(to_id)
+        self.link_to_count.append(to_count)
+        self.link_resource.append(self.intern(resource))
+        self.link_amount.append(amount)
+        self._link_offsets.append(self._link_offsets[-1] + max(from_count, to_count))
+
+    @property
+    def target_recipe(self):
+        return ', '.join(self.targets)
+
+    @property
+    def target_output(self):
+        return sum(self.targets.values())
+
+    def result(self, targets):
+        """Завершает построение (интерфейс общий с Calculate.PlanBuilder)"""
+        self.targets = dict(targets)
+        return self
+
+    @classmethod
+    def from_result(cls, result):
+        """
+        Упаковывает обычный результат calculate() в столбцы.
+        Соседние одинаковые здания объединяются в одну строку.
+        """
+        targets = result.get('targets') or {result['target_recipe']: result['target_output']}
+        plan = cls(targets)
+        for b in result['buildings']:
+            rows = len(plan.row_id)
+            if rows and b['id'] == plan.num_buildings and _same_row(plan, rows - 1, b):
+                plan.row_count[rows - 1] += 1
+                plan._row_offsets[-1] += 1
+                continue
+            if b['id'] != plan.num_buildings:
+                raise ValueError("id зданий должны идти подряд с нуля")
+            plan.add_buildings(b['name'], b['building'], b['level'], b['output'],
+                               is_source=b.get('is_source', False),
+                               building_num=b.get('building_num', 1),
+                               total_buildings=b.get('total_buildings', 1))
+        for conn in result['connections']:
+            plan._append_link(conn['from'], 1, conn['to'], 1,
+                              conn['resource'], conn['amount'])
+        return plan
+
+    # --- Словарный интерфейс ---
+
+    def __getitem__(self, key):
+        if key == 'target_recipe':
+            return self.target_recipe
+        if key == 'target_output':
+            return self.target_output
+        if key == 'targets':
+            return dict(self.targets)
+        if key == 'buildings':
+            return self._buildings_view
+        if key == 'connections':
+            return self._connections_view
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def to_dict(self):
+        """Разворачивает план в обычный словарь со списками"""
+        return {
+            'target_recipe': self.target_recipe,
+            'target_output': self.target_output,
+            'targets': dict(self.targets),
+            'buildings': list(self._buildings_view),
+            'connections': list(self._connections_view)
+        }
+
+    def frozen(self):
+        """
+        Копия только для чтения (для Cache): столбцы - memoryview без записи,
+        цели и таблица строк неизменяемы. Дописывать в нее нельзя.
+        """
+        plan = copy.copy(self)
+        for name, value in vars(self).items():
+            if isinstance(value, array):
+                setattr(plan, name, memoryview(array(value.typecode, value)).toreadonly())
+        plan.targets = MappingProxyType(dict(self.targets))
+        plan.strings = tuple(self.strings)
+        plan._codes = MappingProxyType(dict(self._codes))
+        plan._buildings_view = BuildingsView(plan)
+        plan._connections_view = ConnectionsView(plan)
+        return plan
+
+    # --- Доступ к столбцам ---
+
+    def building_row(self, row):
+        """Описание строки зданий: (name, building, level, output, count)"""
+        return (self.strings[self.row_name[row]],
+                self.strings[self.row_building[row]],
+                self.row_level[row],
+                self.row_output[row],
+                self.row_count[row])
+
+    def as_numpy(self):
+        """Столбцы зданий в виде массивов NumPy (без копирования)"""
+        import numpy as np
+        return {
+            'id': np.frombuffer(self.row_id, dtype=np.int64),
+            'count': np.frombuffer(self.row_count, dtype=np.int64),
+            'level': np.frombuffer(self.row_level, dtype=np.dtype(f'i{self.row_level.itemsize}')),
+            'output': np.frombuffer(self.row_output, dtype=np.float64),
+            'building_num': np.frombuffer(self.row_building_num, dtype=np.int64),
+            'name': np.frombuffer(self.row_name, dtype=np.dtype(f'i{self.row_name.itemsize}')),
+            'building': np.frombuffer(self.row_building, dtype=np.dtype(f'i{self.row_building.itemsize}')),
+        }
+
+    def nbytes(self):
+        """Примерный объем памяти, занятый столбцами"""
+        columns = (self.row_id, self.row_count, self.row_level, self.row_output,
+                   self.row_building_num, self.row_total, self.row_name,
+                   self.row_building, self.row_source, self.link_from,
+                   self.link_from_count, self.link_to, self.link_to_count,
+                   self.link_resource, self.link_amount,
+                   self._row_offsets, self._link_offsets)
+        return sum(col.itemsize * len(col) for col in columns)
+
+
+class BuildingsView(Sequence):
+    """Список зданий плана; словари создаются при обращении"""
+
+    def __init__(self, plan):
+        self._plan = plan
+
+    def __len__(self):
+        return self._plan.num_buildings
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        row = bisect_right(self._plan._row_offsets, index) - 1
+        return self._make(row, index - self._plan._row_offsets[row])
+
+    def __iter__(self):
+        plan = self._plan
+        for row in range(len(plan.row_id)):
+            for k in range(plan.row_count[row]):
+                yield self._make(row, k)
+
+    def _make(self, row, k):
+        plan = self._plan
+        building = {
+            'id': plan.row_id[row] + k,
+            'name': plan.strings[plan.row_name[row]],
+            'building': plan.strings[plan.row_building[row]],
+            'level': plan.row_level[row],
+            'output': plan.row_output[row],
+        }
+        if plan.row_source[row]:
+            building['is_source'] = True
+        else:
+            building['building_num'] = plan.row_building_num[row] + k
+            building['total_buildings'] = plan.row_total[row]
+            building['is_source'] = False
+        return building
+
+
+class ConnectionsView(Sequence):
+    """Список связей плана; словари создаются при обращении"""
+
+    def __init__(self, plan):
+        self._plan = plan
+
+    def __len__(self):
+        return self._plan.num_connections
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        row = bisect_right(self._plan._link_offsets, index) - 1
+        return self._make(row, index - self._plan._link_offsets[row])
+
+    def __iter__(self):
+        plan = self._plan
+        for row in range(len(plan.link_from)):
+            for k in range(plan._link_offsets[row + 1] - plan._link_offsets[row]):
+                yield self._make(row, k)
+
+    def _make(self, row, k):
+        plan = self._plan
+        from_count = plan.link_from_count[row]
+        to_count = plan.link_to_count[row]
+        count = max(from_count, to_count)
+        return {
+            'from': plan.link_from[row] + k * from_count // count,
+            'to': plan.link_to[row] + k * to_count // count,
+            'resource': plan.strings[plan.link_resource[row]],
+            'amount': plan.link_amount[row] / count
+        }
+
+
+def _is_contiguous(ids):
+    """Проверяет, что id идут подряд с шагом 1"""
+    if isinstance(ids, range):
+        return ids.step == 1 and len(ids) > 0
+    return len(ids) > 0 and ids[-1] - ids[0] == len(ids) - 1 and \
+        all(ids[i + 1] - ids[i] == 1 for i in range(len(ids) - 1))
+
+
+def _same_row(plan, row, building):
+    """Можно ли дописать здание в конец строки row"""
+    is_source = building.get('is_source', False)
+    return (not is_source and not plan.row_source[row]
+            and plan.strings[plan.row_name[row]] == building['name']
+            and plan.strings[plan.row_building[row]] == building['building']
+            and plan.row_level[row] == building['level']
+            and plan.row_output[row] == building['output']
+            and plan.row_total[row] == building.get('total_buildings', 1)
+            and plan.row_building_num[row] + plan.row_count[row] == building.get('building_num', 1))
@@ -0,0 +1,307 @@
+import json
+import sqlite3
+import threading
+import time
+from array import array
+
+import Cache
+
+
+STORE_PATH = 'plans.sqlite3'
+
+# Версия схемы (PRAGMA user_version): при несовпадении таблицы создаются заново
+SCHEMA_VERSION = 3
+
+# Сколько планов хранить: при превышении удаляются давно не открывавшиеся
+MAX_PLANS = 200
+
+# Ключи результата, которые хранятся в таблицах; остальные (choices,
+# capacity и т.п.) сохраняются в plans.extra как JSON
+_PLAN_KEYS = ('target_recipe', 'target_output', 'targets', 'buildings', 'connections')
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    recipes_hash TEXT NOT NULL,
+    target TEXT NOT NULL,
+    rate REAL NOT NULL,
+    targets TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    objective TEXT,
+    extra TEXT,
+    building_count INTEGER NOT NULL,
+    connection_count INTEGER NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL,
+    UNIQUE (key, recipes_hash)
+);
+CREATE TABLE IF NOT EXISTS buildings (
+    plan_id INTEGER NOT NULL REFERENCES plans(id) ON DELETE CASCADE,
+    id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    building TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    output REAL NOT NULL,
+    building_num INTEGER,
+    total_buildings INTEGER,
+    is_source INTEGER NOT NULL,
+    PRIMARY KEY (plan_id, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS buildings_by_type ON buildings (building, plan_id);
+CREATE INDEX IF NOT EXISTS buildings_by_name ON buildings (name, plan_id);
+CREATE TABLE IF NOT EXISTS connections (
+    plan_id INTEGER NOT NULL REFERENCES plans(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    from_id INTEGER NOT NULL,
+    to_id INTEGER NOT NULL,
+    resource TEXT,
+    amount REAL NOT NULL,
+    PRIMARY KEY (plan_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS connections_by_resource ON connections (resource, plan_id);
+CREATE TABLE IF NOT EXISTS layouts (
+    plan_id INTEGER NOT NULL REFERENCES plans(id) ON DELETE CASCADE,
+    layout TEXT NOT NULL,
+    grouped INTEGER NOT NULL,
+    ids BLOB NOT NULL,
+    boxes BLOB NOT NULL,
+    PRIMARY KEY (plan_id, layout, grouped)
+) WITHOUT ROWID;
+'''
+
+
+class PlanStore:
+    """
+    Сохраненные планы на диске (SQLite). План ищется по целям с выходами,
+    режиму расчета, цели оптимизации и хешу базы рецептов (Cache.recipes_hash),
+    поэтому после изменения recipes.json старые планы просто не находятся.
+    Здания и связи лежат в таблицах с индексами: по ним можно искать планы,
+    не загружая их целиком (plans_using). Рядом хранятся готовые раскладки
+    чертежа, чтобы открытый заново план не раскладывался еще раз.
+    Соединение одно на хранилище и защищено блокировкой: хранилищем можно
+    пользоваться из фонового потока.
+    При сохранении удаляются лишние сверх max_plans, давно не открывавшиеся;
+    планы других версий базы удаляет purge (разные файлы рецептов делят
+    одно хранилище, поэтому сохранение их не трогает).
+    """
+
+    def __init__(self, path=STORE_PATH, max_plans=MAX_PLANS):
+        self.path = path
+        self.max_plans = max_plans
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection as connection:
+            connection.execute('PRAGMA foreign_keys = ON')
+            connection.execute('PRAGMA journal_mode = WAL')
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                for table in ('layouts', 'connections', 'buildings', 'plans'):
+                    connection.execute(f'DROP TABLE IF EXISTS {table}')
+                connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            connection.executescript(_SCHEMA)
+
+    # --- Планы ---
+
+    def find(self, targets, recipes_hash, mode='dag', objective=None):
+        """id сохраненного плана или None"""
+        with self._lock, self._connection as connection:
+            row = connection.execute(
+                'SELECT id FROM plans WHERE key = ? AND recipes_hash = ?',
+                (plan_key(targets, mode, objective), _hex(recipes_hash))).fetchone()
+            if row is None:
+                return None
+            connection.execute('UPDATE plans SET used = ? WHERE id = ?', (time.time(), row[0]))
+        return row[0]
+
+    def save(self, result, recipes_hash, mode='dag', objective=None):
+        """
+        Сохраняет результат calculate() (в том числе замороженный Cache или
+        Plan.ColumnarPlan). План с тем же ключом заменяется вместе с раскладками,
+        лишние сверх max_plans удаляются.
+        Возвращает id плана.
+        """
+        # У плана режима 'tree' ключа targets нет: цель одна
+        targets = dict(result.get('targets') or {result['target_recipe']: result['target_output']})
+        extra = {key: _plain(value) for key, value in result.items() if key not in _PLAN_KEYS}
+        buildings = result['buildings']
+        connections = result['connections']
+        with self._lock, self._connection as connection:
+            key = plan_key(targets, mode, objective)
+            connection.execute('DELETE FROM plans WHERE key = ? AND recipes_hash = ?',
+                               (key, _hex(recipes_hash)))
+            now = time.time()
+            plan_id = connection.execute(
+                'INSERT INTO plans (key, recipes_hash, target, rate, targets, mode, objective,'
+                ' extra, building_count, connection_count, created, used)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, _hex(recipes_hash), result['target_recipe'], result['target_output'],
+                 json.dumps(targets, ensure_ascii=False), mode, objective,
+                 json.dumps(extra, ensure_ascii=False) if extra else None,
+                 len(buildings), len(connections), now, now)).lastrowid
+            connection.executemany(
+                'INSERT INTO buildings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                ((plan_id, b['id'], b['name'], b['building'], b['level'], b['output'],
+                  b.get('building_num'), b.get('total_buildings'), b['is_source'])
+                 for b in buildings))
+            connection.executemany(
+                'INSERT INTO connections VALUES (?, ?, ?, ?, ?, ?)',
+                ((plan_id, seq, conn['from'], conn['to'], conn.get('resource'), conn['amount'])
+                 for seq, conn in enumerate(connections)))
+            connection.execute(
+                'DELETE FROM plans WHERE id IN (SELECT id FROM plans'
+                ' ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_plans,))
+        return plan_id
+
+    def load(self, plan_id):
+        """План в формате calculate() или None, если его нет"""
+        with self._lock:
+            connection = self._connection
+            row = connection.execute(
+                'SELECT target, rate, targets, extra FROM plans WHERE id = ?',
+                (plan_id,)).fetchone()
+            if row is None:
+                return None
+            buildings = [_building(*values) for values in connection.execute(
+                'SELECT id, name, building, level, output, building_num, total_buildings,'
+                ' is_source FROM buildings WHERE plan_id = ? ORDER BY id', (plan_id,))]
+            connections = [
+                {'from': from_id, 'to': to_id, 'resource': resource, 'amount': amount}
+                for from_id, to_id, resource, amount in connection.execute(
+                    'SELECT from_id, to_id, resource, amount FROM connections'
+                    ' WHERE plan_id = ? ORDER BY seq', (plan_id,))]
+        result = {
+            'target_recipe': row[0],
+            'target_output': row[1],
+            'targets': json.loads(row[2]),
+            'buildings': buildings,
+            'connections': connections
+        }
+        if row[3]:
+            result.update(json.loads(row[3]))
+        return result
+
+    def delete(self, plan_id):
+        with self._lock, self._connection as connection:
+            connection.execute('DELETE FROM plans WHERE id = ?', (plan_id,))
+
+    def purge(self, recipes_hash):
+        """Удаляет планы всех хешей базы, кроме recipes_hash. Возвращает их число"""
+        with self._lock, self._connection as connection:
+            return connection.execute('DELETE FROM plans WHERE recipes_hash != ?',
+                                      (_hex(recipes_hash),)).rowcount
+
+    # --- Раскладки ---
+
+    def save_layout(self, plan_id, positions, layout='layered', grouped=False):
+        """
+        Сохраняет позиции чертежа плана (grouped - раскладка GroupedPlan).
+        Если план уже удален (вытеснен), ничего не делает.
+        """
+        ids = array('q', positions)
+        boxes = array('d')
+        for pos in positions.values():
+            boxes.extend((pos['x'], pos['y'], pos['width'], pos['height']))
+        with self._lock, self._connection as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO layouts SELECT ?, ?, ?, ?, ?'
+                ' WHERE EXISTS (SELECT 1 FROM plans WHERE id = ?)',
+                (plan_id, layout, int(grouped), ids.tobytes(), boxes.tobytes(), plan_id))
+
+    def load_layout(self, plan_id, layout='layered', grouped=False):
+        """Позиции чертежа или None, если раскладка не сохранена"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT ids, boxes FROM layouts WHERE plan_id = ? AND layout = ? AND grouped = ?',
+                (plan_id, layout, int(grouped))).fetchone()
+        if row is None:
+            return None
+        ids = array('q')
+        ids.frombytes(row[0])
+        boxes = array('d')
+        boxes.frombytes(row[1])
+        return {b_id: {'x': boxes[4 * k], 'y': boxes[4 * k + 1],
+                       'width': boxes[4 * k + 2], 'height': boxes[4 * k + 3]}
+                for k, b_id in enumerate(ids)}
+
+    # --- Запросы без загрузки планов ---
+
+    def plans(self):
+        """Краткие сведения о всех планах, новые первыми"""
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT ' + _SUMMARY_COLUMNS + ' FROM plans ORDER BY created DESC').fetchall()
+        return [_summary(row) for row in rows]
+
+    def plans_using(self, building, more_than=0):
+        """
+        Планы, где зданий типа building (например, 'Smelter') больше more_than.
+        Возвращает краткие сведения с числом таких зданий ('count').
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                'SELECT ' + _SUMMARY_COLUMNS + ', used.count FROM plans JOIN ('
+                ' SELECT plan_id, COUNT(*) AS count FROM buildings WHERE building = ?'
+                ' GROUP BY plan_id HAVING COUNT(*) > ?) AS used ON used.plan_id = plans.id'
+                ' ORDER BY used.count DESC',
+                (building, more_than)).fetchall()
+        found = []
+        for row in rows:
+            summary = _summary(row[:-1])
+            summary['count'] = row[-1]
+            found.append(summary)
+        return found
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_SUMMARY_COLUMNS = ('plans.id, target, rate, targets, mode, objective,'
+                    ' building_count, connection_count, created')
+
+
+def _summary(row):
+    plan_id, target, rate, targets, mode, objective, buildings, connections, created = row
+    return {
+        'id': plan_id,
+        'target_recipe': target,
+        'target_output': rate,
+        'targets': json.loads(targets),
+        'mode': mode,
+        'objective': objective,
+        'buildings': buildings,
+        'connections': connections,
+        'created': created
+    }
+
+
+def plan_key(targets, mode='dag', objective=None):
+    """Ключ плана: цели с выходами (Cache.normal_targets), режим и оптимизация"""
+    items = [(name, float(rate)) for name, rate in Cache.normal_targets(targets).items()]
+    return json.dumps([items, mode, objective], ensure_ascii=False)
+
+
+def _building(b_id, name, building, level, output, building_num, total_buildings, is_source):
+    """Словарь здания в формате Calculate.building_record"""
+    record = {'id': b_id, 'name': name, 'building': building, 'level': level, 'output': output}
+    if is_source:
+        record['is_source'] = True
+    else:
+        record['building_num'] = building_num
+        record['total_buildings'] = total_buildings
+        record['is_source'] = False
+    return record
+
+
+def _hex(recipes_hash):
+    return recipes_hash.hex() if isinstance(recipes_hash, bytes) else recipes_hash
+
+
+def _plain(value):
+    """Обычные словари и списки вместо замороженных (для JSON)"""
+    if hasattr(value, 'items'):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
@@ -0,0 +1,227 @@
+import tkinter as tk
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+import Draw
+import Profile
+from Style import COLORS, plan_title
+
+
+# Сколько зданий нового плана должно совпасть по id со старым, чтобы
+# чертеж обновлялся на месте, а не перестраивался заново
+REUSE_SHARE = 0.5
+
+
+class PlanView:
+    """
+    Окно чертежа плана (Toplevel) с постоянным холстом FigureCanvasTkAgg.
+    Фигура, оси, легенда и обработчики создаются один раз. Новый план
+    сравнивается со старым по id зданий и связей: у совпавших меняются
+    подписи, цвет и положение, лишние убираются, новые дорисовываются.
+    Заново чертеж строится, только если совпало меньше REUSE_SHARE зданий
+    или план рисуется коллекциями (больше Draw.BATCH_THRESHOLD зданий).
+    Закрытое окно прячется и открывается снова при следующем show.
+    Пока окно открыто, модальный захват мыши (grab_set) снят с окна,
+    которое его держало; при закрытии чертежа захват возвращается.
+    """
+
+    def __init__(self, root, layout='layered'):
+        self.root = root
+        self.layout = layout
+        self.window = None
+        self.view = None          # GroupedPlan сгруппированного вида
+        self.plan = None
+        self.positions = {}
+        self.batched = False
+        self.nodes = {}           # id здания -> (запись, позиция, художники)
+        self.links = {}           # ключ связи -> (запись, художники)
+        self.grab = None          # окно, у которого show забрал захват мыши
+
+    def show(self, result, positions=None, grouped=False):
+        """
+        Показывает план в окне. positions - готовая раскладка (при grouped -
+        раскладка GroupedPlan(result).plan()).
+        """
+        if self.window is None:
+            self._create()
+        self.view = Draw.GroupedPlan(result) if grouped else None
+        plan = self.view.plan() if grouped else result
+        if positions is None:
+            with Profile.span('раскладка'):
+                positions = Draw.layout_positions(plan, self.layout)
+        self.title.set_text(plan_title(result))
+        self.hint.set_text((Draw.GROUPED_HINT if grouped else '') + Draw.HINT)
+        self._render(plan, positions)
+        # Модальное окно калькулятора (grab_set) забирает мышь у остальных
+        # окон: без этого чертеж не двигался бы и не масштабировался
+        grab = self.window.grab_current()
+        if grab is not None:
+            grab.grab_release()
+            self.grab = grab
+        with Profile.span('отрисовка'):
+            self.canvas.draw()
+        self.window.deiconify()
+        self.window.lift()
+
+    def _create(self):
+        self.window = tk.Toplevel(self.root)
+        self.window.title("Чертеж плана")
+        self.window.geometry("1400x900")
+        self.window.configure(bg=COLORS['bg'])
+        self.window.protocol("WM_DELETE_WINDOW", self._hide)
+
+        self.figure = Figure(figsize=(16, 10), facecolor=COLORS['bg'])
+        self.canvas = FigureCanvasTkAgg(self.figure, master=self.window)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.ax = self.figure.add_subplot()
+        self.ax.set_facecolor(COLORS['bg'])
+        self.title = self.figure.suptitle('', fontsize=18, color=COLORS['text'], fontweight='bold')
+        self.hint = self.figure.text(0.5, 0.02, Draw.HINT, ha='center', fontsize=11,
+                                     color=COLORS['text'], alpha=0.9, fontweight='bold')
+        Draw.add_legend(self.ax)
+        self.figure.tight_layout(rect=[0, 0.04, 1, 0.96])
+
+        self.scene = Draw.Scene({})
+        self.set_home = Draw.enable_interactivity(self.figure, self.ax, {}, self.scene)
+        self.canvas.mpl_connect('button_press_event', self._on_click)
+
+    def _hide(self):
+        """Прячет окно и возвращает захват мыши окну, у которого его забрал show"""
+        self.window.withdraw()
+        grab, self.grab = self.grab, None
+        if grab is not None and grab.winfo_exists():
+            grab.grab_set()
+
+    def _render(self, plan, positions, keep_view=False):
+        """Приводит чертеж к плану: на месте или заново (см. класс)"""
+        buildings = plan['buildings']
+        batched = len(buildings) > Draw.BATCH_THRESHOLD
+        reused = sum(1 for b in buildings if b['id'] in self.nodes)
+        rebuild = (batched or self.batched
+                   or reused < REUSE_SHARE * max(len(buildings), len(self.nodes)))
+
+        if rebuild:
+            with Profile.span('перестройка'):
+                self._clear()
+                if self.batched:
+                    self.scene.reset(positions)   # Коллекции рисовал Draw.draw_plan
+                else:
+                    self.scene.forget(positions)
+                if batched:
+                    Draw.draw_plan(self.ax, plan, positions, True, self.scene)
+                else:
+                    self._update_connections(plan['connections'], positions)
+                    self._update_buildings(buildings, positions)
+            if not keep_view:
+                Draw.setup_axes(self.ax, positions)
+        else:
+            with Profile.span('обновление'):
+                self._update_connections(plan['connections'], positions)
+                self._update_buildings(buildings, positions)
+        if not batched:
+            self._register(positions)
+
+        self.plan = plan
+        self.positions = positions
+        self.batched = batched
+        self.set_home(*Draw.plan_limits(positions))
+        self.scene.update(self.ax)
+
+    def _update_buildings(self, buildings, positions):
+        """Здания: совпавшие по id меняются на месте, остальные рисуются или убираются"""
+        wanted = {b['id'] for b in buildings}
+        for b_id in [b_id for b_id in self.nodes if b_id not in wanted]:
+            _remove(self.nodes.pop(b_id)[2])
+        changed = 0
+        for building in buildings:
+            pos = positions[building['id']]
+            old = self.nodes.get(building['id'])
+            if old is not None and old[0] == building and old[1] == pos:
+                continue
+            changed += 1
+            if old is not None and Draw.update_building(old[2], building, pos):
+                artists = old[2]
+            else:
+                if old is not None:
+                    _remove(old[2])
+                artists = Draw.draw_building(self.ax, building, pos)
+            self.nodes[building['id']] = (building, pos, artists)
+        Profile.count('изменено зданий', changed)
+
+    def _update_connections(self, connections, positions):
+        """Связи по ключу (откуда, куда, ресурс, номер повтора) - как здания"""
+        links = {}
+        seen = {}
+        changed = 0
+        for conn in connections:
+            from_pos = positions.get(conn['from'])
+            to_pos = positions.get(conn['to'])
+            if from_pos is None or to_pos is None:
+                continue
+            pair = (conn['from'], conn['to'], conn.get('resource'))
+            key = pair + (seen.get(pair, 0),)
+            seen[pair] = key[3] + 1
+            record = (conn, from_pos, to_pos)
+            old = self.links.pop(key, None)
+            if old is not None and old[0] == record:
+                links[key] = old
+                continue
+            changed += 1
+            if old is not None and Draw.update_connection(old[1], conn, from_pos, to_pos):
+                artists = old[1]
+            else:
+                if old is not None:
+                    _remove(old[1])
+                artists = Draw.draw_connection(self.ax, conn, from_pos, to_pos)
+            links[key] = (record, artists)
+        for _, artists in self.links.values():
+            _remove(artists)
+        self.links = links
+        Profile.count('изменено связей', changed)
+
+    def _register(self, positions):
+        """
+        Индекс Scene для отсечения и уровня детализации: заново по всем
+        нарисованным зданиям и связям (они могли сдвинуться или исчезнуть)
+        """
+        self.scene.forget(positions)
+        for _, pos, artists in self.nodes.values():
+            Draw.register_building(self.scene, artists, pos)
+        for (_, from_pos, to_pos), artists in self.links.values():
+            Draw.register_connection(self.scene, artists, from_pos, to_pos)
+
+    def _clear(self):
+        for _, _, artists in self.nodes.values():
+            _remove(artists)
+        for _, artists in self.links.values():
+            _remove(artists)
+        self.nodes = {}
+        self.links = {}
+
+    def _on_click(self, event):
+        """Клик по блоку сгруппированного вида разворачивает или сворачивает группу"""
+        if self.view is None or event.button != 1 or event.dblclick:
+            return
+        if event.inaxes != self.ax or event.xdata is None:
+            return
+        node_id = Draw.node_at(self.positions, event.xdata, event.ydata)
+        if node_id is None:
+            return
+        group = self.view.group_at(node_id)
+        old_x, old_y = self.view.anchor(group, self.positions)
+        self.view.toggle(group)
+        plan = self.view.plan()
+        positions = Draw.layout_positions(plan, self.layout)
+        new_x, new_y = self.view.anchor(group, positions)
+        Draw.shift_view(self.ax, new_x - old_x, new_y - old_y)
+        self._render(plan, positions, keep_view=True)
+        self.canvas.draw_idle()
+
+
+def _remove(artists):
+    """Убирает с осей художников draw_building / draw_connection"""
+    for value in artists.values():
+        if isinstance(value, dict):
+            for artist in value.values():
+                artist.remove()
+        elif value is not None:
+            value.remove()
@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class _NullSpan:
+    """Пустой интервал: используется, когда профилирование выключено"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+# Текущий профилировщик у каждого потока (нет - профилирование выключено):
+# интервалы главного потока и прогрева не попадают в профиль фоновой задачи
+_state = threading.local()
+
+
+class Profiler:
+    """
+    Сбор вложенных интервалов времени и счетчиков.
+    Интервалы пишутся с потоком и глубиной вложенности,
+    экспортируются в формат Chrome trace (открывается и в speedscope).
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []      # (название, начало, конец, глубина, поток)
+        self.counters = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """Интервал времени с именем name"""
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            end = time.perf_counter()
+            self._local.depth = depth
+            with self._lock:
+                self.spans.append((name, start, end, depth, threading.get_ident()))
+
+    def record(self, name, start, end=None):
+        """Интервал, измеренный вручную (start и end - time.perf_counter())"""
+        if end is None:
+            end = time.perf_counter()
+        with self._lock:
+            self.spans.append((name, start, end, 0, threading.get_ident()))
+
+    def count(self, name, value=1):
+        """Увеличивает счетчик name"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def totals(self, depth=0):
+        """Суммарное время (секунды) интервалов заданной глубины по именам"""
+        result = {}
+        for name, start, end, span_depth, _ in self.spans:
+            if span_depth == depth:
+                result[name] = result.get(name, 0.0) + end - start
+        return result
+
+    def summary(self):
+        """Короткая строка: время этапов верхнего уровня и счетчики"""
+        parts = [f"{name} {seconds * 1000:.0f} мс" for name, seconds in self.totals().items()]
+        parts.extend(f"{name}: {value}" for name, value in self.counters.items())
+        return ' | '.join(parts)
+
+    def to_chrome_trace(self):
+        """События в формате Chrome trace (microseconds)"""
+        pid = os.getpid()
+        events = []
+        for name, start, end, _, thread in sorted(self.spans, key=lambda span: span[1]):
+            events.append({
+                'name': name,
+                'ph': 'X',
+                'ts': (start - self.origin) * 1e6,
+                'dur': (end - start) * 1e6,
+                'pid': pid,
+                'tid': thread
+            })
+        end_ts = max((end for _, _, end, _, _ in self.spans), default=self.origin)
+        for name, value in self.counters.items():
+            events.append({
+                'name': name,
+                'ph': 'C',
+                'ts': (end_ts - self.origin) * 1e6,
+                'pid': pid,
+                'args': {name: value}
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path):
+        """Сохраняет профиль в JSON (Chrome trace / speedscope)"""
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.to_chrome_trace(), file, ensure_ascii=False)
+
+
+def active():
+    """Профилировщик текущего потока или None"""
+    return getattr(_state, 'profiler', None)
+
+
+def span(name):
+    """Интервал текущего профилировщика; без профилировщика ничего не стоит"""
+    profiler = active()
+    if profiler is None:
+        return _NULL_SPAN
+    return profiler.span(name)
+
+
+def count(name, value=1):
+    """Счетчик текущего профилировщика"""
+    profiler = active()
+    if profiler is not None:
+        profiler.count(name, value)
+
+
+def enabled():
+    return active() is not None
+
+
+@contextmanager
+def profiling(profiler=None):
+    """Включает профилирование в текущем потоке на время блока, возвращает Profiler"""
+    previous = active()
+    _state.profiler = profiler or Profiler()
+    try:
+        yield _state.profiler
+    finally:
+        _state.profiler = previous
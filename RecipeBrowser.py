@@ -0,0 +1,210 @@
+import tkinter as tk
+from array import array
+from bisect import bisect_right
+
+
+# Высота строки списка в пикселях (у всех строк одна)
+ROW_HEIGHT = 24
+
+# Пауза после ввода, после которой выполняется поиск (мс)
+SEARCH_DELAY_MS = 120
+
+# Сколько вариантов показывает выпадающий список калькулятора
+COMBO_LIMIT = 50
+
+# Сколько рецептов перечислять в строке "Используется в"
+USED_IN_SHOWN = 8
+
+# Клавиши, на которые подсказки комбобокса не обновляются
+NAVIGATION_KEYS = {'Up', 'Down', 'Left', 'Right', 'Return', 'Escape', 'Tab', 'Home', 'End'}
+
+
+class RecipeBrowser(tk.Frame):
+    """
+    Список рецептов с поиском. Рисуются только видимые строки: пул текстов
+    холста переиспользуется при прокрутке, строки рецепта вычисляются по
+    номеру (смещения рецептов - префиксные суммы). Поиск по мере ввода идет
+    по Search.RecipeIndex; клик по рецепту или ингредиенту показывает,
+    где этот предмет используется.
+    """
+
+    def __init__(self, master, book, colors, fonts):
+        super().__init__(master, bg=colors['bg_main'])
+        self.recipes = book.recipes
+        self.index = book.index
+        self.colors = colors
+        self.fonts = fonts
+        self.names = []
+        self.offsets = array('l', [0])   # первая строка каждого рецепта + общее число строк
+        self.top = 0                     # прокрутка в пикселях
+        self.pool = []                   # тексты холста для видимых строк
+        self.pending = None
+
+        self.query = tk.StringVar()
+        entry = tk.Entry(
+            self,
+            textvariable=self.query,
+            font=fonts['normal'],
+            bg=colors['bg_secondary'],
+            fg=colors['text_primary'],
+            insertbackground=colors['text_primary'],
+            relief=tk.SUNKEN,
+            bd=2
+        )
+        entry.pack(fill=tk.X, padx=20, pady=(0, 5))
+        self.query.trace_add('write', lambda *args: self._schedule_search())
+
+        list_frame = tk.Frame(self, bg=colors['bg_secondary'])
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=20)
+        self.scrollbar = tk.Scrollbar(list_frame, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas = tk.Canvas(list_frame, bg=colors['bg_secondary'], highlightthickness=0)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.status = tk.Label(
+            self,
+            text='Клик по рецепту или ингредиенту - где используется',
+            font=fonts['small'],
+            bg=colors['bg_main'],
+            fg=colors['text_secondary'],
+            anchor='w',
+            justify=tk.LEFT,
+            wraplength=540
+        )
+        self.status.pack(fill=tk.X, padx=20, pady=5)
+
+        self.canvas.bind('<Configure>', lambda event: self._render())
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<MouseWheel>', lambda event: self._scroll_by(
+            -3 * ROW_HEIGHT if event.delta > 0 else 3 * ROW_HEIGHT))
+        self.canvas.bind('<Button-4>', lambda event: self._scroll_by(-3 * ROW_HEIGHT))
+        self.canvas.bind('<Button-5>', lambda event: self._scroll_by(3 * ROW_HEIGHT))
+        entry.focus_set()
+        self._show(self.index.names)
+
+    # --- Данные ---
+
+    def _show(self, names):
+        """Показывает рецепты names с начала списка"""
+        self.names = names
+        offsets = array('l', [0])
+        total = 0
+        for name in names:
+            total += self._row_count(name)
+            offsets.append(total)
+        self.offsets = offsets
+        self.top = 0
+        self._render()
+
+    def _row_count(self, name):
+        # Название, здание, выход, "Ингредиенты:", ингредиенты, пустая строка
+        return 5 + len(self.recipes[name]['ingredients'])
+
+    def _row(self, number):
+        """Строка списка: (текст, заголовок ли, предмет строки)"""
+        i = bisect_right(self.offsets, number) - 1
+        name = self.names[i]
+        recipe_data = self.recipes[name]
+        line = number - self.offsets[i]
+        if line == 0:
+            return f"📦 {name.upper()}", True, name
+        if line == 1:
+            return f"   Здание: {recipe_data['building']}", False, name
+        if line == 2:
+            return f"   Выход: {recipe_data['output']} шт.", False, name
+        if line == 3:
+            return "   Ингредиенты:", False, name
+        ingredients = recipe_data['ingredients']
+        if line - 4 < len(ingredients):
+            ingredient = list(ingredients)[line - 4]
+            return f"      • {ingredient}: {ingredients[ingredient]}", False, ingredient
+        return '', False, None
+
+    # --- Отрисовка ---
+
+    def _render(self):
+        """Перерисовывает видимые строки и ползунок"""
+        height = max(self.canvas.winfo_height(), 1)
+        total = self.offsets[-1] * ROW_HEIGHT
+        self.top = max(0, min(self.top, total - height))
+        first = self.top // ROW_HEIGHT
+        visible = height // ROW_HEIGHT + 2
+        while len(self.pool) < visible:
+            self.pool.append(self.canvas.create_text(10, 0, anchor='nw'))
+
+        for k, item in enumerate(self.pool):
+            number = first + k
+            if k >= visible or number >= self.offsets[-1]:
+                self.canvas.itemconfigure(item, state='hidden')
+                continue
+            text, is_title, _ = self._row(number)
+            self.canvas.itemconfigure(
+                item, text=text, state='normal',
+                font=self.fonts['heading'] if is_title else self.fonts['normal'],
+                fill=self.colors['text_primary'] if is_title else self.colors['text_secondary'])
+            self.canvas.coords(item, 10, number * ROW_HEIGHT - self.top + 2)
+
+        if total > 0:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + height) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _scroll_by(self, pixels):
+        self.top += pixels
+        self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        height = self.canvas.winfo_height()
+        if action == 'moveto':
+            self.top = int(float(amount) * self.offsets[-1] * ROW_HEIGHT)
+        elif unit == 'pages':
+            self.top += int(amount) * height
+        else:
+            self.top += int(amount) * ROW_HEIGHT
+        self._render()
+
+    # --- Поиск и "используется в" ---
+
+    def _schedule_search(self):
+        """Поиск после паузы во вводе (не на каждую клавишу)"""
+        if self.pending is not None:
+            self.after_cancel(self.pending)
+        self.pending = self.after(SEARCH_DELAY_MS, self._search)
+
+    def _search(self):
+        self.pending = None
+        self._show(self.index.search(self.query.get()))
+        self.status.config(text=f"Найдено рецептов: {len(self.names)}")
+
+    def _on_click(self, event):
+        number = (self.top + event.y) // ROW_HEIGHT
+        if number >= self.offsets[-1]:
+            return
+        _, _, item = self._row(number)
+        if item is None:
+            return
+        consumers = self.index.consumers(item)
+        if not consumers:
+            self.status.config(text=f"{item}: нигде не используется")
+            return
+        shown = ', '.join(consumers[:USED_IN_SHOWN])
+        if len(consumers) > USED_IN_SHOWN:
+            shown += f" и еще {len(consumers) - USED_IN_SHOWN}"
+        self.status.config(text=f"{item} используется в: {shown}")
+
+
+def attach_type_ahead(combo, get_index, limit=COMBO_LIMIT):
+    """
+    Подсказки при вводе в ttk.Combobox: список вариантов фильтруется
+    индексом get_index() (Search.RecipeIndex) по введенному тексту.
+    """
+    def on_key(event):
+        if event.keysym in NAVIGATION_KEYS:
+            return
+        try:
+            index = get_index()
+        except (OSError, ValueError):
+            return
+        combo['values'] = index.search(combo.get(), limit)
+
+    combo.bind('<KeyRelease>', on_key)
@@ -0,0 +1,505 @@
+import hashlib
+import json
+import marshal
+import os
+import struct
+import sys
+import threading
+from array import array
+
+import Profile
+import Search
+
+
+RECIPES_PATH = 'recipes.json'
+
+# Скомпилированная база: заголовок + секции (длина uint64 + данные)
+COMPILED_MAGIC = b'S2VG'
+COMPILED_VERSION = 1
+_HEADER = struct.Struct('<4sHHH32s')  # magic, версия, версия marshal, число секций, sha256
+_SECTION = struct.Struct('<Q')
+
+
+class RecipeBook:
+    """
+    База рецептов, загружаемая один раз.
+    Файл перечитывается только если изменились его mtime или размер.
+    Загрузка защищена блокировкой: базу можно прогревать в фоновом потоке.
+    """
+
+    def __init__(self, path=RECIPES_PATH, compiled=True):
+        self.path = path
+        # Рядом с JSON хранится скомпилированная база (None - не использовать)
+        self.compiled_path = compiled_path(path) if compiled else None
+        self._recipes = None
+        self._graph = None
+        self._stamp = None
+        self._index = None
+        self._capacity = None
+        self._lock = threading.RLock()
+
+    def _file_stamp(self):
+        """Возвращает (mtime, размер) файла рецептов"""
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self):
+        """
+        Принудительно перечитывает файл рецептов.
+        Если скомпилированная база свежая (совпадает хеш JSON), JSON не разбирается;
+        иначе база компилируется заново и сохраняется на диск.
+        """
+        with self._lock:
+            with Profile.span('рецепты'):
+                stamp = self._file_stamp()
+                with open(self.path, 'rb') as file:
+                    source = file.read()
+                digest = hashlib.sha256(source).digest()
+                
+                graph = None
+                if self.compiled_path:
+                    graph = load_compiled(self.compiled_path, digest)
+                if graph is None:
+                    graph = RecipeGraph.build(json.loads(source.decode('utf-8')), digest)
+                    if self.compiled_path:
+                        try:
+                            graph.save(self.compiled_path)
+                        except OSError:
+                            pass  # Нет прав на запись - просто работаем без кеша
+            
+            self._graph = graph
+            self._recipes = graph.recipes
+            self._stamp = stamp
+            return self._recipes
+
+    def is_stale(self):
+        """Проверяет, изменился ли файл с момента последней загрузки"""
+        return self._recipes is None or self._file_stamp() != self._stamp
+
+    @property
+    def recipes(self):
+        """Словарь рецептов (перезагружается при изменении файла)"""
+        with self._lock:
+            if self.is_stale():
+                self.reload()
+            return self._recipes
+    
+    @property
+    def graph(self):
+        """Скомпилированный граф рецептов (RecipeGraph)"""
+        with self._lock:
+            if self.is_stale():
+                self.reload()
+            return self._graph
+
+    @property
+    def index(self):
+        """Поисковый индекс Search.RecipeIndex (строится заново при изменении базы)"""
+        with self._lock:
+            recipes = self.recipes
+            if self._index is None or self._index[0] is not recipes:
+                self._index = (recipes, Search.RecipeIndex(recipes))
+            return self._index[1]
+
+    @property
+    def capacity(self):
+        """Обратный расчет Capacity.CapacityPlanner (строится заново при изменении базы)"""
+        import Capacity  # Capacity сам импортирует Recipes
+        with self._lock:
+            recipes = self.recipes
+            if self._capacity is None or self._capacity[0] is not recipes:
+                self._capacity = (recipes, Capacity.CapacityPlanner(recipes))
+            return self._capacity[1]
+
+    def __contains__(self, name):
+        return name in self.recipes
+
+    def __getitem__(self, name):
+        return self.recipes[name]
+
+    def __iter__(self):
+        return iter(self.recipes)
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def items(self):
+        return self.recipes.items()
+
+    def names(self):
+        """Список названий всех рецептов"""
+        return list(self.recipes)
+
+
+def recipe_outputs(name, recipe_data):
+    """
+    Выход рецепта за цикл: {предмет: количество}.
+    Рецепт с несколькими продуктами задает карту 'outputs' (побочные продукты),
+    основной предмет всегда производится в количестве 'output'.
+    """
+    outputs = dict(recipe_data.get('outputs', {}))
+    outputs[name] = recipe_data['output']
+    return outputs
+
+
+def find_cycles(recipes, names):
+    """
+    Ищет циклы между рецептами (сильно связные компоненты, алгоритм Тарьяна
+    без рекурсии). Возвращает список циклов - списков названий рецептов.
+    """
+    names = set(names)
+    index = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    cycles = []
+    counter = 0
+
+    for start in names:
+        if start in index:
+            continue
+        work = [(start, iter(recipes[start]['ingredients']))]
+        index[start] = lowlink[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in names:
+                    continue
+                if child not in index:
+                    index[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(recipes[child]['ingredients'])))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                if len(component) > 1 or node in recipes[node]['ingredients']:
+                    cycles.append(sorted(component))
+    return cycles
+
+
+class RecipeGraph:
+    """
+    Проверенный компактный граф рецептов.
+    Предметы пронумерованы: 0..R-1 - предметы с рецептом, дальше - базовые ресурсы.
+    Ингредиенты хранятся в формате CSR: ингредиенты рецепта i лежат в
+    ingredient_items[ingredient_start[i]:ingredient_start[i + 1]].
+    """
+
+    def __init__(self):
+        self.source_hash = b''
+        self.items = []
+        self.item_ids = {}
+        self.num_recipes = 0
+        self.building_names = []
+        self.recipe_building = array('i')
+        self.recipe_output = array('d')
+        self.ingredient_start = array('i', [0])
+        self.ingredient_items = array('i')
+        self.ingredient_amounts = array('d')
+        self.topological_order = array('i')  # потребители раньше ингредиентов
+        self.depth = array('i')              # самый длинный путь от конечного продукта
+        self.cycles = []                     # списки id предметов
+        self.missing = array('i')            # предметы без рецепта (базовые ресурсы)
+        self.recipes = {}
+
+    @classmethod
+    def build(cls, recipes, source_hash=b''):
+        """Проверяет словарь рецептов и строит по нему граф"""
+        problems = validate_recipes(recipes)
+        if problems:
+            raise ValueError("Ошибки в рецептах:\n" + '\n'.join(problems))
+
+        graph = cls()
+        graph.source_hash = source_hash
+        graph.recipes = recipes
+        graph.num_recipes = len(recipes)
+        for name in recipes:
+            graph._item_id(name)
+
+        building_codes = {}
+        for name, recipe_data in recipes.items():
+            building = recipe_data['building']
+            if building not in building_codes:
+                building_codes[building] = len(graph.building_names)
+                graph.building_names.append(building)
+            graph.recipe_building.append(building_codes[building])
+            graph.recipe_output.append(recipe_data['output'])
+            for ingredient, amount in recipe_data['ingredients'].items():
+                graph.ingredient_items.append(graph._item_id(ingredient))
+                graph.ingredient_amounts.append(amount)
+            graph.ingredient_start.append(len(graph.ingredient_items))
+
+        graph.missing = array('i', range(graph.num_recipes, len(graph.items)))
+        graph.cycles = [[graph.item_ids[name] for name in cycle]
+                        for cycle in find_cycles(recipes, recipes)]
+        graph._order_and_depth()
+        return graph
+
+    def _item_id(self, name):
+        item_id = self.item_ids.get(name)
+        if item_id is None:
+            item_id = len(self.items)
+            self.item_ids[name] = item_id
+            self.items.append(name)
+        return item_id
+
+    def _order_and_depth(self):
+        """Топологический порядок (алгоритм Кана) и глубина предметов"""
+        num_items = len(self.items)
+        consumers = array('i', bytes(4 * num_items))
+        for ingredient in self.ingredient_items:
+            consumers[ingredient] += 1
+        depth = array('i', bytes(4 * num_items))
+        ready = [i for i in range(num_items) if consumers[i] == 0]
+        order = array('i')
+        while ready:
+            item = ready.pop()
+            order.append(item)
+            for ingredient in self.ingredients(item):
+                depth[ingredient] = max(depth[ingredient], depth[item] + 1)
+                consumers[ingredient] -= 1
+                if consumers[ingredient] == 0:
+                    ready.append(ingredient)
+        # Предметы в циклах и под ними не упорядочены: глубина -1
+        for i in range(num_items):
+            if consumers[i] > 0:
+                depth[i] = -1
+        self.topological_order = order
+        self.depth = depth
+
+    def ingredients(self, item_id):
+        """id ингредиентов рецепта (пусто для базового ресурса)"""
+        if item_id >= self.num_recipes:
+            return ()
+        return self.ingredient_items[self.ingredient_start[item_id]:self.ingredient_start[item_id + 1]]
+
+    def diagnostics(self):
+        """Текстовый отчет о циклах и предметах без рецепта"""
+        lines = [f"Рецептов: {self.num_recipes}, предметов: {len(self.items)}"]
+        if self.missing:
+            names = ', '.join(self.items[i] for i in self.missing)
+            lines.append(f"Без рецепта (базовые ресурсы): {names}")
+        for cycle in self.cycles:
+            lines.append("Цикл: " + ', '.join(self.items[i] for i in cycle))
+        return '\n'.join(lines)
+
+    # --- Двоичный формат ---
+
+    def save(self, path):
+        """Записывает граф в версионированный двоичный файл"""
+        cycle_start = array('i', [0])
+        cycle_items = array('i')
+        for cycle in self.cycles:
+            cycle_items.extend(cycle)
+            cycle_start.append(len(cycle_items))
+        sections = [
+            '\0'.join(self.items).encode('utf-8'),
+            '\0'.join(self.building_names).encode('utf-8'),
+            _array_bytes(array('i', [self.num_recipes])),
+            _array_bytes(self.recipe_building),
+            _array_bytes(self.recipe_output),
+            _array_bytes(self.ingredient_start),
+            _array_bytes(self.ingredient_items),
+            _array_bytes(self.ingredient_amounts),
+            _array_bytes(self.topological_order),
+            _array_bytes(self.depth),
+            _array_bytes(cycle_start),
+            _array_bytes(cycle_items),
+            _array_bytes(self.missing),
+            marshal.dumps(self.recipes),
+        ]
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(_HEADER.pack(COMPILED_MAGIC, COMPILED_VERSION, marshal.version,
+                                    len(sections), self.source_hash))
+            for data in sections:
+                file.write(_SECTION.pack(len(data)))
+                file.write(data)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Читает граф из двоичного файла (ValueError при чужом формате)"""
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < _HEADER.size:
+            raise ValueError("Файл скомпилированной базы поврежден")
+        magic, version, marshal_version, count, source_hash = _HEADER.unpack_from(data)
+        if magic != COMPILED_MAGIC or version != COMPILED_VERSION or marshal_version != marshal.version:
+            raise ValueError("Неподдерживаемая версия скомпилированной базы")
+
+        sections = []
+        offset = _HEADER.size
+        for _ in range(count):
+            (length,) = _SECTION.unpack_from(data, offset)
+            offset += _SECTION.size
+            sections.append(data[offset:offset + length])
+            offset += length
+
+        graph = cls()
+        graph.source_hash = source_hash
+        graph.items = sections[0].decode('utf-8').split('\0') if sections[0] else []
+        graph.item_ids = {name: i for i, name in enumerate(graph.items)}
+        graph.building_names = sections[1].decode('utf-8').split('\0') if sections[1] else []
+        graph.num_recipes = _bytes_array('i', sections[2])[0]
+        graph.recipe_building = _bytes_array('i', sections[3])
+        graph.recipe_output = _bytes_array('d', sections[4])
+        graph.ingredient_start = _bytes_array('i', sections[5])
+        graph.ingredient_items = _bytes_array('i', sections[6])
+        graph.ingredient_amounts = _bytes_array('d', sections[7])
+        graph.topological_order = _bytes_array('i', sections[8])
+        graph.depth = _bytes_array('i', sections[9])
+        cycle_start = _bytes_array('i', sections[10])
+        cycle_items = _bytes_array('i', sections[11])
+        graph.cycles = [list(cycle_items[cycle_start[k]:cycle_start[k + 1]])
+                        for k in range(len(cycle_start) - 1)]
+        graph.missing = _bytes_array('i', sections[12])
+        graph.recipes = marshal.loads(sections[13])
+        return graph
+
+
+def validate_recipes(recipes):
+    """Проверяет структуру рецептов, возвращает список ошибок"""
+    problems = []
+    if not isinstance(recipes, dict):
+        return ["База рецептов должна быть объектом JSON"]
+    for name, recipe_data in recipes.items():
+        if not isinstance(recipe_data, dict):
+            problems.append(f"{name}: рецепт должен быть объектом")
+            continue
+        problems.extend(_validate_recipe(name, recipe_data))
+        alternates = recipe_data.get('alternates', [])
+        if not isinstance(alternates, list):
+            problems.append(f"{name}: 'alternates' должен быть списком")
+            continue
+        for alternate in alternates:
+            if not isinstance(alternate, dict) or not isinstance(alternate.get('name'), str):
+                problems.append(f"{name}: у альтернативного рецепта нет 'name'")
+                continue
+            problems.extend(_validate_recipe(f"{name} ({alternate['name']})", alternate))
+    return problems
+
+
+def _validate_recipe(name, recipe_data):
+    """Проверяет поля одного рецепта, возвращает список ошибок"""
+    problems = []
+    ingredients = recipe_data.get('ingredients')
+    if not isinstance(ingredients, dict):
+        problems.append(f"{name}: нет словаря 'ingredients'")
+    else:
+        for ingredient, amount in ingredients.items():
+            if not isinstance(amount, (int, float)) or amount <= 0:
+                problems.append(f"{name}: неверное количество '{ingredient}': {amount}")
+    output = recipe_data.get('output')
+    if not isinstance(output, (int, float)) or output <= 0:
+        problems.append(f"{name}: неверный выход 'output': {output}")
+    if not isinstance(recipe_data.get('building'), str):
+        problems.append(f"{name}: не указано здание 'building'")
+    if not isinstance(recipe_data.get('outputs', {}), dict):
+        problems.append(f"{name}: 'outputs' должен быть объектом")
+    return problems
+
+
+def compiled_path(path):
+    """Путь скомпилированной базы для файла рецептов"""
+    return os.path.splitext(path)[0] + '.s2vg'
+
+
+def load_compiled(path, source_hash):
+    """Загружает скомпилированную базу, если она есть и построена из того же JSON"""
+    try:
+        graph = RecipeGraph.load(path)
+    except (OSError, ValueError, EOFError, IndexError, struct.error):
+        return None
+    if graph.source_hash != source_hash:
+        return None
+    return graph
+
+
+def compile_recipes(path=RECIPES_PATH):
+    """Компилирует файл рецептов и сохраняет рядом, возвращает RecipeGraph"""
+    with open(path, 'rb') as file:
+        source = file.read()
+    graph = RecipeGraph.build(json.loads(source.decode('utf-8')),
+                              hashlib.sha256(source).digest())
+    graph.save(compiled_path(path))
+    return graph
+
+
+def _array_bytes(values):
+    """Содержимое массива в порядке байт little-endian"""
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _bytes_array(typecode, data):
+    """Массив из байт little-endian"""
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+# Общие экземпляры, по одному на файл
+_books = {}
+
+
+def get_recipe_book(path=RECIPES_PATH):
+    """Возвращает общий RecipeBook для указанного файла"""
+    key = os.path.abspath(path)
+    book = _books.get(key)
+    if book is None:
+        book = RecipeBook(path)
+        _books[key] = book
+    return book
+
+
+def as_dict(recipes=None):
+    """Словарь рецептов из RecipeBook, пути к файлу или готового словаря"""
+    if isinstance(recipes, dict):
+        return recipes
+    return resolve(recipes).recipes
+
+
+def resolve(recipes=None):
+    """
+    Приводит источник рецептов к RecipeBook.
+    Принимает RecipeBook, путь к файлу или None (файл по умолчанию).
+    """
+    if recipes is None:
+        return get_recipe_book()
+    if isinstance(recipes, RecipeBook):
+        return recipes
+    return get_recipe_book(recipes)
+
+
+# Компиляция базы: python Recipes.py [recipes.json]
+if __name__ == '__main__':
+    source_path = sys.argv[1] if len(sys.argv) > 1 else RECIPES_PATH
+    compiled = compile_recipes(source_path)
+    print(f"Сохранено: {compiled_path(source_path)}")
+    print(compiled.diagnostics())
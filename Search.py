@@ -0,0 +1,112 @@
+from bisect import bisect_left
+
+
+# Подстроки ищутся по триграммам: запрос короче ищется по началам слов
+NGRAM = 3
+
+
+class RecipeIndex:
+    """
+    Поисковый индекс базы рецептов, строится один раз на версию базы.
+    Ищет по названиям предметов, ингредиентам (и у альтернативных рецептов)
+    и типам зданий: по началу слова и по подстроке. Обратный индекс
+    used_in отвечает, в каких рецептах предмет используется.
+    """
+
+    def __init__(self, recipes):
+        self.names = sorted(recipes)
+        self.rank = {name: i for i, name in enumerate(self.names)}
+        self.used_in = {}        # ингредиент -> рецепты, где он нужен (по алфавиту)
+        texts = []               # на рецепт: [(текст в нижнем регистре, вес поля)]
+        for name in self.names:
+            recipe_data = recipes[name]
+            fields = [(name.lower(), 0)]
+            buildings = {recipe_data.get('building', '')}
+            ingredients = set(recipe_data['ingredients'])
+            for alternate in recipe_data.get('alternates', ()):
+                buildings.add(alternate.get('building', ''))
+                ingredients.update(alternate['ingredients'])
+            for ingredient in ingredients:
+                self.used_in.setdefault(ingredient, []).append(name)
+                fields.append((ingredient.lower(), 1))
+            for building in buildings:
+                if building:
+                    fields.append((building.lower(), 2))
+            texts.append(fields)
+        for consumers in self.used_in.values():
+            consumers.sort(key=self.rank.__getitem__)
+
+        # Начала слов: отсортированный список (слово, вес поля, номер рецепта)
+        self.words = sorted({(word, weight, i)
+                             for i, fields in enumerate(texts)
+                             for text, weight in fields
+                             for word in text.split()})
+        self.word_keys = [word for word, _, _ in self.words]
+
+        # Подстроки: триграмма -> номера рецептов; поля для проверки совпадения
+        self.ngrams = {}
+        for i, fields in enumerate(texts):
+            for text, _ in fields:
+                for start in range(len(text) - NGRAM + 1):
+                    self.ngrams.setdefault(text[start:start + NGRAM], set()).add(i)
+        self.texts = texts
+
+    def search(self, query, limit=None):
+        """
+        Рецепты по запросу (без учета регистра). Порядок: совпадение названия,
+        начало названия, начало слова в названии, подстрока названия, затем
+        совпадения в ингредиентах и типе здания; внутри - по алфавиту.
+        Пустой запрос - все рецепты.
+        """
+        query = ' '.join(query.lower().split())
+        if not query:
+            return self.names[:limit] if limit else list(self.names)
+        found = {}   # номер рецепта -> ключ сортировки
+        for i in self._candidates(query):
+            best = None
+            for text, weight in self.texts[i]:
+                position = text.find(query)
+                if position < 0:
+                    continue
+                if text == query:
+                    score = 0
+                elif position == 0:
+                    score = 1
+                elif text[position - 1] == ' ':
+                    score = 2
+                else:
+                    score = 3
+                score += 4 * weight
+                if best is None or score < best:
+                    best = score
+            if best is not None:
+                found[i] = best
+        ranked = sorted(found, key=lambda i: (found[i], i))
+        if limit:
+            ranked = ranked[:limit]
+        return [self.names[i] for i in ranked]
+
+    def _candidates(self, query):
+        """Номера рецептов, которые могут подойти (проверяются в search)"""
+        if len(query) >= NGRAM:
+            result = None
+            for start in range(len(query) - NGRAM + 1):
+                ids = self.ngrams.get(query[start:start + NGRAM])
+                if not ids:
+                    return set()
+                result = set(ids) if result is None else result & ids
+                if not result:
+                    break
+            return result
+        # Короткий запрос: начала слов (по отсортированному списку)
+        first = query.split()[0]
+        result = set()
+        index = bisect_left(self.word_keys, first)
+        while index < len(self.words) and self.word_keys[index].startswith(first):
+            result.add(self.words[index][2])
+            index += 1
+        return result
+
+    def consumers(self, item):
+        """Рецепты, в которых предмет item - ингредиент"""
+        return self.used_in.get(item, [])
@@ -0,0 +1,63 @@
+# Цвета и подписи чертежа. Модуль без matplotlib: его используют и Draw,
+# и экспорт в SVG/PNG (Export), которому pyplot не нужен.
+
+# Цвета для разных типов зданий
+BUILDING_COLORS = {
+    'Assembler': '#3498DB',      # Синий
+    'Constructor': '#27AE60',    # Зеленый
+    'Smelter': '#E67E22',        # Оранжевый
+    'Источник': '#95A5A6',       # Серый
+    'Miner': '#95A5A6',          # Серый
+    'default': '#9B59B6'         # Фиолетовый
+}
+
+# Темная тема (более контрастная)
+COLORS = {
+    'bg': '#0f0f1a',
+    'text': '#ffffff',           # Чистый белый для лучшей читаемости
+    'text_dark': '#1a1a2e',      # Темный текст для обводки
+    'grid': '#16213e',
+    'accent': '#ff6b6b'          # Более яркий акцент
+}
+
+
+def plan_title(production_data):
+    """Заголовок чертежа: цели плана и выход в минуту"""
+    targets = production_data.get('targets')
+    if targets and len(targets) > 1:
+        return "Производство: " + ', '.join(f"{name} ({rate}/мин)" for name, rate in targets.items())
+    return f"Производство: {production_data['target_recipe']} ({production_data['target_output']}/мин)"
+
+
+def truncate_text(text, max_chars):
+    """Сокращает текст до максимальной длины"""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars-2] + '..'
+
+
+def wrap_text(text, max_chars_per_line):
+    """Разбивает текст на строки"""
+    if len(text) <= max_chars_per_line:
+        return text
+    
+    words = text.split()
+    lines = []
+    current_line = ""
+    
+    for word in words:
+        if len(current_line) + len(word) + 1 <= max_chars_per_line:
+            current_line += (" " + word) if current_line else word
+        else:
+            if current_line:
+                lines.append(current_line)
+            current_line = word
+    
+    if current_line:
+        lines.append(current_line)
+    
+    # Максимум 2 строки
+    if len(lines) > 2:
+        lines = [lines[0], truncate_text(' '.join(lines[1:]), max_chars_per_line)]
+    
+    return '\n'.join(lines)
@@ -0,0 +1,109 @@
+import threading
+
+
+class Cancelled(Exception):
+    """Задача отменена (выбрасывается из Job.check)"""
+
+
+class Job:
+    """
+    Задача фонового потока. Функция задачи получает сам Job и отмечает этапы
+    через job.set_stage(...): заодно проверяется отмена.
+    Поля done, result, error и stage читаются из главного потока (опросом).
+    """
+
+    def __init__(self, key, func):
+        self.key = key
+        self.func = func
+        self.stage = 'в очереди'
+        self.done = False
+        self.result = None
+        self.error = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        """Прерывает задачу, если она отменена"""
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+    def set_stage(self, stage):
+        self.check()
+        self.stage = stage
+
+
+class Worker:
+    """
+    Один фоновый поток для расчетов. Задачи выполняются по очереди, но ждет
+    не больше одной: новая задача отменяет текущую и заменяет ожидающую.
+    Повторная отправка той же задачи (тот же key) возвращает уже запущенную.
+    Отмена кооперативная: текущий этап дорабатывает, результат отбрасывается.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._current = None
+        self._pending = None
+        self._thread = None
+
+    def submit(self, key, func):
+        """Ставит func(job) в очередь, возвращает Job"""
+        with self._cond:
+            for job in (self._pending, self._current):
+                if job is not None and job.key == key and not job.done and not job.cancelled:
+                    return job
+            if self._current is not None:
+                self._current.cancel()
+            if self._pending is not None:
+                self._finish(self._pending, cancelled=True)
+            job = Job(key, func)
+            self._pending = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return job
+
+    def cancel(self):
+        """Отменяет текущую и ожидающую задачи"""
+        with self._cond:
+            if self._current is not None:
+                self._current.cancel()
+            if self._pending is not None:
+                self._finish(self._pending, cancelled=True)
+                self._pending = None
+
+    @property
+    def busy(self):
+        return self._current is not None or self._pending is not None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                job = self._current = self._pending
+                self._pending = None
+            try:
+                job.check()
+                job.result = job.func(job)
+            except Cancelled:
+                pass
+            except Exception as e:
+                job.error = e
+            with self._cond:
+                self._current = None
+                self._finish(job)
+
+    @staticmethod
+    def _finish(job, cancelled=False):
+        if cancelled:
+            job.cancel()
+        job.stage = 'отменено' if job.cancelled else 'готово'
+        job.done = True